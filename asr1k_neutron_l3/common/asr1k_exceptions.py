@@ -98,6 +98,19 @@ class EntityNotEmptyException(ReQueueException):
     message = "The config for entity %(entity_name)s is not empty and cannot be deleted without side effects"
 
 
+class ChangeSetRolledBackException(ReQueueException):
+    message = ("%(operation)s for model %(entity_name)s on device %(host)s was rolled back, as another edit of "
+               "the same changeset failed: %(cause)s")
+
+
+class DeviceOverloadedException(ReQueueException):
+    message = "Device %(host)s is overloaded, request was not sent: %(reason)s"
+
+
+class DevicePipelineTimeout(ReQueueException):
+    message = "Update of router %(router_id)s did not finish on device %(host)s within %(timeout)ss"
+
+
 class MissingParentException(ReQueueException):
     message = "The parent config for entity %(entity_name)s is missing, cannot create %(entity_name)s"
 
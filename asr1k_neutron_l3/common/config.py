@@ -37,6 +37,15 @@ ASR1K_OPTS = [
     cfg.BoolOpt('init_mode', default=False, help=_("Activate initialization mode")),
     cfg.BoolOpt('save_config', default=True, help=_("Periodically sasve configuration")),
     cfg.IntOpt('connection_max_age', default=(3600), help=('')),
+    cfg.IntOpt('connection_keepalive_interval', default=30,
+               help=_("Send a keepalive request on an idle pooled connection if the device did not answer any "
+                      "request for this many seconds. Device liveness is derived from these answers")),
+    cfg.FloatOpt('connection_max_age_jitter', default=0.2,
+                 help=_("Randomize the lifetime of each pooled connection by this fraction of connection_max_age, "
+                        "so the connections of a pool are not all renewed at the same time")),
+    cfg.IntOpt('connection_check_interval', default=10,
+               help=_("Interval in seconds in which dead and aged pooled connections are replaced in the "
+                      "background")),
     cfg.BoolOpt('clean_orphans', default=True, help=_("Activate regular orphan cleanup")),
 
     cfg.IntOpt('clean_orphan_interval', default=(120), help=_("Interval for regular orphan cleanup")),
@@ -52,6 +61,49 @@ ASR1K_OPTS = [
                      "is present."),
     cfg.BoolOpt('ignore_router_network_az_hint_mismatch', default=False,
                 help="Do not abort operation if router and network AZ hint do not match."),
+    cfg.BoolOpt('use_candidate_datastore', default=False,
+                help=_("Apply the edits of a router update via the candidate datastore (lock, edit-config, "
+                       "validate, commit) if the device supports it. Single edits outside of a router update still "
+                       "go to running if the device allows it. Needs the candidate datastore to be enabled on the "
+                       "device.")),
+    cfg.IntOpt('channels_per_transport', default=1,
+               help=_("Number of pooled NETCONF sessions opened as channels on one SSH connection to the device. "
+                      "Larger values need fewer SSH sessions on the device and reconnects only open a channel")),
+    cfg.IntOpt('max_inflight_rpcs', default=0,
+               help=_("Number of RPCs sent pipelined on one NETCONF session without waiting for the reply. Reads "
+                      "and edits outside of candidate transactions then share the sessions instead of checking one "
+                      "out of the pool. 0 disables pipelining")),
+    cfg.FloatOpt('connection_pool_acquire_timeout', default=2.5,
+                 help=_("Seconds to wait for a pooled connection to be returned before giving up. Waiters are "
+                        "served by priority, RPC updates before periodic sync, and in arrival order. 0 waits "
+                        "without limit")),
+    cfg.IntOpt('circuit_breaker_failure_threshold', default=5,
+               help=_("Open the circuit breaker of a device after this many overload signals in a row (timeouts, "
+                      "sync in progress, config locks). Requests then wait instead of retrying. 0 disables the "
+                      "circuit breaker")),
+    cfg.IntOpt('circuit_breaker_open_time', default=30,
+               help=_("Seconds an open circuit breaker waits before it lets a trial request through")),
+    cfg.IntOpt('adaptive_concurrency_limit', default=0,
+               help=_("Upper bound of the adaptive (AIMD) limit of concurrent requests per device. The limit is "
+                      "halved on overload signals or slow replies and grows back slowly. 0 disables the limit")),
+    cfg.FloatOpt('adaptive_concurrency_target_latency', default=2.0,
+                 help=_("Replies slower than this many seconds reduce the adaptive concurrency limit")),
+    cfg.FloatOpt('device_overload_wait_timeout', default=60,
+                 help=_("Seconds a request waits for an overloaded device before the router update is requeued. "
+                        "0 waits without limit")),
+    cfg.IntOpt('confirmed_commit_timeout', default=0,
+               help=_("Commit candidate changes as confirmed-commit with this timeout in seconds, the device rolls "
+                      "back by itself if the confirming commit does not arrive. 0 disables confirmed-commit")),
+    cfg.BoolOpt('config_change_notifications', default=False,
+                help=_("Subscribe to netconf-config-change notifications of each device on a session of its own "
+                       "and invalidate the cached device state affected by changes of others")),
+    cfg.IntOpt('device_state_cache_ttl', default=0,
+               help=_("Seconds the state of a successfully written entity is trusted, validating the entity within "
+                      "this time diffs against the cache instead of the device. 0 disables the cache")),
+    cfg.IntOpt('device_state_cache_size', default=10000,
+               help=_("Maximum number of entities kept in the device state cache")),
+    cfg.BoolOpt('xmltodict_reply_parser', default=False,
+                help=_("Parse device replies with xmltodict instead of lxml, the parser used before lxml")),
 ]
 
 ASR1K_L3_OPTS = [
@@ -65,12 +117,21 @@ ASR1K_L3_OPTS = [
                help=_("Maximum size of RouterProcessingQueue for syncing routers. The driver will queue router updates "
                       "until sync_chunk_size is hit AND there are more than sync_until_queue_size entires in the "
                       "processing queue.")),
+    cfg.DictOpt('queue_lane_weights', default={'rpc': 8, 'requeue': 4, 'sync': 2, 'cleanup': 1},
+                help=_("Weights of the lanes of the RouterProcessingQueue: rpc notifications, requeued routers, the "
+                       "periodic sync and deletions found by it. While several lanes have routers waiting, each gets "
+                       "a share of the workers by its weight.")),
+    cfg.IntOpt('queue_lane_max_wait', default=300,
+               help=_("Seconds after which the oldest router of a lane of the RouterProcessingQueue is processed "
+                      "before all others, regardless of the lane weights")),
     cfg.IntOpt('queue_timeout', default=60,
                help=_("Timeout for blocking of get on queue, waiting for item to puched onto queue")),
     cfg.IntOpt('update_timeout', default=120, help=_("Timeout for for one process routers update iteration")),
     cfg.IntOpt('threadpool_maxsize', default=5,
                help=_("Size of thread pool used in router updates, needs to be "
                       "balanced against ASR SSH connection limits")),
+    cfg.IntOpt('worker_drain_timeout', default=60,
+               help=_("Seconds the router workers get on shutdown to finish the routers they are working on")),
     cfg.IntOpt('clean_delta', default=(30), help=('')),
     cfg.IntOpt('max_config_save_interval', default=900,
                help=_('Maximum interval in which the device config should be saved. Only triggers if a complete '
@@ -92,6 +153,30 @@ ASR1K_L3_OPTS = [
     cfg.BoolOpt('enable_fwaas_cleaning', default=True, help="Run FWaaS cleaning sync to remove stale FWaaS ACLs, "
                                                             "Class Maps and Service Policies"),
     cfg.IntOpt('fwaas_cleaning_interval', default=300, help="Interval for FWaaS cleaning"),
+    cfg.BoolOpt('batch_router_edits', default=False,
+                help=_("Collect all edits of a router update and send them as one consolidated edit-config per "
+                       "device. If the consolidated edit fails the edits are replayed one by one.")),
+    cfg.FloatOpt('write_coalesce_window', default=0,
+                 help=_("Seconds the consolidated edits of concurrent router updates are collected per device and "
+                        "sent as one write. Needs batch_router_edits. 0 sends every router on its own")),
+    cfg.IntOpt('write_coalesce_max_bytes', default=262144,
+               help=_("Send a coalesced write before the window is over once its payload reaches this size")),
+    cfg.IntOpt('unchanged_router_skip_time', default=0,
+               help=_("Skip sync updates of routers whose desired state and devices did not change since their "
+                      "last successful update, but validate them at least once in this many seconds. "
+                      "0 always validates")),
+    cfg.BoolOpt('sync_config_snapshot', default=False,
+                help=_("Fetch the running config of each device once per sync cycle and compare the routers of "
+                       "the sync task against it instead of reading every entity from the device")),
+    cfg.BoolOpt('pipeline_device_updates', default=False,
+                help=_("Apply a router update on each device of the pair independently, instead of every entity "
+                       "on both devices before the next one, so a slow device only delays its own convergence")),
+    cfg.IntOpt('device_pipeline_timeout', default=120,
+               help=_("Seconds a router update waits for its device pipelines. A pipeline still running after "
+                      "that goes on in the background and the router is requeued. 0 waits without limit")),
+    cfg.BoolOpt('combined_router_get', default=False,
+                help=_("Read all entities of a router from a device with one get of their merged subtree filters "
+                       "instead of one get per entity")),
 ]
 
 ASR1K_L2_OPTS = [
@@ -0,0 +1,53 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Greenlet local values that follow an operation across execute_on_pair
+
+Values bound here are visible to the current greenlet only. execute_on_pair
+takes a copy of the bindings of the calling greenlet and re-binds them in the
+greenlets it spawns per device, so e.g. a router changeset is still found by
+the entities updated on behalf of that router.
+"""
+
+import contextlib
+
+from eventlet import corolocal
+
+_local = corolocal.local()
+
+
+def _values():
+    return getattr(_local, 'values', {})
+
+
+def get(key, default=None):
+    return _values().get(key, default)
+
+
+def current():
+    return dict(_values())
+
+
+@contextlib.contextmanager
+def bind(**kwargs):
+    previous = _values()
+    values = dict(previous)
+    values.update(kwargs)
+    _local.values = values
+    try:
+        yield
+    finally:
+        _local.values = previous
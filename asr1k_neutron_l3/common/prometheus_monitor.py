@@ -32,14 +32,19 @@ LOG = logging.getLogger(__name__)
 
 ACTION_BUCKETS = (1.0, 2.0, 3.0, 4.0, 5.0, 8.0, 10.0, 15.0, 20.0, 25.0, 30.0, 40., 60.0, float("inf"))
 OPERATION_BUCKETS = (0.1, 0.3, 0.5, 0.7, 1.0, 2.0, 3.0, 4.0, 5.0, 8.0, 10.0, 15.0, float("inf"))
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
 
 ORPHANS_LABELS = ['host', 'device']
 CONNECTION_POOL_LABELS = ['host', 'device']
+CONNECTION_POOL_WAIT_LABELS = ['host', 'device', 'priority']
 DETAIL_LABELS = ['host', 'device', 'entity', 'action']
 BASIC_LABELS = ['host']
 STATS_LABELS = ['host', 'status']
 DEVICE_ENTITY_COUNT_LABELS = ['host', 'device', 'entity']
 FIP_ON_WRONG_MAC_COUNT_LABELS = ['host', 'device', 'vrf']
+CACHE_LABELS = ['host', 'device', 'entity', 'result']
+WORKER_LABELS = ['host', 'priority']
+LANE_LABELS = ['host', 'lane']
 
 L2 = "l2"
 L3 = "l3"
@@ -77,6 +82,20 @@ class PrometheusMonitor(object):
                                         DETAIL_LABELS, namespace=self.namespace)
         self._connection_pool_exhausted = Counter('connection_pool_exhausted', 'Connnection pool  exhausted',
                                                   CONNECTION_POOL_LABELS, namespace=self.namespace)
+        self._connection_pool_wait_duration = Histogram("connection_pool_wait_duration",
+                                                        "Time spent waiting for a pooled connection",
+                                                        CONNECTION_POOL_WAIT_LABELS, namespace=self.namespace,
+                                                        buckets=WAIT_BUCKETS)
+
+        self._circuit_breaker_state = Gauge('circuit_breaker_state',
+                                            'Circuit breaker state of the device, 0 closed, 1 half-open, 2 open',
+                                            CONNECTION_POOL_LABELS, namespace=self.namespace)
+        self._concurrency_limit = Gauge('concurrency_limit', 'Adaptive limit of concurrent requests to the device',
+                                        CONNECTION_POOL_LABELS, namespace=self.namespace)
+
+        self._device_state_cache = Counter('device_state_cache',
+                                           'Entity validations served from (hit) or missing (miss) the device state '
+                                           'cache', CACHE_LABELS, namespace=self.namespace)
 
         self._yang_operation_duration = Histogram("yang_operation_duration", "Individual entity operation",
                                                   DETAIL_LABELS, namespace=self.namespace, buckets=OPERATION_BUCKETS)
@@ -110,6 +129,38 @@ class PrometheusMonitor(object):
             self._gateways = Gauge('gateways', 'Number of managed gateways', STATS_LABELS, namespace=self.namespace)
             self._floating_ips = Gauge('floating_ips', 'Number of managed floating_ips',
                                        STATS_LABELS, namespace=self.namespace)
+            self._changeset_fallbacks = Counter('changeset_fallbacks',
+                                                'Number of consolidated router edits replayed entity by entity',
+                                                CONNECTION_POOL_LABELS, namespace=self.namespace)
+            self._unchanged_router_skips = Counter('unchanged_router_skips',
+                                                   'Number of sync updates skipped for unchanged routers',
+                                                   BASIC_LABELS, namespace=self.namespace)
+            self._coalesced_router_updates = Counter('coalesced_router_updates',
+                                                     'Number of router updates merged into a pending update of the '
+                                                     'same router', BASIC_LABELS, namespace=self.namespace)
+            self._router_workers = Gauge('router_workers', 'Number of router processing workers',
+                                         BASIC_LABELS, namespace=self.namespace)
+            self._busy_router_workers = Gauge('busy_router_workers',
+                                              'Number of router processing workers busy with an update',
+                                              WORKER_LABELS, namespace=self.namespace)
+            self._router_queue_wait_duration = Histogram('router_queue_wait_duration',
+                                                         'Time a router update waited in the processing queue',
+                                                         WORKER_LABELS, namespace=self.namespace,
+                                                         buckets=ACTION_BUCKETS)
+            self._router_lane_depth = Gauge('router_lane_depth', 'Number of routers waiting in a lane of the '
+                                            'processing queue', LANE_LABELS, namespace=self.namespace)
+            self._router_lane_wait_duration = Histogram('router_lane_wait_duration',
+                                                        'Time a router waited in a lane of the processing queue',
+                                                        LANE_LABELS, namespace=self.namespace,
+                                                        buckets=ACTION_BUCKETS)
+            self._router_processing_duration = Histogram('router_processing_duration',
+                                                         'Time a worker spent on a router update',
+                                                         WORKER_LABELS, namespace=self.namespace,
+                                                         buckets=ACTION_BUCKETS)
+            self._config_snapshot_reads = Counter('config_snapshot_reads',
+                                                  'Entity reads served from (hit) or bypassing (miss) the '
+                                                  'config snapshot of the sync cycle',
+                                                  CACHE_LABELS, namespace=self.namespace)
             self.fwaas_cleaner_duration = Histogram("fwaas_cleaner_duration", "FWaaS cleaner runtime in seconds",
                                                   namespace=self.namespace, buckets=ACTION_BUCKETS)
         elif self.type == L2:
@@ -22,6 +22,7 @@ from oslo_config import cfg
 from asr1k_neutron_l3.common import config as asr1k_config
 from asr1k_neutron_l3.common.asr1k_exceptions import VersionInfoNotAvailable
 from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.netconf_yang.state_cache import DeviceStateCache
 
 LOG = logging.getLogger(__name__)
 
@@ -51,6 +52,8 @@ class FakeASR1KContext(ASR1KContextBase):
         self.version_min_17_13 = version_min_17_13
         self.version_min_17_15 = version_min_17_15
         self._has_stateless_nat = has_stateless_nat
+        self.use_candidate = False
+        self.has_confirmed_commit = False
 
     @property
     def has_stateless_nat(self):
@@ -63,6 +66,8 @@ class ASR1KContext(ASR1KContextBase):
     version_min_17_13 = property(lambda self: self._get_version_attr('_version_min_17_13'))
     version_min_17_15 = property(lambda self: self._get_version_attr('_version_min_17_15'))
     has_stateless_nat = property(lambda self: self._get_version_attr('_has_stateless_nat'))
+    use_candidate = property(lambda self: self._get_version_attr('_use_candidate'))
+    has_confirmed_commit = property(lambda self: self._get_version_attr('_has_confirmed_commit'))
 
     def __init__(self, name, host, yang_port, nc_timeout, username, password, use_bdvif, insecure=True,
                  force_bdi=False, headers={}):
@@ -114,6 +119,12 @@ class ASR1KContext(ASR1KContextBase):
             self._version_min_17_15 = ver >= (17, 15)
             self._has_stateless_nat = ver >= (17, 4)
 
+            self._use_candidate = cfg.CONF.asr1k.use_candidate_datastore and connection.has_capability(':candidate')
+            if cfg.CONF.asr1k.use_candidate_datastore and not self._use_candidate:
+                LOG.warning("Candidate datastore is enabled, but host %s does not support it, "
+                            "falling back to running", self.host)
+            self._has_confirmed_commit = connection.has_capability(':confirmed-commit')
+
         self._got_version_info = True
 
     def _get_version_attr(self, attr_name):
@@ -143,6 +154,7 @@ class ASR1KContext(ASR1KContextBase):
         if not alive:
             LOG.debug("Device %s marked as dead, resetting version info", self.host)
             self._got_version_info = False
+            DeviceStateCache().flush(self.host)
         self.alive = alive
 
 
@@ -159,6 +171,7 @@ class ASR1KPair(object):
     def __setup(self):
         self.config = cfg.CONF
         self.contexts = []
+        xml_utils.XMLUtils.lxml_parser = not cfg.CONF.asr1k.xmltodict_reply_parser
 
         device_config = asr1k_config.create_device_pair_dictionary()
 
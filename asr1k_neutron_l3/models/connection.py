@@ -19,8 +19,15 @@ if not os.environ.get('DISABLE_EVENTLET_PATCHING'):
     import eventlet
     eventlet.monkey_patch()
 
+import collections
 import datetime
-from retrying import retry
+import eventlet
+import heapq
+import itertools
+import random
+from eventlet import event
+from eventlet import semaphore
+from eventlet import timeout as eventlet_timeout
 from six.moves import urllib
 import socket
 import time
@@ -30,7 +37,10 @@ from threading import Lock
 from asr1k_neutron_l3.models.asr1k_pair import ASR1KPair
 from asr1k_neutron_l3.common.asr1k_exceptions import DeviceUnreachable, CapabilityNotFoundException
 from asr1k_neutron_l3.common import asr1k_constants
+from asr1k_neutron_l3.common import local_context
 from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
+from asr1k_neutron_l3.models.device_guard import DeviceGuard
+from asr1k_neutron_l3.models.ssh_transport import SharedSSHTransport
 
 from ncclient import manager
 from ncclient.xml_ import to_ele, new_ele, to_xml
@@ -41,15 +51,22 @@ from oslo_service import loopingcall
 import paramiko
 from ncclient.operations.errors import TimeoutExpiredError
 from ncclient.operations import util
+from ncclient.operations.rpc import RPCError
 from ncclient.transport.errors import SSHError
 from ncclient.transport.errors import SessionCloseError
 from ncclient.transport.errors import TransportError
 
 LOG = logging.getLogger(__name__)
 
+# Same scale as the neutron router processing queue (PRIORITY_RPC, PRIORITY_SYNC_ROUTERS_TASK of
+# neutron.agent.l3.agent), lower is more urgent. Callers that do not bind a priority in the local
+# context, like syncs and the device cleaner, are served like the periodic sync, behind RPC updates.
+PRIORITY_RPC = 1
+PRIORITY_SYNC_ROUTERS_TASK = 2
+DEFAULT_PRIORITY = PRIORITY_SYNC_ROUTERS_TASK
 
-def _retry_if_exhausted(exception):
-    return isinstance(exception, ConnectionPoolExhausted)
+# cheap request to keep idle sessions and the device liveness up to date
+KEEPALIVE_XPATH = "native/hostname"
 
 
 def ssh_connect(context):
@@ -73,8 +90,12 @@ def ssh_connect(context):
 
 
 def check_devices(device_info):
+    liveness = DeviceLiveness()
     for context in ASR1KPair().contexts:
-        device_reachable = ssh_connect(context)
+        device_reachable = liveness.is_reachable(context.host)
+        if device_reachable is None:
+            # nothing known from pooled sessions yet, e.g. pool not in use in init mode
+            device_reachable = ssh_connect(context)
         info = device_info.get(context.host, None)
 
         admin_up = True
@@ -88,6 +109,63 @@ def check_devices(device_info):
                   "".format(context.host, device_reachable, admin_up, "alive" if alive else "dead"))
 
 
+class DeviceState(object):
+    def __init__(self):
+        self.reachable = True
+        self.failures = 0
+        self.last_seen = 0
+
+
+class DeviceLiveness(object):
+    """Reachability of the devices as seen by the RPCs on the pooled sessions
+
+    Every RPC outcome is recorded here, any reply (including rpc-errors) counts as success,
+    transport errors and timeouts as failure. A device becomes unreachable after
+    FAILURE_THRESHOLD failures in a row or a failed connect. Idle devices are kept up to date by
+    the keepalive of the connection pool, so check_devices() does not need to open sockets.
+    """
+    __instance = None
+
+    FAILURE_THRESHOLD = 3
+
+    def __new__(cls):
+        if DeviceLiveness.__instance is None:
+            DeviceLiveness.__instance = object.__new__(cls)
+            DeviceLiveness.__instance.devices = {}
+
+        return DeviceLiveness.__instance
+
+    def _state(self, host):
+        return self.devices.setdefault(host, DeviceState())
+
+    def record_success(self, host):
+        state = self._state(host)
+        if not state.reachable:
+            LOG.info("Device %s answers NETCONF requests again", host)
+        state.reachable = True
+        state.failures = 0
+        state.last_seen = time.time()
+
+    def record_failure(self, host, fatal=False):
+        state = self._state(host)
+        state.failures += 1
+        if state.reachable and (fatal or state.failures >= self.FAILURE_THRESHOLD):
+            LOG.warning("Device %s considered unreachable after %s failed NETCONF requests", host, state.failures)
+            state.reachable = False
+
+    def is_reachable(self, host):
+        state = self.devices.get(host)
+        if state is None:
+            return None
+        return state.reachable
+
+    def idle_time(self, host):
+        state = self.devices.get(host)
+        if state is None:
+            return None
+        return time.time() - state.last_seen
+
+
 class ConnectionPoolExhausted(Exception):
     pass
 
@@ -96,16 +174,127 @@ class ConnectionPoolNotInitialized(Exception):
     pass
 
 
+class CandidateEditFailed(Exception):
+    """An edit of a candidate transaction was rejected, the candidate has been discarded"""
+
+    def __init__(self, index, error):
+        super(CandidateEditFailed, self).__init__(str(error))
+        self.index = index
+        self.error = error
+
+
+class DeviceConnectionQueue(object):
+    """Idle connections of one device and the greenlets waiting for one
+
+    A released connection is handed over directly to the waiter with the most urgent priority,
+    waiters of the same priority are served in FIFO order. A greenlet arriving while others wait
+    queues up behind them instead of grabbing the connection.
+    """
+
+    def __init__(self, host, connections):
+        self.host = host
+        self.idle = collections.deque(connections)
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.idle)
+
+    def __iter__(self):
+        return iter(list(self.idle))
+
+    @property
+    def waiting(self):
+        return sum(1 for entry in self._waiters if entry[2] is not None)
+
+    def acquire(self, priority, timeout=None):
+        if self.idle and not self.waiting:
+            return self.idle.popleft()
+
+        waiter = event.Event()
+        entry = [priority, next(self._sequence), waiter]
+        heapq.heappush(self._waiters, entry)
+
+        connection = None
+        with eventlet_timeout.Timeout(timeout or None, False):
+            connection = waiter.wait()
+
+        if connection is None:
+            if waiter.ready():
+                # handed over just as the timeout fired
+                return waiter.wait()
+            # cancelled entries are skipped on release
+            entry[2] = None
+            raise ConnectionPoolExhausted()
+
+        return connection
+
+    def take(self, connection):
+        """Remove an idle connection from the queue for maintenance, hand it back with release()"""
+        try:
+            self.idle.remove(connection)
+        except ValueError:
+            return False
+        return True
+
+    def release(self, connection):
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)[2]
+            if waiter is not None:
+                waiter.send(connection)
+                return
+
+        self.idle.append(connection)
+
+
 class ConnectionManager(object):
-    def __init__(self, context=None):
+    """Check out a connection of the pool for the duration of the with block
+
+    With shared=True and pipelining enabled (max_inflight_rpcs > 0) no connection is checked out,
+    the RPCs are sent pipelined on the least busy idle session of the device instead. Only use this
+    for operations that do not depend on session state like locks.
+    """
+
+    def __init__(self, context=None, shared=False):
         self.context = context
+        self.shared = shared
+        self.connection = None
+        self._trial = None
+        self._binding = None
 
     def __enter__(self):
-        self.connection = ConnectionPool().pop_connection(context=self.context)
-        return self.connection
+        # requests for a struggling device wait here, before they take a pool slot
+        self._trial = DeviceGuard().enter(self.context)
+        # only the outcome of the trial request decides on a half-open circuit breaker, see _observe
+        self._binding = local_context.bind(device_trial=self._trial)
+        self._binding.__enter__()
+        try:
+            pool = ConnectionPool()
+            if self.shared and pool.pipelining:
+                connection = pool.shared_connection(context=self.context)
+                if connection is not None:
+                    return SharedConnection(connection)
+                # nothing to share, wait for a connection like any other request
+
+            self.connection = pool.pop_connection(context=self.context)
+            return self.connection
+        except BaseException:
+            self._exit_guard()
+            raise
 
     def __exit__(self, type, value, traceback):
-        ConnectionPool().push_connection(self.connection, context=self.context)
+        if self.connection is not None:
+            ConnectionPool().push_connection(self.connection, context=self.context)
+            self.connection = None
+        self._exit_guard()
+
+    def _exit_guard(self):
+        if self._binding is not None:
+            self._binding.__exit__(None, None, None)
+            self._binding = None
+        if self._trial is not None:
+            DeviceGuard().exit(self.context, trial=self._trial)
+            self._trial = None
 
 
 class ConnectionPool(object):
@@ -122,20 +311,85 @@ class ConnectionPool(object):
     def __init__(self):
         pass
 
-    def _ensure_connections_aged(self):
+    def _maintain_connections(self):
+        """Replace dead and aged sessions in the background while they are not in use
+
+        A connection is taken out of the device queue while it reconnects, so it is never handed out
+        half connected. Aged sessions are rotated one at a time per device, the replacement session
+        is opened before the old one is closed. Shared sessions are only rotated once their
+        pipelined RPCs are done.
+        """
         try:
+            liveness = DeviceLiveness()
             for context in self.pair_config.contexts:
-                yang = self.devices[context.host]
-
-                for connection in yang:
-                    if connection.age > self.max_age:
-                        LOG.debug("***** closing aged connection with session id {} aged {:10.2f}s"
-                                  "".format(connection.session_id, connection.age))
-                        with connection.lock:
-                            connection.close()
+                queue = self.devices[context.host]
+
+                if not context.alive:
+                    # one slot probes whether the device is back, check_devices() picks up the result
+                    if context.host not in self._probing:
+                        for connection in queue:
+                            if queue.take(connection):
+                                self._probing.add(context.host)
+                                eventlet.spawn_n(self._replace_connection, context, connection, False)
+                                break
+                    continue
+
+                idle_time = liveness.idle_time(context.host)
+                if idle_time is None or idle_time > self.keepalive_interval:
+                    for connection in queue:
+                        if not connection.is_inactive and queue.take(connection):
+                            eventlet.spawn_n(self._keepalive, context, connection)
+                            break
+
+                for connection in queue:
+                    if connection.is_inactive:
+                        if queue.take(connection):
+                            eventlet.spawn_n(self._replace_connection, context, connection, False)
+                    elif (connection.expired and connection.inflight == 0 and
+                            context.host not in self._rotating and queue.take(connection)):
+                        self._rotating.add(context.host)
+                        eventlet.spawn_n(self._replace_connection, context, connection, True)
         except Exception as e:
             LOG.exception(e)
 
+    def _replace_connection(self, context, connection, aged):
+        try:
+            with connection.lock:
+                if aged:
+                    LOG.debug("***** replacing aged connection with session id {} aged {:10.2f}s"
+                              "".format(connection.session_id, connection.age))
+                connection.reconnect()
+        except Exception as e:
+            LOG.warning("Failed to reconnect {}, will be attempted again in subsequent iterations: {}"
+                        "".format(connection.id, e))
+        finally:
+            if aged:
+                self._rotating.discard(context.host)
+            self._probing.discard(context.host)
+            self.devices[context.host].release(connection)
+
+    def _keepalive(self, context, connection):
+        try:
+            with connection.lock:
+                connection.xpath_get(filter=KEEPALIVE_XPATH, entity="keepalive", action="keepalive")
+        except Exception as e:
+            LOG.debug("Keepalive of {} failed: {}".format(connection.id, e))
+        finally:
+            self.devices[context.host].release(connection)
+
+    def _prewarm(self):
+        """Connect all slots in parallel, so the first requests do not pay the handshake"""
+        pool = eventlet.GreenPool()
+        for connections in self.connections.values():
+            for connection in connections:
+                pool.spawn_n(self._warm_connection, connection)
+        pool.waitall()
+
+    @staticmethod
+    def _warm_connection(connection):
+        # the property connects inactive sessions, errors are logged there
+        return connection.connection
+
     def __check_initialized(self):
         if not hasattr(self, 'initialized'):
             msg = ("Please ensure pool is before first use initilized with "
@@ -144,7 +398,10 @@ class ConnectionPool(object):
 
     def initialise(self, yang_connection_pool_size=0, max_age=0):
         try:
-            yang_pool_size = min(yang_connection_pool_size, asr1k_constants.MAX_CONNECTIONS)
+            # the SSH session limit of the device applies to transports, not to the channels on them
+            self.channels_per_transport = max(cfg.CONF.asr1k.channels_per_transport, 1)
+            yang_pool_size = min(yang_connection_pool_size,
+                                 asr1k_constants.MAX_CONNECTIONS * self.channels_per_transport)
 
             if yang_pool_size < yang_connection_pool_size:
                 LOG.warning("The yang connection pool size has been reduced to the system maximum its now {}"
@@ -152,39 +409,65 @@ class ConnectionPool(object):
 
             self.yang_pool_size = yang_pool_size
             self.max_age = max_age
+            self.max_age_jitter = cfg.CONF.asr1k.connection_max_age_jitter
+            self._rotating = set()
+            self._probing = set()
+            self.keepalive_interval = cfg.CONF.asr1k.connection_keepalive_interval
+            self.max_inflight_rpcs = cfg.CONF.asr1k.max_inflight_rpcs
+            self.acquire_timeout = cfg.CONF.asr1k.connection_pool_acquire_timeout
             self.pair_config = ASR1KPair()
             self.devices = {}
+            self.connections = {}
 
             LOG.info("Initializing connection pool with yang pool size {}".format(self.yang_pool_size))
 
             for context in self.pair_config.contexts:
                 yang = []
+                transports = {}
 
                 for i in range(self.yang_pool_size):
-                    yang.append(YangConnection(context, id=i))
+                    transport = None
+                    if self.channels_per_transport > 1:
+                        t_id = i // self.channels_per_transport
+                        transport = transports.setdefault(t_id, SharedSSHTransport(context, id=t_id))
+                    yang.append(YangConnection(context, id=i, max_inflight_rpcs=self.max_inflight_rpcs,
+                                               max_age=self.max_age, max_age_jitter=self.max_age_jitter,
+                                               transport=transport))
 
-                self.devices[context.host] = yang
+                self.devices[context.host] = DeviceConnectionQueue(context.host, yang)
+                self.connections[context.host] = list(yang)
 
-            if self.max_age > 0:
-                LOG.debug("Setting up looping call to close connections older than {} seconds".format(self.max_age))
-                self.monitor = loopingcall.FixedIntervalLoopingCall(
-                    self._ensure_connections_aged)
-                self.monitor.start(interval=self.max_age, stop_on_exception=False)
+            self._prewarm()
+
+            check_interval = cfg.CONF.asr1k.connection_check_interval
+            LOG.debug("Setting up looping call to replace dead connections and connections older than {} seconds "
+                      "every {} seconds".format(self.max_age, check_interval))
+            self.monitor = loopingcall.FixedIntervalLoopingCall(self._maintain_connections)
+            self.monitor.start(interval=check_interval, initial_delay=check_interval, stop_on_exception=False)
 
             self.initialized = True
         except Exception as e:
             LOG.exception(e)
 
-    @retry(stop_max_attempt_number=25, wait_fixed=100, retry_on_exception=_retry_if_exhausted)
+    def saturated(self):
+        """True while greenlets wait for a connection to any of the devices"""
+        return any(queue.waiting for queue in self.devices.values())
+
     def pop_connection(self, context=None):
-        pool = self.devices.get(context.host)
-        connection = None
-        if len(pool) > 0:
-            connection = pool.pop(0)
+        """Check out a connection, waiting up to connection_pool_acquire_timeout for one to be returned
 
-        if connection is None:
+        The priority of the waiting greenlet is taken from the local context, see DEFAULT_PRIORITY.
+        """
+        priority = local_context.get('priority', DEFAULT_PRIORITY)
+        start = time.time()
+        try:
+            connection = self.devices.get(context.host).acquire(priority, timeout=self.acquire_timeout)
+        except ConnectionPoolExhausted:
             PrometheusMonitor().connection_pool_exhausted.labels(device=context.host).inc()
-            raise ConnectionPoolExhausted()
+            raise
+        finally:
+            PrometheusMonitor().connection_pool_wait_duration.labels(device=context.host,
+                                                                     priority=priority).observe(time.time() - start)
 
         connection.lock.acquire()
 
@@ -193,12 +476,41 @@ class ConnectionPool(object):
     def push_connection(self, connection, context=None):
         connection.lock.release()
 
-        pool = self.devices.get(context.host)
-        pool.append(connection)
+        queue = self.devices.get(context.host)
+        # a session that aged while checked out is rotated on its return, unless somebody waits for it
+        if (connection.expired and connection.inflight == 0 and context.alive and not queue.waiting and
+                context.host not in self._rotating):
+            self._rotating.add(context.host)
+            eventlet.spawn_n(self._replace_connection, context, connection, True)
+            return
+
+        queue.release(connection)
+
+    @property
+    def pipelining(self):
+        return self.max_inflight_rpcs > 0
+
+    def session_ids(self, host):
+        connections = getattr(self, 'connections', {}).get(host, [])
+        return {connection.session_id for connection in connections if connection.session_id is not None}
+
+    def shared_connection(self, context):
+        """Least busy idle connection of the device, without checking it out
+
+        Connections checked out, taken for maintenance, not connected or holding their lock, like
+        during a candidate transaction, are not shared. None if no connection qualifies.
+        """
+        connections = [connection for connection in self.devices.get(context.host)
+                       if not connection.is_inactive and not connection.lock.locked()]
+        if not connections:
+            return None
+
+        return min(connections, key=lambda connection: connection.inflight)
 
     def get_connection(self, context):
-        connection = self.devices.get(context.host).pop(0)
-        self.devices.get(context.host).append(connection)
+        idle = self.devices.get(context.host).idle
+        connection = idle.popleft()
+        idle.append(connection)
 
         if connection is None:
             raise Exception('No connection can be found for {}'.format(context.host))
@@ -206,21 +518,115 @@ class ConnectionPool(object):
         return connection
 
 
+class RpcFuture(object):
+    """Reply of an RPC sent pipelined, result() waits for it like a synchronous ncclient call would"""
+
+    def __init__(self, connection, rpc, device_handler, timeout, entity=None, action=None):
+        self.connection = connection
+        self.entity = entity
+        self.action = action
+        self._rpc = rpc
+        self._device_handler = device_handler
+        self._timeout = timeout
+        self._start = time.time()
+        self._released = False
+
+    def done(self):
+        return self._rpc.event.is_set()
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self.connection._release_inflight()
+            PrometheusMonitor().yang_operation_duration.labels(device=self.connection.context.host,
+                                                               entity=self.entity,
+                                                               action=self.action).observe(time.time() - self._start)
+
+    def result(self):
+        try:
+            self._rpc.event.wait(self._timeout)
+            if not self._rpc.event.is_set():
+                LOG.error("Timeout for pipelined yang operation on device %s entity %s action %s",
+                          self.connection.context.host, self.entity, self.action)
+                raise TimeoutExpiredError('ncclient timed out while waiting for an rpc reply.')
+            if self._rpc.error:
+                raise self._rpc.error
+
+            reply = self._rpc.reply
+            reply.parse()
+            if reply.error is None:
+                self.connection._observe(latency=time.time() - self._start)
+            if reply.error is not None and not self._device_handler.is_rpc_error_exempt(reply.error.message):
+                errors = reply.errors
+                if len(errors) > 1:
+                    raise RPCError(to_ele(reply._raw), errs=errors)
+                raise reply.error
+
+            return reply
+        except (RPCError, TimeoutExpiredError, TransportError, socket.error) as e:
+            self.connection._observe(e, latency=time.time() - self._start)
+            raise
+        finally:
+            self._release()
+
+
+class SharedConnection(object):
+    """YangConnection API on top of a shared session, each call waits for its pipelined reply"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, item):
+        return getattr(self._connection, item)
+
+    def xpath_get(self, filter='', entity=None, action=None):
+        return self._connection.submit('get_config', filter=('xpath', filter), source="running",
+                                       entity=entity, action=action).result()
+
+    def get(self, filter='', entity=None, action=None):
+        return self._connection.submit('get', filter=('subtree', filter), entity=entity, action=action).result()
+
+    def edit_config(self, config='', target='running', entity=None, action=None, error_option=None):
+        kwargs = {}
+        if error_option is not None:
+            kwargs['error_option'] = error_option
+        return self._connection.submit('edit_config', config=config, target=target, entity=entity, action=action,
+                                       **kwargs).result()
+
+    def rpc(self, command, entity=None, action=None):
+        return self._connection.submit('dispatch', to_ele(command), entity=entity, action=action).result()
+
+
 class YangConnection(object):
-    def __init__(self, context, id=0):
+    def __init__(self, context, id=0, max_inflight_rpcs=0, max_age=0, max_age_jitter=0, transport=None):
         self.lock = Lock()
         self.context = context
+        self.transport = transport
         self._ncc_connection = None
-        self.start = time.time()
+        self._connect_lock = semaphore.Semaphore()
+        self._inflight = semaphore.Semaphore(max(max_inflight_rpcs, 1))
+        self.inflight = 0
+        self.max_age = max_age
+        self.max_age_jitter = max_age_jitter
+        self._reset_lifetime()
         self.id = "{}-{}".format(context.host, id)
 
     def __repr__(self):
         return "<{} to {} at {}>".format(self.__class__.__name__, self.context.host, hex(id(self)))
 
+    def _reset_lifetime(self):
+        # randomized per session, so the sessions of a pool do not all expire at the same time
+        self.start = time.time()
+        self.lifetime = self.max_age * random.uniform(1 - self.max_age_jitter, 1 + self.max_age_jitter)
+
     @property
     def age(self):
         return time.time() - self.start
 
+    @property
+    def expired(self):
+        return self.max_age > 0 and self.age > self.lifetime
+
     @property
     def session_id(self):
         if self._ncc_connection is not None and self._ncc_connection._session is not None:
@@ -236,14 +642,18 @@ class YangConnection(object):
     def connection(self):
         try:
             if self.is_inactive:
-                if self.session_id:
-                    LOG.debug("Existing session id {} is not active, closing and reconnecting".format(self.session_id))
-                try:
-                    self.close()
-                except TransportError:
-                    pass
-                finally:
-                    self._ncc_connection = self._connect(self.context)
+                with self._connect_lock:
+                    # shared sessions can be used by several greenlets, only one of them should reconnect
+                    if self.is_inactive:
+                        if self.session_id:
+                            LOG.debug("Existing session id {} is not active, closing and reconnecting"
+                                      "".format(self.session_id))
+                        try:
+                            self.close()
+                        except TransportError:
+                            pass
+                        finally:
+                            self._ncc_connection = self._connect(self.context)
         except Exception as e:
             if isinstance(e, TimeoutExpiredError) or isinstance(e, SSHError) or isinstance(e, SessionCloseError):
                 LOG.warning(
@@ -258,18 +668,62 @@ class YangConnection(object):
     def _connect(self, context):
         port = context.yang_port
 
-        return manager.connect(
-            host=context.host, port=port,
-            username=context.username, password=context.password,
-            hostkey_verify=False,
-            device_params={'name': "iosxe"}, timeout=context.nc_timeout,
-            allow_agent=False, look_for_keys=False)
+        try:
+            if self.transport is not None:
+                # only a new channel on the SSH connection shared with other slots
+                connection = self.transport.connect()
+            else:
+                connection = manager.connect(
+                    host=context.host, port=port,
+                    username=context.username, password=context.password,
+                    hostkey_verify=False,
+                    device_params={'name': "iosxe"}, timeout=context.nc_timeout,
+                    allow_agent=False, look_for_keys=False)
+        except Exception:
+            DeviceLiveness().record_failure(context.host, fatal=True)
+            raise
+
+        DeviceLiveness().record_success(context.host)
+        return connection
+
+    def _observe(self, error=None, latency=None):
+        # the device answered, even if only with an rpc-error
+        if error is None or isinstance(error, RPCError):
+            DeviceLiveness().record_success(self.context.host)
+        elif isinstance(error, (TimeoutExpiredError, TransportError, socket.error)):
+            DeviceLiveness().record_failure(self.context.host)
+
+        DeviceGuard().observe(self.context.host, error=error, latency=latency,
+                              trial=local_context.get('device_trial', False))
+
+    def reconnect(self):
+        """Replace the session, the new one is opened before the old one is closed
+
+        Should opening the new session fail the old one stays in place. Pipelined RPCs still in
+        flight on the old session get nc_timeout to finish before it is closed.
+        """
+        new_connection = self._connect(self.context)
+        with self._connect_lock:
+            old_connection, self._ncc_connection = self._ncc_connection, new_connection
+            self._reset_lifetime()
+
+        if old_connection is not None:
+            if self.inflight > 0:
+                eventlet.spawn_after(self.context.nc_timeout, self._close_session, old_connection)
+            else:
+                self._close_session(old_connection)
+
+    def _close_session(self, ncc_connection):
+        try:
+            ncc_connection.close_session()
+        except Exception as e:
+            LOG.debug("Failed to close replaced session of {}: {}".format(self.id, e))
 
     def close(self):
         if self._ncc_connection is not None:
             self._ncc_connection.close_session()
             self._ncc_connection = None
-        self.start = time.time()
+        self._reset_lifetime()
 
     def xpath_get(self, filter='', entity=None, action=None):
         return self._run_yang_cmd(filter=('xpath', filter), source="running", method='get_config',
@@ -278,12 +732,123 @@ class YangConnection(object):
     def get(self, filter='', entity=None, action=None):
         return self._run_yang_cmd(filter=('subtree', filter), method='get', entity=entity, action=action)
 
-    def edit_config(self, config='', target='running', entity=None, action=None):
-        return self._run_yang_cmd(config=config, target=target, method='edit_config', entity=entity, action=action)
+    def edit_config(self, config='', target='running', entity=None, action=None, error_option=None):
+        kwargs = {}
+        if error_option is not None:
+            kwargs['error_option'] = error_option
+        return self._run_yang_cmd(config=config, target=target, method='edit_config', entity=entity, action=action,
+                                  **kwargs)
 
     def rpc(self, command, entity=None, action=None):
         return self._run_yang_cmd(to_ele(command), method='dispatch', entity=entity, action=action)
 
+    def lock_datastore(self, target='candidate', entity=None, action=None):
+        return self._run_yang_cmd(target=target, method='lock', entity=entity, action=action)
+
+    def unlock_datastore(self, target='candidate', entity=None, action=None):
+        return self._run_yang_cmd(target=target, method='unlock', entity=entity, action=action)
+
+    def validate(self, source='candidate', entity=None, action=None):
+        return self._run_yang_cmd(source=source, method='validate', entity=entity, action=action)
+
+    def commit(self, confirmed=False, timeout=None, entity=None, action=None):
+        kwargs = {}
+        if confirmed:
+            kwargs['confirmed'] = True
+            kwargs['timeout'] = str(timeout)
+        return self._run_yang_cmd(method='commit', entity=entity, action=action, **kwargs)
+
+    def cancel_commit(self, entity=None, action=None):
+        return self._run_yang_cmd(method='cancel_commit', entity=entity, action=action)
+
+    def discard_changes(self, entity=None, action=None):
+        return self._run_yang_cmd(method='discard_changes', entity=entity, action=action)
+
+    def commit_candidate(self, edits, confirm_timeout=None):
+        """Apply edits to the candidate datastore and commit them as one transaction
+
+        edits is a list of (config, entity, action) tuples. The candidate is locked for the
+        duration of the transaction, if an edit is rejected the candidate is discarded and
+        CandidateEditFailed tells which edit it was. With a confirm_timeout the commit is
+        done as confirmed-commit and only confirmed once the running config it produced
+        validates. Should that check fail the commit is cancelled, should we lose the session
+        before the confirming commit the device rolls back by itself.
+        """
+        if confirm_timeout is None:
+            confirm_timeout = 0
+            if self.context.has_confirmed_commit:
+                confirm_timeout = cfg.CONF.asr1k.confirmed_commit_timeout
+
+        self.lock_datastore(target='candidate', action='lock')
+        try:
+            replies = []
+            for index, (config, entity, action) in enumerate(edits):
+                try:
+                    replies.append(self.edit_config(config=config, target='candidate', entity=entity, action=action))
+                except RPCError as e:
+                    raise CandidateEditFailed(index, e)
+
+            self.validate(source='candidate', action='validate')
+            if confirm_timeout > 0:
+                self.commit(confirmed=True, timeout=confirm_timeout, action='confirmed-commit')
+                try:
+                    self.validate(source='running', action='validate-running')
+                except BaseException:
+                    try:
+                        self.cancel_commit(action='cancel-commit')
+                    except BaseException as e:
+                        LOG.warning("Failed to cancel confirmed commit on %s, the device rolls back after %ss: %s",
+                                    self.context.host, confirm_timeout, e)
+                    raise
+                self.commit(action='confirm')
+            else:
+                self.commit(action='commit')
+
+            return replies
+        except BaseException:
+            try:
+                self.discard_changes(action='discard-changes')
+            except BaseException as e:
+                LOG.warning("Failed to discard candidate changes on %s: %s", self.context.host, e)
+            raise
+        finally:
+            try:
+                self.unlock_datastore(target='candidate', action='unlock')
+            except BaseException as e:
+                LOG.warning("Failed to unlock candidate datastore on %s: %s", self.context.host, e)
+
+    def submit(self, method, *args, **kwargs):
+        """Send an RPC without waiting for the reply
+
+        The session does not need to be checked out, up to max_inflight_rpcs RPCs are in flight per
+        session, replies are matched by message-id by ncclient. Returns a RpcFuture.
+        """
+        entity = kwargs.pop("entity", None)
+        action = kwargs.pop("action", None)
+
+        self._inflight.acquire()
+        self.inflight += 1
+        try:
+            connection = self.connection if self.context.alive else None
+            if connection is None:
+                PrometheusMonitor().device_unreachable.labels(device=self.context.host, entity=entity,
+                                                              action=action).inc()
+                raise DeviceUnreachable(host=self.context.host)
+
+            operation = manager.OPERATIONS[method](connection._session, device_handler=connection._device_handler,
+                                                   async_mode=True, timeout=connection.timeout,
+                                                   raise_mode=connection.raise_mode)
+            rpc = operation.request(*args, **kwargs)
+        except BaseException:
+            self._release_inflight()
+            raise
+
+        return RpcFuture(self, rpc, connection._device_handler, connection.timeout, entity=entity, action=action)
+
+    def _release_inflight(self):
+        self.inflight -= 1
+        self._inflight.release()
+
     def _run_yang_cmd(self, *args, **kwargs):
         entity = kwargs.pop("entity", None)
         action = kwargs.pop("action", None)
@@ -291,17 +856,21 @@ class YangConnection(object):
 
         if self.context.alive and self.connection is not None:
             success = False
-            if cfg.CONF.asr1k.trace_all_yang_calls or cfg.CONF.asr1k.trace_yang_call_failures:
-                call_start = time.time()
+            call_start = time.time()
             try:
                 with PrometheusMonitor().yang_operation_duration.labels(device=self.context.host, entity=entity,
                                                                         action=action).time():
                     data = getattr(self.connection, method)(*args, **kwargs)
                     success = True
+                    self._observe(latency=time.time() - call_start)
                     return data
-            except TimeoutExpiredError:
+            except TimeoutExpiredError as e:
                 LOG.error("Timeout for yang operation on device %s method %s entity %s action %s args=%s kwargs=%s",
                           self.context.host, method, entity, action, args, kwargs)
+                self._observe(e)
+                raise
+            except (RPCError, TransportError, socket.error) as e:
+                self._observe(e, latency=time.time() - call_start)
                 raise
             finally:
                 if cfg.CONF.asr1k.trace_all_yang_calls or \
@@ -342,6 +911,13 @@ class YangConnection(object):
             xml = re.sub(r"\s*\n\s*", "", xml)
         return xml
 
+    def has_capability(self, capability):
+        connection = self.connection
+        if getattr(connection, "server_capabilities", None) is None:
+            return False
+
+        return capability in connection.server_capabilities
+
     def check_capability(self, module, min_revision, baseurl='http://cisco.com/ns/yang/{module}'):
         baseurl = baseurl.format(module=module)
         min_rev_date = datetime.datetime.strptime(min_revision, "%Y-%m-%d")
@@ -0,0 +1,264 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Protect struggling devices from the retries of the agent
+
+Each device gets a circuit breaker and an AIMD concurrency limit for the requests in flight.
+Overload signals (timeouts, "Sync is in progress", config locks, transport errors) open the
+breaker after a number of consecutive failures, requests then wait until the breaker lets a
+trial request through instead of retrying on their own. The concurrency limit grows by one
+for every limit worth of fast replies and is halved on slow replies or overload signals.
+"""
+
+import time
+
+from eventlet import event
+from eventlet import timeout as eventlet_timeout
+from ncclient.operations.errors import TimeoutExpiredError
+from ncclient.operations.rpc import RPCError
+from ncclient.transport.errors import TransportError
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common import asr1k_exceptions as exc
+from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
+
+LOG = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half-open'
+OPEN = 'open'
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+OVERLOAD_MESSAGES = ["resource denied: Sync is in progress"]
+OVERLOAD_TAGS = ['in-use']
+
+
+def is_overload(error):
+    if isinstance(error, (TimeoutExpiredError, TransportError)):
+        return True
+    if isinstance(error, RPCError):
+        return error.message in OVERLOAD_MESSAGES or error.tag in OVERLOAD_TAGS
+    return False
+
+
+class _Waiters(object):
+    def __init__(self):
+        self._waiters = []
+
+    def wait(self, timeout):
+        waiter = event.Event()
+        self._waiters.append(waiter)
+        try:
+            with eventlet_timeout.Timeout(timeout or None, False):
+                waiter.wait()
+                return True
+            return False
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def wake(self, count=None):
+        waiters = self._waiters if count is None else self._waiters[:count]
+        for waiter in list(waiters):
+            self._waiters.remove(waiter)
+            waiter.send()
+
+
+class CircuitBreaker(object):
+    def __init__(self, host, failure_threshold, open_time):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.open_time = open_time
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._trial = False
+        self._waiters = _Waiters()
+
+    @property
+    def enabled(self):
+        return self.failure_threshold > 0
+
+    def _set_state(self, state):
+        if state != self.state:
+            LOG.warning("Circuit breaker of device %s changes from %s to %s", self.host, self.state, state)
+            self.state = state
+            PrometheusMonitor().circuit_breaker_state.labels(device=self.host).set(STATE_VALUES[state])
+
+    def allow(self):
+        """True if a request may be sent now, in half-open state only a single trial request passes"""
+        if not self.enabled or self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.time() - self.opened < self.open_time:
+                return False
+            self._set_state(HALF_OPEN)
+        if self._trial:
+            return False
+        self._trial = True
+        return True
+
+    def wait(self, timeout):
+        deadline = time.time() + timeout if timeout else None
+        while not self.allow():
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                return False
+            # woken up when a trial request ended, re-checked at the latest when the open time is over
+            wait = self.opened + self.open_time - now if self.state == OPEN else self.open_time
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            self._waiters.wait(max(wait, 0.1))
+        return True
+
+    def record_success(self, trial=False):
+        # requests sent before the breaker opened still report back, only the outcome of the
+        # trial request tells whether the device recovered
+        if self.state == OPEN or (self.state == HALF_OPEN and not trial):
+            return
+        self.failures = 0
+        self._trial = False
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+            self._waiters.wake()
+
+    def record_failure(self, trial=False):
+        if self.state == HALF_OPEN and not trial:
+            return
+        self.failures += 1
+        self._trial = False
+        if self.state == HALF_OPEN or (self.enabled and self.failures >= self.failure_threshold):
+            self.opened = time.time()
+            self._set_state(OPEN)
+        # a waiter may take over the trial of a half-open breaker
+        self._waiters.wake(1)
+
+    def release_trial(self):
+        # the trial request ended without an outcome (e.g. a client side error)
+        if self._trial:
+            self._trial = False
+            self._waiters.wake(1)
+
+
+class ConcurrencyLimiter(object):
+    def __init__(self, host, max_limit, target_latency):
+        self.host = host
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.limit = float(max_limit)
+        self.inflight = 0
+        self._last_decrease = 0
+        self._waiters = _Waiters()
+
+    @property
+    def enabled(self):
+        return self.max_limit > 0
+
+    def acquire(self, timeout):
+        if not self.enabled:
+            return True
+        deadline = time.time() + timeout if timeout else None
+        while self.inflight >= int(self.limit):
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                return False
+            self._waiters.wait(deadline - now if deadline is not None else None)
+        self.inflight += 1
+        return True
+
+    def release(self):
+        if not self.enabled:
+            return
+        self.inflight -= 1
+        self._waiters.wake(max(int(self.limit) - self.inflight, 0))
+
+    def _update_limit(self, limit):
+        limit = max(1.0, min(float(self.max_limit), limit))
+        if int(limit) != int(self.limit):
+            LOG.debug("Concurrency limit of device %s changes from %s to %s", self.host, int(self.limit), int(limit))
+            PrometheusMonitor().concurrency_limit.labels(device=self.host).set(int(limit))
+        self.limit = limit
+
+    def record(self, latency=None, overload=False):
+        if not self.enabled:
+            return
+        if overload or (latency is not None and latency > self.target_latency):
+            # the requests in flight report the same congestion, only back off once per latency window
+            if time.time() - self._last_decrease > self.target_latency:
+                self._last_decrease = time.time()
+                self._update_limit(self.limit / 2)
+        else:
+            self._update_limit(self.limit + 1 / self.limit)
+            self._waiters.wake(max(int(self.limit) - self.inflight, 0))
+
+
+class DeviceGuard(object):
+    """Circuit breaker and concurrency limit per device, used by ConnectionManager"""
+    __instance = None
+
+    def __new__(cls):
+        if DeviceGuard.__instance is None:
+            DeviceGuard.__instance = object.__new__(cls)
+            DeviceGuard.__instance.breakers = {}
+            DeviceGuard.__instance.limiters = {}
+
+        return DeviceGuard.__instance
+
+    def breaker(self, host):
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(host, cfg.CONF.asr1k.circuit_breaker_failure_threshold,
+                                                 cfg.CONF.asr1k.circuit_breaker_open_time)
+        return self.breakers[host]
+
+    def limiter(self, host):
+        if host not in self.limiters:
+            self.limiters[host] = ConcurrencyLimiter(host, cfg.CONF.asr1k.adaptive_concurrency_limit,
+                                                     cfg.CONF.asr1k.adaptive_concurrency_target_latency)
+        return self.limiters[host]
+
+    def enter(self, context):
+        """Wait until the device accepts another request, raise DeviceOverloadedException on timeout
+
+        Returns True if the caller got the trial request of a half-open breaker, pass it on to exit().
+        """
+        timeout = cfg.CONF.asr1k.device_overload_wait_timeout
+        breaker = self.breaker(context.host)
+        if not breaker.wait(timeout):
+            raise exc.DeviceOverloadedException(host=context.host, reason="circuit breaker {}".format(breaker.state))
+        trial = breaker.state == HALF_OPEN
+
+        if not self.limiter(context.host).acquire(timeout):
+            if trial:
+                breaker.release_trial()
+            raise exc.DeviceOverloadedException(host=context.host, reason="concurrency limit reached")
+
+        return trial
+
+    def exit(self, context, trial=False):
+        self.limiter(context.host).release()
+        if trial:
+            self.breaker(context.host).release_trial()
+
+    def observe(self, host, error=None, latency=None, trial=False):
+        """Record the outcome of a request, trial tells whether it was the trial request from enter()"""
+        if error is None or (isinstance(error, RPCError) and not is_overload(error)):
+            self.breaker(host).record_success(trial=trial)
+            self.limiter(host).record(latency=latency)
+        elif is_overload(error):
+            self.breaker(host).record_failure(trial=trial)
+            self.limiter(host).record(overload=True)
@@ -87,7 +87,7 @@ class AccessList(NyBase):
         return [
             {"key": "name", "id": True},
             {'key': 'rules', 'yang-key': "access-list-seq-rule", 'type': [ACLRule], 'default': []},
-            {'key': 'drop_on_17_3', 'default': False},
+            {'key': 'drop_on_17_3', 'default': False, 'stub': True},
         ]
 
     @classmethod
@@ -170,9 +170,10 @@ class AccessList(NyBase):
         if self.policy_id:
             return False
 
+        # no super() here, the cleaner calls this on an EntityStub which is no AccessList
         return context.version_min_17_3 and \
             (self.drop_on_17_3 or self.name.startswith("PBR-") and self.neutron_router_id is not None) or \
-            super(AccessList, self).is_orphan(*args, context=context, **kwargs)
+            NyBase.is_orphan(self, *args, context=context, **kwargs)
 
 
 class ACLRule(NyBase):
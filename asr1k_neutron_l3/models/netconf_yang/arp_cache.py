@@ -18,8 +18,10 @@ import re
 
 from oslo_log import log as logging
 
+from asr1k_neutron_l3.common import asr1k_exceptions as exc
 from asr1k_neutron_l3.models.connection import ConnectionManager
 from asr1k_neutron_l3.models.netconf_yang.ny_base import NyBase, execute_on_pair
+from asr1k_neutron_l3.models.netconf_yang.xml_utils import iter_items, reply_xml
 from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
 
 LOG = logging.getLogger(__name__)
@@ -88,28 +90,39 @@ class ArpCache(NyBase):
             {'key': 'vrfs', 'yang-key': ArpCacheConstants.ARP_VRF, 'type': [VRFArpCache], 'default': []},
         ]
 
+    @classmethod
+    def _iter_vrfs(cls, context):
+        # the ARP table of a device can be huge, it is turned into objects one VRF at a time
+        with ConnectionManager(context=context, shared=True) as connection:
+            reply = connection.get(filter=cls.ID_FILTER, entity=cls.__name__, action="get")
+
+        path = (ArpCacheConstants.ARP_DATA, ArpCacheConstants.ARP_VRF)
+        for item in iter_items(reply_xml(reply), path, cls.namespaces):
+            yield VRFArpCache.from_json(item[ArpCacheConstants.ARP_DATA][ArpCacheConstants.ARP_VRF], context)
+
     @classmethod
     @execute_on_pair()
     def clean_device_arp(cls, context, fip_data):
         LOG.debug("Host %s: Fetching ARP data", context.host)
 
         stale_entries = []
-        arp_data = cls._get(context=context)
-        if arp_data is None:
+        entry_count = 0
+        try:
+            for vrf in cls._iter_vrfs(context):
+                entry_count += len(vrf.entries)
+                if not cls.VRF_RE.match(vrf.vrf):
+                    continue
+
+                for entry in vrf.entries:
+                    if fip_data.get(entry.address) not in (None, entry.mac):
+                        stale_entries.append((vrf.vrf, entry.address, entry.mac, fip_data[entry.address]))
+                        PrometheusMonitor().fip_on_wrong_mac_count.labels(device=context.host, vrf=vrf.vrf).inc()
+        except exc.DeviceUnreachable:
             LOG.warning("ARP cleanup could not fetch ARP cache from device for host %s, cleaning not possible",
                         context.host)
             return
-
-        for vrf in arp_data.vrfs:
-            if not cls.VRF_RE.match(vrf.vrf):
-                continue
-
-            for entry in vrf.entries:
-                if fip_data.get(entry.address) not in (None, entry.mac):
-                    stale_entries.append((vrf.vrf, entry.address, entry.mac, fip_data[entry.address]))
-                    PrometheusMonitor().fip_on_wrong_mac_count.labels(device=context.host, vrf=vrf.vrf).inc()
         LOG.debug("ARP cleanup on host %s for %s fips and %s ARP entries with %s stale entries",
-                  context.host, len(fip_data), sum(len(vrf.entries) for vrf in arp_data.vrfs), len(stale_entries))
+                  context.host, len(fip_data), entry_count, len(stale_entries))
 
         if stale_entries:
             with ConnectionManager(context=context) as connection:
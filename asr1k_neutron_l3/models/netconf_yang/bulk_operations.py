@@ -1,8 +1,10 @@
+from lxml import etree
 from oslo_log import log as logging
 
 from asr1k_neutron_l3.common import asr1k_exceptions as exc
 from asr1k_neutron_l3.models.connection import ConnectionManager
 from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.netconf_yang.stub import EntityStub
 
 LOG = logging.getLogger(__name__)
 
@@ -11,7 +13,7 @@ class BulkOperations(xml_utils.XMLUtils):
     FULL_CONFIG_FILTER = """<native xmlns = "http://cisco.com/ns/yang/Cisco-IOS-XE-native"></native>"""
 
     @classmethod
-    def get_all_from_device_config(cls, device_config_json, context):
+    def get_all_from_device_config(cls, device_config_json, context, stubs=False):
         result = []
 
         json = cls.remove_wrapper(device_config_json, context)
@@ -29,12 +31,13 @@ class BulkOperations(xml_utils.XMLUtils):
             else:
                 json = json.get(cls.get_item_key(context), json)
 
-            if isinstance(json, list):
-                for item in json:
+            if not isinstance(json, list):
+                json = [json]
+            for item in json:
+                if stubs:
+                    result.append(EntityStub.of(cls, item, context))
+                else:
                     result.append(cls.from_json(item, context))
-            else:
-
-                result.append(cls.from_json(json, context))
 
         return result
 
@@ -44,8 +47,7 @@ class BulkOperations(xml_utils.XMLUtils):
             with ConnectionManager(context=context) as connection:
                 rpc_result = connection.get(filter=cls.FULL_CONFIG_FILTER)
 
-                result = cls.to_raw_json(rpc_result.xml)
-                return cls._to_plain_json(result)
+                return cls.to_plain_raw_json(xml_utils.reply_xml(rpc_result))
 
         except exc.DeviceUnreachable:
             pass
@@ -60,19 +62,36 @@ class BulkOperations(xml_utils.XMLUtils):
 
         return cls.GET_ALL_STUB
 
+    @classmethod
+    def get_stub_item_path(cls, context):
+        """Path of the entities below <data> in a reply to the stub filter, None if not found"""
+        root = etree.fromstring(cls.get_all_stub_filter(context))
+        item_key = cls.get_item_key(context)
+        for element in root.iter('{*}' + item_key, item_key):
+            path = [etree.QName(ancestor).localname for ancestor in element.iterancestors()]
+            return tuple(reversed(path)) + (item_key,)
+
     @classmethod
     def get_all_stubs_from_device(cls, context):
         """Get all objects as stub  present on a device
 
-        The object will be created with only a minimal set of values, required to identify it
+        The objects are read-only EntityStubs, holding only the values required to identify
+        them, which become a full entity for operations on the device. The reply is processed
+        one entity at a time.
         """
         try:
             with ConnectionManager(context=context) as connection:
                 rpc_result = connection.get(filter=cls.get_all_stub_filter(context))
 
-                result = cls.to_raw_json(rpc_result.xml)
-                result = cls._to_plain_json(result)
-                return cls.get_all_from_device_config(result, context)
+            path = cls.get_stub_item_path(context)
+            if path is None:
+                result = cls.to_plain_raw_json(xml_utils.reply_xml(rpc_result))
+                return cls.get_all_from_device_config(result, context, stubs=True)
+
+            result = []
+            for item in xml_utils.iter_items(xml_utils.reply_xml(rpc_result), path, cls.namespaces):
+                result += cls.get_all_from_device_config(item, context, stubs=True)
+            return result
         except Exception:
             LOG.exception("Could not fetch entity {} for cleaning".format(cls.__name__))
             return []
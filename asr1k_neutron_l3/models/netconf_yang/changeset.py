@@ -0,0 +1,405 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+from eventlet import event
+from lxml import etree
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common import asr1k_exceptions as exc
+from asr1k_neutron_l3.common import local_context
+from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
+from asr1k_neutron_l3.models.connection import CandidateEditFailed
+from asr1k_neutron_l3.models.connection import ConnectionManager
+from asr1k_neutron_l3.models.netconf_yang import ny_base
+from asr1k_neutron_l3.models.netconf_yang import snapshot
+from asr1k_neutron_l3.models.netconf_yang.state_cache import DeviceStateCache
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+
+LOG = logging.getLogger(__name__)
+
+CAPABILITY_ROLLBACK_ON_ERROR = ':rollback-on-error'
+
+
+def _is_leaf(element):
+    return len(element) == 0
+
+
+def _leaf_signature(element):
+    return frozenset((child.tag, (child.text or '').strip(), tuple(sorted(child.attrib.items())))
+                     for child in element if _is_leaf(child))
+
+
+def _mergeable(existing, element):
+    # Only merge structural nodes: no operation or other attributes, at least one container child
+    # and the same key leafs. List entries with different keys stay separate siblings.
+    if existing.tag != element.tag or existing.attrib or element.attrib:
+        return False
+    if all(_is_leaf(child) for child in existing) or all(_is_leaf(child) for child in element):
+        return False
+    return _leaf_signature(existing) == _leaf_signature(element)
+
+
+def _merge_into(parent, element):
+    # Merging only ever happens into the last child, so the document order of all edits is kept
+    last = parent[-1] if len(parent) else None
+    if last is not None and _mergeable(last, element):
+        # key leafs are identical on both, only the containers need to be carried over
+        for child in list(element):
+            if not _is_leaf(child):
+                _merge_into(last, child)
+    else:
+        parent.append(element)
+
+
+def merge_configs(configs):
+    """Merge a list of <config><native>..</native></config> documents into one edit-config payload"""
+    native = None
+    for config in configs:
+        root = etree.fromstring(config.strip().encode())
+        fragment = root.find('{{{}}}{}'.format(xml_utils.NS_CISCO_NATIVE, xml_utils.IOS_NATIVE))
+        if fragment is None:
+            raise ValueError("Config fragment has no native container: {}".format(config))
+        if native is None:
+            native = fragment
+            continue
+        for child in list(fragment):
+            _merge_into(native, child)
+
+    config = etree.Element('{{{}}}{}'.format(xml_utils.NS_NETCONF_BASE, xml_utils.CONFIG),
+                           nsmap={None: xml_utils.NS_NETCONF_BASE})
+    if native is not None:
+        config.append(native)
+
+    return etree.tostring(config).decode()
+
+
+def send_merged(context, configs):
+    """Send the merged fragments as one edit-config, rolled back as a whole if the device supports it"""
+    config = merge_configs(configs)
+
+    with ConnectionManager(context=context, shared=True) as connection:
+        error_option = None
+        if connection.has_capability(CAPABILITY_ROLLBACK_ON_ERROR):
+            error_option = 'rollback-on-error'
+
+        return connection.edit_config(config=config, entity=ChangeSet.__name__, action="commit",
+                                      error_option=error_option)
+
+
+def send_candidate(context, edits):
+    with ConnectionManager(context=context) as connection:
+        return connection.commit_candidate(edits)
+
+
+class WriteSubmission(object):
+    def __init__(self, edits):
+        self.edits = edits
+        self.size = sum(len(config) for config, _, _ in edits)
+        self.result = event.Event()
+
+
+class DeviceWriteScheduler(object):
+    """Coalesce the changeset flushes of concurrent router updates into one write per device
+
+    The first submission opens a window of write_coalesce_window seconds, all submissions arriving
+    in it are sent as one edit-config, or one candidate transaction. A batch is sent right away
+    once it reaches write_coalesce_max_bytes. Should the combined write fail every submission is
+    sent on its own, so each router gets the result of its own edits.
+    """
+    _schedulers = {}
+
+    @staticmethod
+    def enabled():
+        return cfg.CONF.asr1k_l3.write_coalesce_window > 0
+
+    @classmethod
+    def get(cls, context):
+        scheduler = cls._schedulers.get(context.host)
+        if scheduler is None:
+            scheduler = cls._schedulers[context.host] = cls(context)
+        return scheduler
+
+    def __init__(self, context):
+        self.context = context
+        self.window = cfg.CONF.asr1k_l3.write_coalesce_window
+        self.max_bytes = cfg.CONF.asr1k_l3.write_coalesce_max_bytes
+        self._batch = []
+        self._size = 0
+        self._timer = None
+
+    def submit(self, edits):
+        """Queue (config, entity, action) edits and wait for the reply of the write they end up in
+
+        Returns the edit-config reply, for candidate datastores the list of replies per edit.
+        """
+        submission = WriteSubmission(edits)
+        self._batch.append(submission)
+        self._size += submission.size
+
+        if self._size >= self.max_bytes:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = eventlet.spawn_after(self.window, self._dispatch)
+
+        return submission.result.wait()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._batch, self._size = self._batch, [], 0
+        if batch:
+            eventlet.spawn_n(self._write, batch)
+
+    def _write(self, batch):
+        if len(batch) == 1:
+            self._write_single(batch[0])
+            return
+
+        try:
+            if self.context.use_candidate:
+                self._write_candidate(batch)
+            else:
+                reply = send_merged(self.context, [config for submission in batch
+                                                   for config, _, _ in submission.edits])
+                for submission in batch:
+                    submission.result.send(reply)
+        except BaseException as e:
+            LOG.warning("Coalesced write of %s submissions failed on %s, sending them one by one: %s",
+                        len(batch), self.context.host, e)
+            for submission in batch:
+                if not submission.result.ready():
+                    self._write_single(submission)
+
+    def _write_single(self, submission):
+        try:
+            if self.context.use_candidate:
+                result = send_candidate(self.context, submission.edits)
+            else:
+                result = send_merged(self.context, [config for config, _, _ in submission.edits])
+            submission.result.send(result)
+        except BaseException as e:
+            submission.result.send_exception(e)
+
+    def _write_candidate(self, batch):
+        edits = [edit for submission in batch for edit in submission.edits]
+        try:
+            replies = send_candidate(self.context, edits)
+        except CandidateEditFailed as e:
+            # the transaction was discarded, only the submission with the rejected edit fails
+            offset = 0
+            for submission in batch:
+                if offset <= e.index < offset + len(submission.edits):
+                    submission.result.send_exception(CandidateEditFailed(e.index - offset, e.error))
+                else:
+                    self._write_single(submission)
+                offset += len(submission.edits)
+            return
+
+        replies = replies or [None] * len(edits)
+        offset = 0
+        for submission in batch:
+            submission.result.send(replies[offset:offset + len(submission.edits)])
+            offset += len(submission.edits)
+
+
+class PendingEdit(object):
+    def __init__(self, entity, context, config, action, state=None):
+        self.entity = entity
+        self.context = context
+        self.config = config
+        self.action = action
+        self.state = state
+        self.reply = None
+        self.error = None
+
+    def __repr__(self):
+        return "<{} {} {} on {}>".format(self.__class__.__name__, self.action, self.key, self.context.host)
+
+    @property
+    def key(self):
+        return self.entity.__class__.__name__, self.entity.id
+
+    @property
+    def ok(self):
+        # retry_on_failure treats a non ok reply as retryable, a pending edit can only fail once flushed
+        return self.error is None
+
+    def resolve(self, reply):
+        self.reply = reply
+        if self.state is not None and reply is not None and getattr(reply, 'ok', True):
+            DeviceStateCache().store(self.context, self.entity, self.state)
+
+    def fail(self, error):
+        self.error = error
+
+
+class ChangeSet(object):
+    """Collect the edit-configs of a router update and send them as one edit-config per device
+
+    While a changeset is active NyBase entities do not send their edit-config but register the
+    fragment here. On exit the fragments are merged into one <config><native> document per device.
+    Should the consolidated edit fail, the fragments are replayed one by one with the normal retry
+    handling so the error ends up on the entity which caused it.
+
+    On devices using the candidate datastore the fragments are applied to the candidate one by one
+    and committed together, a rejected fragment rolls back the whole router on that device.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._pending = {}
+        self._binding = None
+
+    def __str__(self):
+        return "changeset {}".format(self.name)
+
+    def __enter__(self):
+        self._binding = local_context.bind(changeset=self)
+        self._binding.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._binding.__exit__(None, None, None)
+        self._binding = None
+        self.flush()
+        return False
+
+    @classmethod
+    def current(cls):
+        return local_context.get('changeset')
+
+    def add(self, entity, context, config, action, state=None):
+        edit = PendingEdit(entity, context, config, action, state=state)
+
+        if any(pending.key == edit.key for pending in self._pending.get(context.host, [])):
+            # a second edit of the same entity (e.g. preflight cleanup followed by the update)
+            # needs the first one applied on the device, so send out what we have so far
+            self.flush_host(context.host)
+
+        self._pending.setdefault(context.host, []).append(edit)
+
+        return edit
+
+    def flush(self):
+        pool = eventlet.GreenPool()
+        for host in list(self._pending.keys()):
+            pool.spawn_n(self.flush_host, host)
+        pool.waitall()
+
+    def flush_host(self, host):
+        """Send the edits collected so far for a device, their PendingEdits are resolved or failed"""
+        pending = self._pending.pop(host, [])
+        if not pending:
+            return
+
+        context = pending[0].context
+        if context.use_candidate:
+            self._flush_candidate(context, pending)
+            return
+
+        if len(pending) > 1 or DeviceWriteScheduler.enabled():
+            try:
+                reply = self._commit(context, pending)
+                for edit in pending:
+                    edit.resolve(reply)
+                return
+            except BaseException as e:
+                LOG.warning("Consolidated edit of %s with %s entities failed on %s, replaying entities one by one: %s",
+                            self.name, len(pending), host, e)
+                PrometheusMonitor().changeset_fallbacks.labels(device=host).inc()
+
+        for edit in pending:
+            try:
+                edit.resolve(edit.entity._send_edit_with_retry(context=context, config=edit.config,
+                                                               action=edit.action, state=edit.state))
+            except BaseException as e:
+                LOG.error("Edit %s of %s failed on %s: %s", edit.action, edit.key, host, e)
+                edit.fail(e)
+
+    def _flush_candidate(self, context, pending):
+        try:
+            replies = self._commit_candidate(context=context, pending=pending)
+        except CandidateEditFailed as e:
+            failed = pending[e.index]
+            LOG.error("Edit %s of %s failed on %s, rolled back %s: %s", failed.action, failed.key, context.host,
+                      self.name, e.error)
+            failed.fail(e.error)
+            for edit in pending:
+                if edit is not failed:
+                    edit.fail(exc.ChangeSetRolledBackException(host=context.host, entity=edit.entity,
+                                                               operation=edit.action, cause=e.error))
+            return
+        except BaseException as e:
+            LOG.error("Candidate commit of %s failed on %s: %s", self.name, context.host, e)
+            for edit in pending:
+                edit.fail(e)
+            return
+
+        # no replies means the device went away, which is handled like for single edits
+        replies = replies or [None] * len(pending)
+        for edit, reply in zip(pending, replies):
+            edit.resolve(reply)
+
+    def _invalidate_reads(self, context, pending):
+        prefetch = local_context.get('prefetch')
+        for edit in pending:
+            if prefetch is not None:
+                prefetch.invalidate(context, edit.config)
+            snapshot.ConfigSnapshots().invalidate(context, edit.config)
+            DeviceStateCache().invalidate(context, edit.config, router_id=self.name)
+
+    @ny_base.retry_on_failure()
+    def _commit_candidate(self, context, pending):
+        self._invalidate_reads(context, pending)
+
+        edits = [(edit.config, edit.entity.__class__.__name__, edit.action) for edit in pending]
+        if DeviceWriteScheduler.enabled():
+            return DeviceWriteScheduler.get(context).submit(edits)
+        return send_candidate(context, edits)
+
+    def _commit(self, context, pending):
+        self._invalidate_reads(context, pending)
+
+        if DeviceWriteScheduler.enabled():
+            return DeviceWriteScheduler.get(context).submit([(edit.config, edit.entity.__class__.__name__,
+                                                              edit.action) for edit in pending])
+        return send_merged(context, [edit.config for edit in pending])
+
+    @staticmethod
+    def resolve(results):
+        """Attribute the outcome of the flushed edits to the PairResults of the router update"""
+        for result in results:
+            if not isinstance(result, ny_base.PairResult):
+                continue
+
+            for host, response in list(result.results.items()):
+                if not isinstance(response, PendingEdit):
+                    continue
+                if response.error is not None:
+                    del result.results[host]
+                    result.errors[host] = response.error
+                else:
+                    result.results[host] = response.reply
+
+            if not result.success:
+                LOG.warning(result.errors)
+                result.raise_errors()
+
+        return results
@@ -0,0 +1,116 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Diff of the dict representation of an entity against the one of the device
+
+The records have the form of dictdiffer's: (type, path, [(key, value)]) for added and removed
+entries, (type, path, (neutron, device)) for changed values. Lists are not compared by position,
+equal entries are matched first, the remaining ones by the keys of their schema (see
+Schema.list_keys), so one entry more in a long list of NAT mappings or ACL rules is one diff
+and not one for every entry after it.
+"""
+
+ADD = 'add'
+REMOVE = 'remove'
+CHANGE = 'change'
+
+
+def _path(node):
+    if all(isinstance(key, str) and '.' not in key for key in node):
+        return '.'.join(node)
+    return list(node)
+
+
+def _frozen(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _frozen(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(_frozen(item) for item in value)
+    return value
+
+
+def _entry_key(entry, list_keys):
+    # entries are often wrapped in a single key, like the transport lists of a static NAT
+    while isinstance(entry, dict):
+        for item_key in list_keys:
+            if all(key in entry for key in item_key):
+                return item_key, _frozen(tuple(entry[key] for key in item_key))
+        if len(entry) != 1:
+            return None
+        entry = next(iter(entry.values()))
+
+
+class KeyedDiff(object):
+    def __init__(self, ignore=(), list_keys=()):
+        self.ignore = frozenset(ignore)
+        self.list_keys = list_keys
+
+    def diff(self, first, second, node=()):
+        """Differences from first, the neutron side, to second, the device side"""
+        if first == second:
+            return
+
+        if isinstance(first, dict) and isinstance(second, dict):
+            yield from self._diff_dicts(first, second, node)
+        elif isinstance(first, list) and isinstance(second, list):
+            yield from self._diff_lists(first, second, node)
+        else:
+            yield CHANGE, _path(node), (first, second)
+
+    def _diff_dicts(self, first, second, node):
+        for key, value in first.items():
+            if key in second and key not in self.ignore:
+                yield from self.diff(value, second[key], node + (key,))
+        for key, value in second.items():
+            if key not in first and key not in self.ignore:
+                yield ADD, _path(node), [(key, value)]
+        for key, value in first.items():
+            if key not in second and key not in self.ignore:
+                yield REMOVE, _path(node), [(key, value)]
+
+    def _diff_lists(self, first, second, node):
+        # equal entries cancel out, wherever they are in the list
+        unmatched = {}
+        for index, entry in enumerate(second):
+            unmatched.setdefault(_frozen(entry), []).append(index)
+        removed = []
+        for index, entry in enumerate(first):
+            indexes = unmatched.get(_frozen(entry))
+            if indexes:
+                indexes.pop(0)
+            else:
+                removed.append(index)
+        added = sorted(index for indexes in unmatched.values() for index in indexes)
+
+        # what is left is matched by key, changed entries are diffed entry by entry
+        keyed = {}
+        for index in added:
+            key = _entry_key(second[index], self.list_keys)
+            if key is not None:
+                keyed.setdefault(key, []).append(index)
+        paired = set()
+        for index in removed:
+            key = _entry_key(first[index], self.list_keys)
+            indexes = keyed.get(key) if key is not None else None
+            if indexes:
+                other = indexes.pop(0)
+                paired.add(other)
+                yield from self.diff(first[index], second[other], node + (index,))
+            else:
+                yield REMOVE, _path(node), [(index, first[index])]
+        for index in added:
+            if index not in paired:
+                yield ADD, _path(node), [(index, second[index])]
@@ -206,7 +206,7 @@ class BDIfMember(NyBase):
     @classmethod
     def __parameters__(cls):
         return [
-            {"key": "interface", "yang-key": L2Constants.INTERFACE},
+            {"key": "interface", "yang-key": L2Constants.INTERFACE, "id": True},
             {"key": "service_instances", "yang-key": L2Constants.BD_SERVICE_INSTANCE_LIST, "default": [],
              "type": [BDIfMemberServiceInstance]},
             {"key": "mark_deleted", "default": False},
@@ -248,7 +248,7 @@ class BDVIFMember(NyBase):
     @classmethod
     def __parameters__(cls):
         return [
-            {"key": "name"},
+            {"key": "name", "id": True},
             {"key": "mark_deleted", "default": False},
         ]
 
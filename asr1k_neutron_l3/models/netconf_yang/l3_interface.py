@@ -139,7 +139,7 @@ class VBInterface(NyBase):
             {'key': 'description'},
             {'key': 'mac_address'},
             {'key': 'mtu', 'default': VBInterface.MIN_MTU},
-            {'key': 'vrf', 'yang-path': 'vrf', 'yang-key': "forwarding"},
+            {'key': 'vrf', 'yang-path': 'vrf', 'yang-key': "forwarding", 'stub': True},
             {'key': 'ip_address', 'yang-path': 'ip/address', 'yang-key': "primary", 'type': VBIPrimaryIpAddress},
             {'key': 'secondary_ip_addresses', 'yang-path': 'ip/address', 'yang-key': "secondary",
              'type': [VBISecondaryIpAddress], 'default': [], 'validate':False},
@@ -275,7 +275,7 @@ class InterfaceDynamicNat(DynamicNat):
             {'key': 'interface', 'yang-key': 'name', 'yang-path': "interface"},
             {'key': 'redundancy'},
             {'key': 'mapping_id'},
-            {'key': 'vrf', 'yang-key': 'name', 'yang-path': "interface/vrf-new"},
+            {'key': 'vrf', 'yang-key': 'name', 'yang-path': "interface/vrf-new", 'stub': True},
             {'key': 'overload', 'yang-key': 'overload-new', 'yang-path': "interface/vrf-new",
              'yang-type': YANG_TYPE.EMPTY},
         ]
@@ -377,7 +377,7 @@ class PoolDynamicNat(DynamicNat):
         return [
             {"key": "id", "mandatory": True},
 
-            {'key': 'vrf', 'yang-key': 'name', 'yang-path': "pool/vrf-new"},
+            {'key': 'vrf', 'yang-key': 'name', 'yang-path': "pool/vrf-new", 'stub': True},
             {'key': 'redundancy', 'yang-key': 'name', 'yang-path': 'pool/redundancy-new'},
             {'key': 'mapping_id', 'yang-key': 'name', 'yang-path': 'pool/redundancy-new/mapping-id-new'},
             {'key': 'pool', 'yang-key': 'name', 'yang-path': "pool"},
@@ -655,7 +655,7 @@ class StaticNat(NyBase):
         return [
             {"key": "local_ip", "mandatory": True},
             {"key": "global_ip", "mandatory": True},
-            {'key': 'vrf'},
+            {'key': 'vrf', 'stub': True},
             {'key': 'redundancy'},
             {'key': 'mapping_id'},
             {'key': 'match_in_vrf', 'yang-type': YANG_TYPE.EMPTY, 'default': False},
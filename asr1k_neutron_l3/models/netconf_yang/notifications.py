@@ -0,0 +1,183 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Learn about config changes made by others from netconf-config-change notifications
+
+The device state cache, the config snapshot and the router fingerprints only know about the
+edits of this agent. A listener per device subscribes to the NETCONF stream on a session of
+its own and invalidates what a change made by somebody else (CLI, the peer agent) affects.
+Edits of the sessions of our ConnectionPool are ignored, changes that cannot be attributed
+flush the device. While the listener is not subscribed the device is unwatched, the agent then
+trusts nothing it knows about the device, see DeviceStateCache.unwatch().
+"""
+
+import re
+
+import eventlet
+from lxml import etree
+from ncclient import manager
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common import utils
+from asr1k_neutron_l3.models.connection import ConnectionPool
+from asr1k_neutron_l3.models.netconf_yang import snapshot
+from asr1k_neutron_l3.models.netconf_yang.state_cache import DeviceStateCache, VRF_ID
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.neutron.l3.fingerprint import RouterFingerprints
+
+LOG = logging.getLogger(__name__)
+
+NS_NETCONF_NOTIFICATIONS = "urn:ietf:params:xml:ns:yang:ietf-netconf-notifications"
+CONFIG_CHANGE_FILTER = '<netconf-config-change xmlns="{}"/>'.format(NS_NETCONF_NOTIFICATIONS)
+NOTIFICATION_STREAM = "NETCONF"
+
+# /ios:native/ios:vrf/ios:definition[ios:name='x'] -> steps and key values
+XPATH_STEP = re.compile(r"([^/\[\]]+)((?:\[[^\]]*\])*)")
+XPATH_KEY = re.compile(r"\[\s*(?:[\w.-]+:)?([\w.-]+)\s*=\s*['\"]([^'\"]*)['\"]\s*\]")
+
+
+def parse_target(xpath):
+    """Container path below <native> and key values of a changed node
+
+    Returns None for targets outside of <native>.
+    """
+    path = []
+    keys = []
+    for name, predicates in XPATH_STEP.findall(xpath):
+        path.append(name.split(':')[-1])
+        keys += [value for _, value in XPATH_KEY.findall(predicates)]
+
+    if not path or path[0] != xml_utils.IOS_NATIVE:
+        return None
+    return tuple(path[1:]), keys
+
+
+class ConfigChange(object):
+    def __init__(self, session_id, targets):
+        self.session_id = session_id
+        self.targets = targets
+
+    @classmethod
+    def from_xml(cls, xml):
+        root = etree.fromstring(xml.encode() if isinstance(xml, str) else xml)
+        change = next(root.iter('{%s}netconf-config-change' % NS_NETCONF_NOTIFICATIONS), None)
+        if change is None:
+            return None
+
+        session_id = change.findtext('{%s}changed-by/{%s}session-id' % (NS_NETCONF_NOTIFICATIONS,
+                                                                        NS_NETCONF_NOTIFICATIONS))
+        targets = [edit.findtext('{%s}target' % NS_NETCONF_NOTIFICATIONS) or ""
+                   for edit in change.iterfind('{%s}edit' % NS_NETCONF_NOTIFICATIONS)]
+        return cls(session_id, targets)
+
+
+class ConfigChangeListener(object):
+    def __init__(self, context):
+        self.context = context
+        self.own_sessions = set()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            DeviceStateCache().unwatch(self.context.host)
+            self._thread = eventlet.spawn(self._listen)
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+        DeviceStateCache().unwatch(self.context.host)
+
+    def _connect(self):
+        context = self.context
+        connection = manager.connect(host=context.host, port=context.yang_port,
+                                     username=context.username, password=context.password,
+                                     hostkey_verify=False, device_params={'name': "iosxe"},
+                                     timeout=context.nc_timeout, allow_agent=False, look_for_keys=False)
+        connection.create_subscription(filter=('subtree', CONFIG_CHANGE_FILTER), stream_name=NOTIFICATION_STREAM)
+        return connection
+
+    def _listen(self):
+        interval = cfg.CONF.asr1k.connection_check_interval
+        while self._running:
+            connection = None
+            try:
+                connection = self._connect()
+                LOG.debug("Listening for config changes on %s, session %s", self.context.host, connection.session_id)
+
+                # changes while we were not subscribed are unknown
+                self.flush()
+                DeviceStateCache().watch(self.context.host)
+                while self._running and connection.connected:
+                    notification = connection.take_notification(block=True, timeout=interval)
+                    if notification is not None:
+                        self.handle(notification.notification_xml)
+            except Exception as e:
+                LOG.warning("Config change listener of %s failed, reconnecting in %ss: %s",
+                            self.context.host, interval, e)
+            finally:
+                DeviceStateCache().unwatch(self.context.host)
+                if connection is not None:
+                    try:
+                        connection.close_session()
+                    except Exception:
+                        pass
+            if self._running:
+                self.flush()
+                eventlet.sleep(interval)
+
+    def _is_own(self, session_id):
+        if session_id is None:
+            return False
+        if session_id not in self.own_sessions:
+            # sessions of replaced connections stay known, session ids are not reused by the device
+            self.own_sessions |= {str(id) for id in ConnectionPool().session_ids(self.context.host)}
+        return session_id in self.own_sessions
+
+    def handle(self, xml):
+        try:
+            change = ConfigChange.from_xml(xml)
+        except etree.XMLSyntaxError as e:
+            LOG.warning("Ignoring unparseable notification from %s: %s", self.context.host, e)
+            return
+        if change is None or self._is_own(change.session_id):
+            return
+
+        LOG.debug("Config of %s changed by session %s: %s", self.context.host, change.session_id, change.targets)
+        for xpath in change.targets:
+            target = parse_target(xpath)
+            if target is not None:
+                self.invalidate(*target)
+
+    def invalidate(self, path, keys):
+        host = self.context.host
+        snapshot.ConfigSnapshots().invalidate_paths(host, {path})
+        DeviceStateCache().invalidate_paths(host, {path}, keys)
+
+        router_ids = {utils.vrf_id_to_uuid(vrf_id) for key in keys for vrf_id in VRF_ID.findall(key)}
+        if router_ids:
+            for router_id in router_ids:
+                RouterFingerprints().forget(router_id)
+        else:
+            DeviceStateCache().bump_generation(host)
+
+    def flush(self):
+        snapshot.ConfigSnapshots().invalidate_paths(self.context.host, {()})
+        DeviceStateCache().flush(self.context.host)
@@ -13,11 +13,11 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import contextlib
 import time
 
 import eventlet
 import eventlet.debug
-import dictdiffer
 import six
 
 
@@ -25,10 +25,16 @@ eventlet.debug.hub_exceptions(False)
 from oslo_log import log as logging
 from oslo_utils import uuidutils
 from asr1k_neutron_l3.common import asr1k_exceptions as exc
+from asr1k_neutron_l3.common import local_context
 from asr1k_neutron_l3.models import asr1k_pair
+from asr1k_neutron_l3.models.connection import CandidateEditFailed
 from asr1k_neutron_l3.models.connection import ConnectionManager
-from asr1k_neutron_l3.models.netconf_yang.xml_utils import JsonDict, OPERATION
+from asr1k_neutron_l3.models.netconf_yang.xml_utils import JsonDict, OPERATION, reply_xml
 from asr1k_neutron_l3.models.netconf_yang.bulk_operations import BulkOperations
+from asr1k_neutron_l3.models.netconf_yang import snapshot
+from asr1k_neutron_l3.models.netconf_yang.diff import KeyedDiff
+from asr1k_neutron_l3.models.netconf_yang.schema import Schema
+from asr1k_neutron_l3.models.netconf_yang.state_cache import DeviceStateCache
 from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
 from asr1k_neutron_l3.common.exc_helper import exc_info_full
 
@@ -40,6 +46,8 @@ from ncclient.operations.errors import TimeoutExpiredError
 
 LOG = logging.getLogger(__name__)
 
+CAPABILITY_WRITABLE_RUNNING = ':writable-running'
+
 
 class NC_OPERATION(object):
     DELETE = 'delete'
@@ -66,10 +74,9 @@ class Requeable(object):
         return []
 
 
-class IgnorePartialKeys(set):
-    def __contains__(self, key):
-        return super(IgnorePartialKeys, self).__contains__(key) or \
-            isinstance(key, tuple) and super(IgnorePartialKeys, self).__contains__(key[-1])
+def pair_contexts():
+    """Contexts execute_on_pair runs on, only the device of the pipeline within a DevicePipelines run"""
+    return local_context.get('device_contexts') or asr1k_pair.ASR1KPair().contexts
 
 
 class execute_on_pair(object):
@@ -83,9 +90,11 @@ class execute_on_pair(object):
     def _execute_method(self, *args, **kwargs):
         method = kwargs.pop('_method')
         result = kwargs.pop('_result')
+        bindings = kwargs.pop('_bindings')
         context = kwargs['context']
         try:
-            response = method(*args, **kwargs)
+            with local_context.bind(**bindings):
+                response = method(*args, **kwargs)
 
             # if we wrap in a wrapped method return the
             # base result
@@ -104,10 +113,12 @@ class execute_on_pair(object):
             result = self.result_type(args[0], method.__name__)
             if not self.return_raw:
                 pool = eventlet.GreenPool()
-                for context in asr1k_pair.ASR1KPair().contexts:
+                bindings = local_context.current()
+                for context in pair_contexts():
                     kwargs['context'] = context
                     kwargs['_method'] = method
                     kwargs['_result'] = result
+                    kwargs['_bindings'] = bindings
 
                     pool.spawn_n(self._execute_method, *args, **kwargs)
                 pool.waitall()
@@ -115,7 +126,7 @@ class execute_on_pair(object):
                 # Context passed explitly execute once and return
                 # base result
                 if kwargs.get('context') is None:
-                    kwargs['context'] = asr1k_pair.ASR1KPair().contexts[0]
+                    kwargs['context'] = pair_contexts()[0]
 
                 try:
                     response = method(*args, **kwargs)
@@ -332,7 +343,9 @@ class PairResult(object):
             for host in self.errors:
                 error = self.errors.get(host, None)
                 if hasattr(self.entity, 'to_xml'):
-                    result += "{}\n".format(self.entity.to_xml(context=None))
+                    # the edit that failed, serialised again only if it never was
+                    xml = self.entity.last_xml(host) or self.entity.to_xml(context=None)
+                    result += "{}\n".format(xml)
                 result += "{} : {} : {}\n".format(host, error.__class__.__name__, error)
 
         return result
@@ -403,6 +416,23 @@ class NyBase(BulkOperations):
     def __parameters__(cls):
         return []
 
+    # classes whose parameters refer to a class not defined yet
+    _uncompiled = []
+
+    def __init_subclass__(cls, **kwargs):
+        super(NyBase, cls).__init_subclass__(**kwargs)
+        # the schema is compiled with the class, or with a later one once the classes its parameters
+        # refer to further down the module are defined, see Schema.of() for the rest
+        cls._schema = None
+        NyBase._uncompiled.append(cls)
+        for entity_class in list(NyBase._uncompiled):
+            if entity_class.__dict__['_schema'] is None:
+                try:
+                    entity_class._schema = Schema(entity_class.__parameters__())
+                except NameError:
+                    continue
+            NyBase._uncompiled.remove(entity_class)
+
     def __init__(self, **kwargs):
         # Should we delete even if object reports not existing
         #
@@ -416,59 +446,33 @@ class NyBase(BulkOperations):
         self.raise_on_delete = True
         self.raise_on_valid = False
 
-        id_field = "id"
-        if self.__parameters__():
-            for param in self.__parameters__():
-                key = param.get('key')
-                yang_key = param.get('yang-key', key)
-                default = param.get('default')
-                mandatory = param.get('mandatory', False)
-
-                # use first id field, there can be only one
-                if param.get('id', False) and id_field == 'id':
-                    id_field = key
-
-                value = kwargs.get(key)
-                if value is None:
-                    value = kwargs.get(yang_key)
-                if value is None:
-                    value = kwargs.get(yang_key.replace("_", "-"))
-                if value is None and default is not None:
-                    value = default
+        schema = Schema.of(self.__class__)
+        if schema.parameters:
+            for param in schema.parameters:
+                value = None
+                for name in param.init_keys:
+                    value = kwargs.get(name)
+                    if value is not None:
+                        break
+                if value is None and param.default is not None:
+                    value = param.get_default()
 
                 if isinstance(value, int) and not isinstance(value, bool):
                     value = str(value)
 
-                if mandatory and value is None:
+                if param.mandatory and value is None:
                     pass
                     # raise Exception("Missing mandatory paramter {}".format(key))
+                elif isinstance(value, list):
+                    value = [param.convert(item) for item in value]
                 else:
-                    if isinstance(value, list):
-                        new_value = []
-                        for item in value:
-                            item = self._get_value(param, item)
-                            new_value.append(item)
-                        value = new_value
-                    else:
-                        value = self._get_value(param, value)
-                setattr(self, key, value)
+                    value = param.convert(value)
+                setattr(self, param.key, value)
 
             if self.PARENT in kwargs:
                 setattr(self, self.parent, kwargs)
 
-            self.__id_function__(id_field, **kwargs)
-
-    def _get_value(self, param, item):
-        type = param.get('type')
-
-        if isinstance(type, list):
-            type = type[0]
-
-        if type is not None and item is not None and not isinstance(item, type) and \
-                not isinstance(item, str) and not type == str:
-            return type(**item)
-
-        return item
+            self.__id_function__(schema.id_field, **kwargs)
 
     def __id_function__(self, id_field, **kwargs):
         self.id = str(kwargs.get(id_field))
@@ -510,11 +514,9 @@ class NyBase(BulkOperations):
         return self.__json_diff(self_json, other_json)
 
     def __json_diff(self, self_json, other_json):
-        ignore = [OPERATION]
-        for param in self.__parameters__():
-            if not param.get('validate', True):
-                ignore.append(param.get('key', param.get('yang-key')))
-        diff = self.__diffs_to_dicts(dictdiffer.diff(self_json, other_json, ignore=IgnorePartialKeys(ignore)))
+        schema = Schema.of(self.__class__)
+        keyed_diff = KeyedDiff(ignore=[OPERATION] + schema.ignore, list_keys=schema.list_keys)
+        diff = self.__diffs_to_dicts(keyed_diff.diff(self_json, other_json))
 
         return diff
 
@@ -548,42 +550,44 @@ class NyBase(BulkOperations):
 
     @classmethod
     def from_json(cls, json, context, parent=None):
+        if not bool(json):
+            return None
+
+        return cls(**cls._json_params(json, context, Schema.of(cls).parameters))
+
+    @classmethod
+    def _json_params(cls, json, context, parameters):
+        """Constructor arguments for the given parameters of the class, read from a device json"""
+        params = {
+            'from_device': True,
+        }
         try:
-            if not bool(json):
-                return None
-            params = {
-                'from_device': True,
-            }
-
-            for param in cls.__parameters__():
-                if param.get('deserialise', True):
-                    key = param.get('key', "")
-                    cisco_key = key.replace("_", "-")
-                    yang_key = param.get("yang-key", cisco_key)
-                    yang_path = param.get("yang-path")
-                    type = param.get("type")
+            for param in parameters:
+                if param.deserialise:
+                    key = param.key
+                    yang_key = param.json_key
+                    type = param.type
 
                     values = json
-                    if yang_path is not None:
-                        path = yang_path.split("/")
-                        for path_item in path:
+                    if param.yang_path is not None:
+                        for path_item in param.yang_path:
                             if bool(values):
                                 values = values.get(path_item)
                                 if isinstance(values, list):
                                     LOG.error("Unexpected list found for %s path %s values %s",
-                                              cls.__name__, yang_path, values)
+                                              cls.__name__, "/".join(param.yang_path), values)
                                 if bool(values) is None:
                                     LOG.error("Invalid yang segment %s in %s please check against yang model. "
-                                              "Values: %s", path_item, yang_path, values)
+                                              "Values: %s", path_item, "/".join(param.yang_path), values)
 
                     if bool(values):
-                        if param.get('yang-type') == YANG_TYPE.EMPTY:
+                        if param.yang_type == YANG_TYPE.EMPTY:
                             if yang_key in values:
                                 value = True
                             else:
                                 value = False
 
-                        elif isinstance(type, list) and param.get('root-list', False):
+                        elif isinstance(type, list) and param.root_list:
                             value = values
                         elif hasattr(values, 'get'):
                             value = values.get(yang_key)
@@ -618,7 +622,7 @@ class NyBase(BulkOperations):
         except Exception as e:
             LOG.exception(e)
 
-        return cls(**params)
+        return params
 
     @classmethod
     def get_primary_filter(cls, **kwargs):
@@ -648,17 +652,31 @@ class NyBase(BulkOperations):
                     nc_filter = cls.get_primary_filter(**kwargs)
 
             context = kwargs.get('context')
-            with ConnectionManager(context=context) as connection:
-                if xpath_filter:
-                    result = connection.xpath_get(filter=xpath_filter, entity=cls.__name__, action="get")
-                else:
-                    result = connection.get(filter=nc_filter, entity=cls.__name__, action="get")
-                result = cls.from_xml(result.xml, context)
-                if result is not None:
-                    # Add missing primary keys from get
-                    cls.__ensure_primary_keys(result, **kwargs)
+            prefetch = local_context.get('prefetch')
+            future = None
+            reply = None
+            if not xpath_filter:
+                reply = snapshot.ConfigSnapshots().get(context, cls, nc_filter)
+                if reply is None and prefetch is not None:
+                    reply = prefetch.combined_reply(context, cls, nc_filter)
+                if reply is None and prefetch is not None:
+                    future = prefetch.take(context, cls, nc_filter)
+
+            if reply is None:
+                with ConnectionManager(context=context, shared=True) as connection:
+                    if future is not None:
+                        reply = future.result()
+                    elif xpath_filter:
+                        reply = connection.xpath_get(filter=xpath_filter, entity=cls.__name__, action="get")
+                    else:
+                        reply = connection.get(filter=nc_filter, entity=cls.__name__, action="get")
 
-                    return result
+            result = cls.from_xml(reply_xml(reply), context)
+            if result is not None:
+                # Add missing primary keys from get
+                cls.__ensure_primary_keys(result, **kwargs)
+
+                return result
         except exc.DeviceUnreachable:
             pass
 
@@ -681,13 +699,13 @@ class NyBase(BulkOperations):
                     nc_filter = cls.get_all_filter(**kwargs.get('filter'))
 
             context = kwargs.get('context')
-            with ConnectionManager(context=context) as connection:
+            with ConnectionManager(context=context, shared=True) as connection:
                 if xpath_filter is not None:
                     rpc_result = connection.xpath_get(filter=xpath_filter, entity=cls.__name__, action="xpath_get_all")
                 else:
                     rpc_result = connection.get(filter=nc_filter, entity=cls.__name__, action="get_all")
 
-                json = cls.to_json(rpc_result.xml, context)
+                json = cls.to_json(reply_xml(rpc_result), context)
                 if json is not None:
                     json = json.get(cls.get_item_key(context), json)
 
@@ -710,20 +728,11 @@ class NyBase(BulkOperations):
     @classmethod
     def __ensure_primary_keys(cls, item, **kwargs):
         # Add missing primary keys from get
-        params = cls.__parameters_as_dict()
+        primary_keys = Schema.of(cls).primary_keys
         for key in kwargs.keys():
-            param = params.get(key, {})
-            if key != 'context' and param.get('primary_key', False):
+            if key != 'context' and key in primary_keys:
                 setattr(item, key, kwargs.get(key))
 
-    @classmethod
-    def __parameters_as_dict(cls):
-        result = {}
-        for param in cls.__parameters__():
-            result[param.get('key')] = param
-
-        return result
-
     @classmethod
     def _exists(cls, **kwargs):
         try:
@@ -738,6 +747,9 @@ class NyBase(BulkOperations):
         return False
 
     def _internal_exists(self, context):
+        if DeviceStateCache().get(context, self) is not None:
+            return True
+
         kwargs = self.__dict__
         kwargs['context'] = context
         return self.__class__._exists(**kwargs)
@@ -758,12 +770,7 @@ class NyBase(BulkOperations):
 
     @retry_on_failure()
     def _create(self, context):
-        with ConnectionManager(context=context) as connection:
-
-            result = connection.edit_config(config=self.to_xml(context, operation=NC_OPERATION.PUT),
-                                            entity=self.__class__.__name__,
-                                            action="create")
-            return result
+        return self._edit_config(context, self.to_xml(context, operation=NC_OPERATION.PUT), "create", state=self)
 
     @execute_on_pair()
     def update(self, context, method=NC_OPERATION.PATCH):
@@ -773,22 +780,23 @@ class NyBase(BulkOperations):
     def _update(self, context, method=NC_OPERATION.PATCH, json=None, preflight=True, postflight=False,
                 internal_validate=True):
         if not internal_validate or len(self._internal_validate(context=context)) > 0:
-            if preflight:
-                self.preflight(context)
-            if postflight:
-                self.postflight(context, method)
+            with self._outside_changeset(context):
+                if preflight:
+                    self.preflight(context)
+                if postflight:
+                    self.postflight(context, method)
 
-            with ConnectionManager(context=context) as connection:
-                if json is None:
-                    json = self.to_dict(context=context)
+            # only the full representation of the entity tells the state of the device after the edit
+            state = None
+            if json is None:
+                json = self.to_dict(context=context)
+                state = self
 
-                if method not in [NC_OPERATION.PATCH, NC_OPERATION.PUT]:
-                    raise Exception('Update should be called with method = NC_OPERATION.PATCH | NC_OPERATION.PUT')
+            if method not in [NC_OPERATION.PATCH, NC_OPERATION.PUT]:
+                raise Exception('Update should be called with method = NC_OPERATION.PATCH | NC_OPERATION.PUT')
 
-                result = connection.edit_config(config=self.to_xml(context, operation=method, json=json),
-                                                entity=self.__class__.__name__,
-                                                action="update")
-                return result
+            return self._edit_config(context, self.to_xml(context, operation=method, json=json), "update",
+                                     state=state)
 
     @execute_on_pair()
     def delete(self, context, method=NC_OPERATION.DELETE, postflight=True):
@@ -796,22 +804,75 @@ class NyBase(BulkOperations):
 
     @retry_on_failure()
     def _delete(self, context, method=NC_OPERATION.DELETE, postflight=True):
-        self._delete_no_retry(context, method, postflight=postflight)
+        return self._delete_no_retry(context, method, postflight=postflight)
 
     def _delete_no_retry(self, context, method=NC_OPERATION.DELETE, postflight=True):
         if postflight:
-            self.postflight(context, method)
+            with self._outside_changeset(context):
+                self.postflight(context, method)
 
+        if self._internal_exists(context) or self.force_delete:
+            json = self.to_delete_dict(context)
+            return self._edit_config(context, self.to_xml(context, json=json, operation=method), "delete")
+
+    @contextlib.contextmanager
+    def _outside_changeset(self, context):
+        # Pre- and postflight cleanups read the device and their edits have to be on it before the
+        # edit of this entity. So the edits collected for the device so far are sent first and the
+        # cleanups go out right away, raising their errors here instead of on an unattributed PendingEdit
+        changeset = local_context.get('changeset')
+        if changeset is None:
+            yield
+            return
+
+        changeset.flush_host(context.host)
+        with local_context.bind(changeset=None):
+            yield
+
+    def _edit_config(self, context, config, action, state=None):
+        # Inside a router changeset the edit is only registered and sent together with
+        # the rest of the router, the caller gets a PendingEdit resolved on flush.
+        # state is the entity as the device has it after a successful edit, if known
+        changeset = local_context.get('changeset')
+        if changeset is not None:
+            return changeset.add(self, context, config, action, state=state)
+
+        return self._send_edit(context, config, action, state=state)
+
+    def _send_edit(self, context, config, action, state=None):
+        prefetch = local_context.get('prefetch')
+        if prefetch is not None:
+            prefetch.invalidate(context, config)
+        snapshot.ConfigSnapshots().invalidate(context, config)
+        DeviceStateCache().invalidate(context, config)
+
+        reply = self._send_edit_config(context, config, action)
+        if state is not None and reply is not None and getattr(reply, 'ok', True):
+            DeviceStateCache().store(context, self, state)
+        return reply
+
+    def _send_edit_config(self, context, config, action):
+        # A candidate transaction (lock, edit, validate, commit) pays off for the edits a changeset
+        # batches, a single edit goes to running unless the device only allows writes via the candidate
+        with ConnectionManager(context=context, shared=True) as connection:
+            if not context.use_candidate or connection.has_capability(CAPABILITY_WRITABLE_RUNNING):
+                return connection.edit_config(config=config, entity=self.__class__.__name__, action=action)
+
+        # candidate edits hold the datastore lock on the session, so they need one for themselves
         with ConnectionManager(context=context) as connection:
-            if self._internal_exists(context) or self.force_delete:
-                json = self.to_delete_dict(context)
-                result = connection.edit_config(config=self.to_xml(context, json=json, operation=method),
-                                                entity=self.__class__.__name__,
-                                                action="delete")
-                return result
+            try:
+                return connection.commit_candidate([(config, self.__class__.__name__, action)])[0]
+            except CandidateEditFailed as e:
+                raise e.error
+
+    @retry_on_failure()
+    def _send_edit_with_retry(self, context, config, action, state=None):
+        return self._send_edit(context, config, action, state=state)
 
     def _internal_validate(self, context, should_be_none=False):
-        device_config = self._internal_get(context=context)
+        device_config = DeviceStateCache().get(context, self)
+        if device_config is None:
+            device_config = self._internal_get(context=context)
 
         if should_be_none:
             if device_config is None:
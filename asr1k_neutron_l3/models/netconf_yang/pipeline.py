@@ -0,0 +1,154 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+
+import eventlet
+from eventlet import event
+from eventlet import timeout as eventlet_timeout
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common import asr1k_exceptions as exc
+from asr1k_neutron_l3.common import local_context
+from asr1k_neutron_l3.models import asr1k_pair
+from asr1k_neutron_l3.models.netconf_yang import ny_base
+
+LOG = logging.getLogger(__name__)
+
+
+def merge_results(results):
+    """One list of PairResults from the result lists the pipelines of the same update returned"""
+    first = results[0]
+    if isinstance(first, ny_base.PairResult):
+        for other in results[1:]:
+            if isinstance(other, ny_base.PairResult) and other is not first:
+                first.results.update(other.results)
+                first.errors.update(other.errors)
+        return first
+    if isinstance(first, list):
+        return [merge_results([result for result in items if result is not None])
+                for items in itertools.zip_longest(*results)]
+    return first
+
+
+class DevicePipeline(object):
+    def __init__(self, context, apply, bindings):
+        self.context = context
+        self.apply = apply
+        self.bindings = bindings
+        self.done = event.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            with local_context.bind(**dict(self.bindings, device_contexts=[self.context])):
+                self.done.send(self.apply())
+        except BaseException as e:
+            LOG.error("Pipeline on %s failed: %s", self.context.host, e)
+            self.error = e
+            self.done.send(None)
+
+
+class DeviceRun(object):
+    """The pipeline of a router running on a device and the one to run after it"""
+
+    def __init__(self, pipeline):
+        self.current = pipeline
+        self.follow_up = None
+
+
+class DevicePipelines(object):
+    """Apply the edits of a router update on every device at the pace of that device
+
+    execute_on_pair runs each entity operation on all devices and waits for the slowest one,
+    so a slow or flapping device holds up the update of the other one step by step. Here the
+    whole update runs once per device instead, each run with execute_on_pair restricted to its
+    device. The PairResults of the runs are merged once all are finished, or after
+    device_pipeline_timeout seconds. A run that did not finish in time goes on in the background
+    and the update is requeued with a DevicePipelineTimeout. Updates of the same router arriving
+    on that device meanwhile are coalesced into one follow-up run, with the latest update only,
+    which starts once the background run is finished.
+    """
+    # (router id, host) -> DeviceRun of that router on that device
+    _running = {}
+
+    @staticmethod
+    def enabled():
+        return cfg.CONF.asr1k_l3.pipeline_device_updates
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout if timeout is not None else cfg.CONF.asr1k_l3.device_pipeline_timeout
+
+    def __str__(self):
+        return "pipelines {}".format(self.name)
+
+    def _start(self, context, apply, bindings):
+        key = (self.name, context.host)
+        device_run = self._running.get(key)
+        if device_run is not None:
+            if device_run.follow_up is None:
+                device_run.follow_up = DevicePipeline(context, apply, bindings)
+            else:
+                # the update waiting already is stale, its callers get the result of this one
+                device_run.follow_up.apply = apply
+                device_run.follow_up.bindings = bindings
+            return device_run.follow_up
+
+        pipeline = DevicePipeline(context, apply, bindings)
+        device_run = self._running[key] = DeviceRun(pipeline)
+
+        def run():
+            try:
+                while device_run.current is not None:
+                    device_run.current.run()
+                    device_run.current, device_run.follow_up = device_run.follow_up, None
+            finally:
+                if self._running.get(key) is device_run:
+                    del self._running[key]
+
+        eventlet.spawn_n(run)
+        return pipeline
+
+    def run(self, apply):
+        bindings = local_context.current()
+        pipelines = [self._start(context, apply, bindings) for context in asr1k_pair.ASR1KPair().contexts]
+
+        with eventlet_timeout.Timeout(self.timeout or None, False):
+            for pipeline in pipelines:
+                pipeline.done.wait()
+
+        lagging = [pipeline for pipeline in pipelines if not pipeline.done.ready()]
+        finished = [pipeline for pipeline in pipelines if pipeline.done.ready()]
+        failed = [pipeline for pipeline in finished if pipeline.error is not None]
+        succeeded = [pipeline for pipeline in finished if pipeline.error is None]
+
+        if failed:
+            if succeeded:
+                LOG.warning("%s failed on %s, results of %s: %s", self,
+                            ", ".join(pipeline.context.host for pipeline in failed),
+                            ", ".join(pipeline.context.host for pipeline in succeeded),
+                            merge_results([pipeline.done.wait() for pipeline in succeeded]))
+            raise failed[0].error
+
+        if lagging:
+            LOG.warning("%s did not finish on %s within %ss, it goes on in the background", self,
+                        ", ".join(pipeline.context.host for pipeline in lagging), self.timeout)
+            raise exc.DevicePipelineTimeout(host=lagging[0].context.host, router_id=self.name,
+                                            timeout=self.timeout)
+
+        return merge_results([pipeline.done.wait() for pipeline in finished])
@@ -0,0 +1,284 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+
+import eventlet
+from eventlet import event
+from lxml import etree
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common import local_context
+from asr1k_neutron_l3.models.connection import ConnectionManager
+from asr1k_neutron_l3.models.connection import ConnectionPool
+from asr1k_neutron_l3.models.netconf_yang import ny_base
+from asr1k_neutron_l3.models.netconf_yang import snapshot
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.netconf_yang.xml_utils import config_paths, element_children, find_native, paths_overlap
+
+LOG = logging.getLogger(__name__)
+
+
+def _drain(future):
+    # a pipelined reply has to be read to free its in-flight slot on the session
+    try:
+        future.result()
+    except BaseException:
+        pass
+
+
+def _qualify(element, namespace):
+    # unqualified filters rely on the device matching any namespace, once merged below a
+    # qualified <native> they have to carry the namespace of their parent themselves
+    name = etree.QName(element)
+    if name.namespace is None:
+        element.tag = '{%s}%s' % (namespace, name.localname)
+    else:
+        namespace = name.namespace
+    for child in element_children(element):
+        _qualify(child, namespace)
+
+
+def _edited_paths(config):
+    try:
+        native = find_native(config)
+    except etree.XMLSyntaxError:
+        native = None
+    return {()} if native is None else config_paths(native)
+
+
+def _content_matches(element):
+    return frozenset((child.tag, (child.text or "").strip()) for child in element_children(element)
+                     if not element_children(child) and (child.text or "").strip())
+
+
+def _selections(element):
+    return [child for child in element_children(element)
+            if element_children(child) or not (child.text or "").strip()]
+
+
+def _merge_filter(parent, element):
+    # nodes with the same content matches select the same containers or list entries, their
+    # selections are merged, a node without selections selects the whole subtree
+    for existing in element_children(parent):
+        if existing.tag != element.tag or _content_matches(existing) != _content_matches(element):
+            continue
+        if not _selections(existing):
+            return
+        if not _selections(element):
+            for child in _selections(existing):
+                existing.remove(child)
+            return
+        for child in _selections(element):
+            _merge_filter(existing, child)
+        return
+
+    parent.append(element)
+
+
+def merge_filters(filters):
+    """Merge the subtree filters of several entities into one <native> filter"""
+    native = etree.Element('{%s}%s' % (xml_utils.NS_CISCO_NATIVE, xml_utils.IOS_NATIVE),
+                           nsmap={None: xml_utils.NS_CISCO_NATIVE})
+    for nc_filter in filters:
+        fragment = copy.deepcopy(find_native(nc_filter))
+        _qualify(fragment, xml_utils.NS_CISCO_NATIVE)
+        for child in element_children(fragment):
+            _merge_filter(native, child)
+
+    return etree.tostring(native).decode()
+
+
+class CombinedGet(object):
+    """One get for the filters of all entities of a router on a device
+
+    With pipelining the get is sent right away, otherwise by the first entity asking for its
+    reply. Each entity gets the part of the reply its own filter selects.
+    """
+
+    def __init__(self, context, filters):
+        self.context = context
+        self.nc_filter = merge_filters(filters)
+        self._future = None
+        self._native = None
+
+    def send(self):
+        connection = ConnectionPool().shared_connection(self.context)
+        self._future = connection.submit('get', filter=('subtree', self.nc_filter), entity="Router",
+                                         action="combined_get")
+
+    def native(self):
+        if self._native is None:
+            self._native = event.Event()
+            try:
+                if self._future is not None:
+                    reply = self._future.result()
+                else:
+                    with ConnectionManager(context=self.context, shared=True) as connection:
+                        reply = connection.get(filter=self.nc_filter, entity="Router", action="combined_get")
+                native = find_native(reply.xml)
+                if native is None:
+                    native = etree.Element('{%s}%s' % (xml_utils.NS_CISCO_NATIVE, xml_utils.IOS_NATIVE))
+                self._native.send(native)
+            except BaseException as e:
+                self._native.send_exception(e)
+
+        return self._native.wait()
+
+    def drain(self):
+        if self._future is not None and self._native is None:
+            self._native = event.Event()
+            self._native.send(None)
+            eventlet.spawn_n(_drain, self._future)
+
+
+class FilteredReply(object):
+    """Future like part of a CombinedGet selected by the filter of one entity"""
+
+    def __init__(self, combined, nc_filter):
+        self.combined = combined
+        self.nc_filter = nc_filter
+
+    def result(self):
+        return snapshot.SnapshotReply(snapshot.filtered_reply(self.combined.native(), find_native(self.nc_filter)))
+
+
+class Prefetch(object):
+    """Send the gets of a router update pipelined before the entities are processed
+
+    Every entity of a router update starts with a get of its device config to find out if an
+    edit is needed. With pipelining enabled these gets are all sent upfront, NyBase._get then
+    picks up the reply of its filter instead of sending the get itself. An edit invalidates the
+    outstanding prefetches on that device whose filter selects config the edit touches, whatever
+    entity type they were sent for.
+
+    With combined_router_get the filters of all entities are merged into one get per device
+    instead, see CombinedGet.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._futures = {}
+        self._paths = {}
+        self._combined = []
+        self._binding = None
+
+    def __str__(self):
+        return "prefetch {}".format(self.name)
+
+    def __enter__(self):
+        self._binding = local_context.bind(prefetch=self)
+        self._binding.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._binding.__exit__(None, None, None)
+        self._binding = None
+        self.discard()
+        return False
+
+    @classmethod
+    def current(cls):
+        return local_context.get('prefetch')
+
+    @staticmethod
+    def enabled():
+        return ConnectionPool().pipelining or cfg.CONF.asr1k_l3.combined_router_get
+
+    @staticmethod
+    def _key(context, cls, nc_filter):
+        return context.host, cls.__name__, nc_filter
+
+    def submit(self, entities):
+        pool = ConnectionPool()
+        combine = cfg.CONF.asr1k_l3.combined_router_get
+        for context in ny_base.pair_contexts():
+            if not context.alive:
+                continue
+
+            filters = {}
+            for entity in entities:
+                cls = entity.__class__
+                try:
+                    nc_filter = cls.get_primary_filter(**dict(entity.__dict__, context=context))
+                    if combine and find_native(nc_filter) is None:
+                        raise ValueError("filter has no native container")
+                except Exception as e:
+                    LOG.debug("Not prefetching %s for %s: %s", cls.__name__, self.name, e)
+                    continue
+
+                key = self._key(context, cls, nc_filter)
+                if key not in self._futures and key not in filters:
+                    filters[key] = nc_filter
+                    self._paths[key] = _edited_paths(nc_filter)
+
+            if not filters:
+                continue
+
+            try:
+                if combine:
+                    combined = CombinedGet(context, set(filters.values()))
+                    if pool.pipelining:
+                        combined.send()
+                    self._combined.append(combined)
+                    for key, nc_filter in filters.items():
+                        self._futures[key] = FilteredReply(combined, nc_filter)
+                else:
+                    connection = pool.shared_connection(context)
+                    for key, nc_filter in filters.items():
+                        self._futures[key] = connection.submit('get', filter=('subtree', nc_filter),
+                                                               entity=key[1], action="prefetch")
+            except Exception as e:
+                LOG.debug("Prefetch for %s failed on %s: %s", self.name, context.host, e)
+
+    def _pop(self, key):
+        self._paths.pop(key, None)
+        return self._futures.pop(key)
+
+    def take(self, context, cls, nc_filter):
+        key = self._key(context, cls, nc_filter)
+        if key in self._futures:
+            return self._pop(key)
+
+    def combined_reply(self, context, cls, nc_filter):
+        """Reply of a combined get, to be read without holding a connection as it may do the get itself"""
+        key = self._key(context, cls, nc_filter)
+        if isinstance(self._futures.get(key), FilteredReply):
+            return self._pop(key).result()
+
+    def invalidate(self, context, config):
+        """Drop the prefetches of the device a following edit of config may make stale"""
+        paths = _edited_paths(config)
+        for key, future in list(self._futures.items()):
+            if key[0] != context.host or \
+                    not any(paths_overlap(path, other) for path in paths for other in self._paths[key]):
+                continue
+            # the reply of a combined get may have been read before the edit, the entity gets anew
+            self._pop(key)
+            if not isinstance(future, FilteredReply):
+                eventlet.spawn_n(_drain, future)
+
+    def discard(self):
+        futures, self._futures = self._futures, {}
+        self._paths = {}
+        for future in futures.values():
+            if not isinstance(future, FilteredReply):
+                eventlet.spawn_n(_drain, future)
+
+        combined, self._combined = self._combined, []
+        for get in combined:
+            get.drain()
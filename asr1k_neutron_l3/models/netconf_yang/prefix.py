@@ -75,6 +75,11 @@ class Prefix(NyBase):
             {'key': 'seq', 'type': [PrefixSeq], 'default': []}
         ]
 
+    @classmethod
+    def get_stub_item_path(cls, context):
+        # entries of the same prefix list are merged across the whole reply, see remove_wrapper()
+        return None
+
     @classmethod
     def remove_wrapper(cls, dict, context):
         dict = super().remove_wrapper(dict, context)
@@ -0,0 +1,126 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compiled form of the __parameters__ of a NyBase class
+
+__parameters__() builds a new list of dicts on every call, with everything derived from it
+(yang keys, paths, converters) computed again for every object. The schema of a class is
+compiled once, when the class is created, and shared by all its instances. Classes whose
+parameters refer to a class defined further down their module are compiled along with a later
+class, at the latest on first use.
+"""
+
+import copy
+
+
+class Parameter(object):
+    __slots__ = ['key', 'init_keys', 'json_key', 'yang_path', 'yang_type', 'default', 'mandatory', 'id',
+                 'primary_key', 'type', 'item_type', 'root_list', 'deserialise', 'validate', 'ignore_key', 'stub']
+
+    def __init__(self, param):
+        self.key = param.get('key')
+        yang_key = param.get('yang-key', self.key)
+        # keyword arguments an object is constructed from, in order of precedence
+        self.init_keys = tuple(dict.fromkeys([self.key, yang_key, yang_key.replace("_", "-")]))
+        self.json_key = param.get('yang-key', (self.key or "").replace("_", "-"))
+        yang_path = param.get('yang-path')
+        self.yang_path = tuple(yang_path.split("/")) if yang_path is not None else None
+        self.yang_type = param.get('yang-type')
+        self.default = param.get('default')
+        self.mandatory = param.get('mandatory', False)
+        self.id = param.get('id', False)
+        self.primary_key = param.get('primary_key', False)
+        self.type = param.get('type')
+        self.item_type = self.type[0] if isinstance(self.type, list) else self.type
+        self.root_list = param.get('root-list', False)
+        self.deserialise = param.get('deserialise', True)
+        self.validate = param.get('validate', True)
+        self.ignore_key = param.get('key', param.get('yang-key'))
+        # kept by the stubs of device inventories, besides id, primary keys and mandatory parameters
+        self.stub = param.get('stub', False)
+
+    def get_default(self):
+        # defaults are shared by all objects of the class, mutable ones are handed out as copies
+        if isinstance(self.default, (list, dict)):
+            return copy.copy(self.default)
+        return self.default
+
+    def convert(self, item):
+        item_type = self.item_type
+        if item_type is not None and item is not None and not isinstance(item, item_type) and \
+                not isinstance(item, str) and not item_type == str:
+            return item_type(**item)
+
+        return item
+
+
+class Schema(object):
+    __slots__ = ['parameters', 'by_key', 'id_field', 'primary_keys', 'ignore', 'stub_parameters', '_list_keys']
+
+    def __init__(self, parameters):
+        self.parameters = [Parameter(param) for param in parameters]
+        self.by_key = {param.key: param for param in self.parameters}
+
+        # use first id field, there can be only one
+        self.id_field = "id"
+        for param in self.parameters:
+            if param.id and self.id_field == "id":
+                self.id_field = param.key
+        self.primary_keys = frozenset(param.key for param in self.parameters if param.primary_key)
+        # keys excluded from diffs
+        self.ignore = [param.ignore_key for param in self.parameters if not param.validate]
+        # what an EntityStub holds: the parameters identifying an entity and those its orphan checks read
+        self.stub_parameters = tuple(param for param in self.parameters
+                                     if param.key == self.id_field or param.id or param.primary_key or
+                                     param.mandatory or param.stub)
+        self._list_keys = None
+
+    @property
+    def item_key(self):
+        """The yang keys identifying an entry of this class in a list, None if there are none"""
+        param = self.by_key.get(self.id_field)
+        if param is not None:
+            return (param.json_key,)
+        mandatory = tuple(param.json_key for param in self.parameters if param.mandatory)
+        return mandatory or None
+
+    @property
+    def list_keys(self):
+        """Item keys of the nested types of this class, list entries in a diff are matched by them"""
+        if self._list_keys is None:
+            list_keys = []
+            pending = [self]
+            seen = set()
+            while pending:
+                schema = pending.pop(0)
+                if id(schema) in seen:
+                    continue
+                seen.add(id(schema))
+                if schema is not self and schema.item_key is not None and schema.item_key not in list_keys:
+                    list_keys.append(schema.item_key)
+                pending.extend(Schema.of(param.item_type) for param in schema.parameters
+                               if hasattr(param.item_type, '__parameters__'))
+            self._list_keys = tuple(list_keys)
+        return self._list_keys
+
+    @classmethod
+    def of(cls, entity_class):
+        """The schema of a NyBase class, compiled here if that did not happen at class creation"""
+        schema = entity_class.__dict__.get('_schema')
+        if schema is None:
+            schema = cls(entity_class.__parameters__())
+            entity_class._schema = schema
+        return schema
@@ -0,0 +1,211 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Running config snapshot of each device, taken once per sync cycle
+
+Sync updates compare every entity of a router with the device before deciding on an edit,
+which costs one get per entity and device. With the snapshot enabled the full <native> tree
+is fetched once per device and sync cycle, the subtree filters of NyBase._get are then
+evaluated locally against it. Edits mark the containers they touch as dirty, reads below a
+dirty container go to the device again for the rest of the cycle.
+"""
+
+import copy
+
+from eventlet import event
+from lxml import etree
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common import local_context
+from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
+from asr1k_neutron_l3.models.connection import ConnectionManager
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.netconf_yang.xml_utils import config_paths, element_children, find_native, paths_overlap
+
+LOG = logging.getLogger(__name__)
+
+FULL_CONFIG_FILTER = """<native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native"></native>"""
+
+
+def _matches(element, pattern):
+    # unqualified filter nodes match any namespace, like on the device
+    if not isinstance(element.tag, str):
+        return False
+    name = etree.QName(element)
+    pattern = etree.QName(pattern)
+    if name.localname != pattern.localname:
+        return False
+    return pattern.namespace is None or name.namespace == pattern.namespace
+
+
+def _text(element):
+    return (element.text or "").strip()
+
+
+def apply_filter(data, nc_filter):
+    """Evaluate a NETCONF subtree filter (RFC 6241 6.2) against a data element
+
+    Returns a copy of the selected parts of data or None if nothing matched.
+    """
+    filter_children = element_children(nc_filter)
+    if not filter_children:
+        return copy.deepcopy(data)
+
+    content_matches = [child for child in filter_children if not element_children(child) and _text(child)]
+    for match in content_matches:
+        if not any(_matches(child, match) and _text(child) == _text(match) for child in element_children(data)):
+            return None
+
+    others = [child for child in filter_children if child not in content_matches]
+    if not others:
+        return copy.deepcopy(data)
+
+    result = etree.Element(data.tag, attrib=data.attrib, nsmap=data.nsmap)
+    for child in element_children(data):
+        if any(_matches(child, match) for match in content_matches):
+            result.append(copy.deepcopy(child))
+
+    selected = False
+    for pattern in others:
+        for child in element_children(data):
+            if _matches(child, pattern):
+                sub = apply_filter(child, pattern)
+                if sub is not None:
+                    result.append(sub)
+                    selected = True
+
+    if not selected and not content_matches:
+        return None
+    return result
+
+
+def filtered_reply(native, nc_filter):
+    """The rpc-reply a get with the subtree filter nc_filter would get from a device with config native"""
+    reply = etree.Element('{%s}%s' % (xml_utils.NS_NETCONF_BASE, xml_utils.RPC_REPLY))
+    data = etree.SubElement(reply, '{%s}%s' % (xml_utils.NS_NETCONF_BASE, xml_utils.DATA))
+    result = apply_filter(native, nc_filter)
+    if result is not None:
+        data.append(result)
+    return etree.tostring(reply).decode()
+
+
+class DeviceSnapshot(object):
+    def __init__(self, host):
+        self.host = host
+        self.native = None
+        self.dirty = set()
+        self._fetched = None
+
+    def fetch(self, context):
+        if self._fetched is None:
+            self._fetched = event.Event()
+            try:
+                with ConnectionManager(context=context, shared=True) as connection:
+                    reply = connection.get(filter=FULL_CONFIG_FILTER, entity=self.__class__.__name__,
+                                           action="snapshot")
+                self.native = find_native(reply.xml)
+                if self.native is None:
+                    self.native = etree.Element('{%s}%s' % (xml_utils.NS_CISCO_NATIVE, xml_utils.IOS_NATIVE))
+            except Exception as e:
+                LOG.warning("Could not take config snapshot of %s, reading from the device this cycle: %s",
+                            self.host, e)
+            finally:
+                self._fetched.send()
+        else:
+            self._fetched.wait()
+
+        return self.native
+
+    def get(self, context, nc_filter):
+        """The rpc-reply the device would send for a subtree get or None to read from the device"""
+        try:
+            nc_filter = find_native(nc_filter)
+        except etree.XMLSyntaxError:
+            return None
+        if nc_filter is None:
+            return None
+        if any(paths_overlap(path, dirty) for path in config_paths(nc_filter) for dirty in self.dirty):
+            return None
+
+        native = self.fetch(context)
+        if native is None:
+            return None
+
+        return filtered_reply(native, nc_filter)
+
+    def invalidate(self, config):
+        try:
+            native = find_native(config)
+        except etree.XMLSyntaxError:
+            native = None
+        if native is None:
+            self.dirty.add(())
+        else:
+            self.dirty |= config_paths(native)
+
+    def invalidate_paths(self, paths):
+        self.dirty |= set(paths)
+
+
+class SnapshotReply(object):
+    def __init__(self, xml):
+        self.xml = xml
+
+
+class ConfigSnapshots(object):
+    """Snapshots of the sync cycle, used by greenlets that have 'snapshot' bound in local_context"""
+    __instance = None
+
+    def __new__(cls):
+        if ConfigSnapshots.__instance is None:
+            ConfigSnapshots.__instance = object.__new__(cls)
+            ConfigSnapshots.__instance.snapshots = {}
+
+        return ConfigSnapshots.__instance
+
+    @staticmethod
+    def enabled():
+        return cfg.CONF.asr1k_l3.sync_config_snapshot
+
+    def new_cycle(self):
+        self.snapshots = {}
+
+    def _snapshot(self, host):
+        if host not in self.snapshots:
+            self.snapshots[host] = DeviceSnapshot(host)
+        return self.snapshots[host]
+
+    def get(self, context, cls, nc_filter):
+        if not local_context.get('snapshot'):
+            return None
+
+        xml = self._snapshot(context.host).get(context, nc_filter)
+        PrometheusMonitor().config_snapshot_reads.labels(device=context.host, entity=cls.__name__,
+                                                         result="miss" if xml is None else "hit").inc()
+        if xml is not None:
+            return SnapshotReply(xml)
+
+    def invalidate(self, context, config):
+        # a snapshot taken after the edit has it already
+        snapshot = self.snapshots.get(context.host)
+        if snapshot is not None:
+            snapshot.invalidate(config)
+
+    def invalidate_paths(self, host, paths):
+        snapshot = self.snapshots.get(host)
+        if snapshot is not None:
+            snapshot.invalidate_paths(paths)
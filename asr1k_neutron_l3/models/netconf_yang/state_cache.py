@@ -0,0 +1,179 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import re
+import time
+
+from lxml import etree
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common import utils
+from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
+from asr1k_neutron_l3.models.netconf_yang.xml_utils import config_paths, find_native, paths_overlap
+
+LOG = logging.getLogger(__name__)
+
+DELETE_OPERATIONS = ['operation="delete"', 'operation="remove"']
+
+# routers are known on the device by their VRF id, which shows up in the keys of most of their config
+VRF_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class CacheEntry(object):
+    __slots__ = ['state', 'paths', 'expires']
+
+    def __init__(self, state, paths, expires):
+        self.state = state
+        self.paths = paths
+        self.expires = expires
+
+
+class DeviceStateCache(object):
+    """Last known device state of the entities this agent wrote, per device
+
+    A successful edit stores the entity it sent for device_state_cache_ttl seconds, the validation
+    before the next edit then diffs against it instead of reading the device.
+    Every edit drops the entries below the containers it touches, deletes drop all entries of the
+    device as they may take dependent config along (e.g. the routes of a VRF). A device marked as
+    dead loses all its entries.
+
+    The generation of a device changes whenever the agent can no longer tell what changed on the
+    device, e.g. after a reconnect. Deletes only move on the generations of the VRFs whose config
+    they may take along: the one of the router sending them and those named in the deleted config.
+    Deletes naming no VRF move on the generation of the device. Generations are kept even with the
+    cache disabled. A device marked unwatched, whose config change listener is not subscribed, has
+    no entries and moves on its generation on every read.
+    """
+    __instance = None
+
+    def __new__(cls):
+        if DeviceStateCache.__instance is None:
+            DeviceStateCache.__instance = object.__new__(cls)
+            DeviceStateCache.__instance.entries = collections.OrderedDict()
+            DeviceStateCache.__instance.generations = collections.Counter()
+            DeviceStateCache.__instance.unwatched = set()
+
+        return DeviceStateCache.__instance
+
+    @staticmethod
+    def enabled():
+        return cfg.CONF.asr1k.device_state_cache_ttl > 0
+
+    @staticmethod
+    def _key(context, entity):
+        try:
+            nc_filter = entity.get_primary_filter(**dict(entity.__dict__, context=context))
+        except Exception:
+            return None, None
+        return (context.host, entity.__class__.__name__, nc_filter), nc_filter
+
+    def get(self, context, entity):
+        """The entity as last written to the device or None if unknown"""
+        if not self.enabled() or context.host in self.unwatched:
+            return None
+
+        key, _ = self._key(context, entity)
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires < time.time():
+            del self.entries[key]
+            entry = None
+
+        PrometheusMonitor().device_state_cache.labels(device=context.host, entity=entity.__class__.__name__,
+                                                      result="miss" if entry is None else "hit").inc()
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry.state
+
+    def store(self, context, entity, state):
+        if not self.enabled():
+            return
+
+        key, nc_filter = self._key(context, entity)
+        if key is None:
+            return
+        try:
+            paths = config_paths(find_native(nc_filter))
+        except (etree.XMLSyntaxError, TypeError):
+            return
+
+        self.entries[key] = CacheEntry(state, paths, time.time() + cfg.CONF.asr1k.device_state_cache_ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > cfg.CONF.asr1k.device_state_cache_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, context, config, router_id=None):
+        """Drop what an edit of config may change, called before the edit is sent
+
+        router_id is the router the edit is sent for, if any.
+        """
+        if any(operation in config for operation in DELETE_OPERATIONS):
+            vrfs = set(VRF_ID.findall(config))
+            if router_id is not None:
+                vrfs.add(utils.uuid_to_vrf_id(router_id))
+            self.flush(context.host, vrfs=vrfs)
+            return
+        if not self.entries:
+            return
+
+        try:
+            native = find_native(config)
+        except etree.XMLSyntaxError:
+            native = None
+        if native is None:
+            self.flush(context.host)
+            return
+
+        self.invalidate_paths(context.host, config_paths(native))
+
+    def invalidate_paths(self, host, paths, keys=None):
+        """Drop the entries below paths, if keys are given only those with one of them in their filter"""
+        for key, entry in list(self.entries.items()):
+            if key[0] != host or not any(paths_overlap(path, other) for path in paths for other in entry.paths):
+                continue
+            if keys and not any('>{}<'.format(value) in key[2] for value in keys):
+                continue
+            del self.entries[key]
+
+    def flush(self, host, vrfs=None):
+        """Drop all entries of host, moving on the generations of vrfs or, without any, of host"""
+        if vrfs:
+            for vrf in vrfs:
+                self.generations[(host, vrf)] += 1
+        else:
+            self.bump_generation(host)
+        for key in [key for key in self.entries if key[0] == host]:
+            del self.entries[key]
+
+    def bump_generation(self, host):
+        self.generations[host] += 1
+
+    def unwatch(self, host):
+        """Changes of others on host go unnoticed until watch(), nothing known about it is trusted"""
+        self.unwatched.add(host)
+        self.flush(host)
+
+    def watch(self, host):
+        self.unwatched.discard(host)
+
+    def generation(self, host, vrf=None):
+        """Generation of host, with a vrf the pair of the generations of host and of that VRF"""
+        if host in self.unwatched:
+            self.bump_generation(host)
+        if vrf is None:
+            return self.generations[host]
+        return self.generations[host], self.generations[(host, vrf)]
@@ -0,0 +1,131 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compact stand-ins for the entities of a device inventory
+
+The cleaner fetches every entity of a device as stub, only to find the few orphans among
+them. An EntityStub is read straight from the parsed item and holds only the stub parameters
+of the schema of its class (see Schema.stub_parameters): the id and keys, plus what the orphan
+checks read, like the VRF of an interface. No other parameter is parsed, nested entities
+included, and the stub has no flags.
+
+The stub class of an entity class is a slotted class generated on first use. It is no subclass
+of the entity class, as the entity classes have no __slots__ and a subclass would carry their
+__dict__ along. Instead the methods and properties of the entity class are looked up there and
+run on the stub, so is_orphan() and the other checks run unchanged. Stubs are read-only,
+operations that talk to the device upgrade the stub with from_json to a full entity first.
+"""
+
+import types
+
+from asr1k_neutron_l3.models.netconf_yang.schema import Schema
+
+# operations that need a full entity, with a __dict__ they may change
+UPGRADE_OPERATIONS = frozenset(['create', 'update', 'delete', '_delete_no_retry', '_internal_get',
+                                '_internal_exists', '_internal_validate', 'diff', 'is_valid'])
+
+# the __dict__ and slots of the entity instance layout, they do not apply to a stub
+_LAYOUT_DESCRIPTORS = (types.GetSetDescriptorType, types.MemberDescriptorType)
+
+
+def _upgrading(name):
+    def operation(self, *args, **kwargs):
+        return getattr(self.entity(), name)(*args, **kwargs)
+
+    operation.__name__ = name
+    return operation
+
+
+def _stub_value(param, params):
+    # normalised like NyBase.__init__ does
+    value = params.get(param.key)
+    if value is None and param.default is not None:
+        value = param.get_default()
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    return value
+
+
+class EntityStub(object):
+    __slots__ = []
+
+    entity_class = None
+
+    _stub_classes = {}
+
+    @classmethod
+    def stub_class(cls, entity_class):
+        """The slotted stub class of entity_class, forwarding to its methods and properties"""
+        stub_class = cls._stub_classes.get(entity_class)
+        if stub_class is None:
+            names = ['id'] + [param.key for param in Schema.of(entity_class).stub_parameters if param.key != 'id']
+            namespace = {'__slots__': names, 'entity_class': entity_class}
+            namespace.update((name, _upgrading(name)) for name in UPGRADE_OPERATIONS)
+            stub_class = type('{}Stub'.format(entity_class.__name__), (cls,), namespace)
+            cls._stub_classes[entity_class] = stub_class
+        return stub_class
+
+    @classmethod
+    def of(cls, entity_class, json, context):
+        """Stub of entity_class for the json of a device item, None for an empty item"""
+        if not bool(json):
+            return None
+
+        schema = Schema.of(entity_class)
+        params = entity_class._json_params(json, context, schema.stub_parameters)
+        stub = object.__new__(cls.stub_class(entity_class))
+        for param in schema.stub_parameters:
+            object.__setattr__(stub, param.key, _stub_value(param, params))
+
+        # ids derived from other parameters, like the one of a static NAT, need those only
+        holder = types.SimpleNamespace(**{param.key: getattr(stub, param.key) for param in schema.stub_parameters})
+        entity_class.__id_function__(holder, schema.id_field, **params)
+        object.__setattr__(stub, 'id', holder.id)
+        return stub
+
+    def _json(self):
+        json = {}
+        for param in Schema.of(self.entity_class).stub_parameters:
+            node = json
+            for path_item in param.yang_path or ():
+                node = node.setdefault(path_item, {})
+            node[param.json_key] = getattr(self, param.key)
+        return json
+
+    def entity(self):
+        """The full entity of this stub, built from the parameters the stub holds"""
+        return self.entity_class.from_json(self._json(), context=None)
+
+    def __getattr__(self, name):
+        # only called for what the stub itself lacks, instance attributes of the entity stay missing
+        for klass in self.entity_class.__mro__:
+            if name in vars(klass) and not isinstance(vars(klass)[name], _LAYOUT_DESCRIPTORS):
+                value = vars(klass)[name]
+                break
+        else:
+            raise AttributeError("{} stub has no attribute {}".format(self.entity_class.__name__, name))
+
+        if isinstance(value, (classmethod, staticmethod)):
+            return value.__get__(None, self.entity_class)
+        if hasattr(value, '__get__'):
+            return value.__get__(self, type(self))
+        return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} stubs are read-only".format(self.entity_class.__name__))
+
+    def __repr__(self):
+        return "<{} stub {}>".format(self.entity_class.__name__, self.id)
@@ -22,7 +22,6 @@ from oslo_log import log as logging
 from asr1k_neutron_l3.models.netconf_yang.bgp import AddressFamily
 from asr1k_neutron_l3.common import cli_snippets
 from asr1k_neutron_l3.common import utils
-from asr1k_neutron_l3.models.connection import ConnectionManager
 from asr1k_neutron_l3.models.netconf_yang.l3_interface import VBInterface
 from asr1k_neutron_l3.models.netconf_yang.nat import InterfaceDynamicNat
 from asr1k_neutron_l3.models.netconf_yang.ny_base import NyBase, Requeable, NC_OPERATION, execute_on_pair, \
@@ -206,8 +205,7 @@ class VrfDefinition(NyBase, Requeable):
     @retry_on_failure()
     def _delete_rd(self, context):
         config = self.DELETE_VRF_RD.format(id=self.id)
-        with ConnectionManager(context=context) as connection:
-            return connection.edit_config(config=config, entity=self.__class__.__name__, action="update")
+        return self._edit_config(context, config, "update")
 
     def postflight(self, context, method):
         # Clean remaining interface NAT
@@ -14,10 +14,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
+import io
 import json
+import weakref
 
 import xmltodict
-from collections import OrderedDict
+from lxml import etree
 from oslo_log import log as logging
 
 ENCODING = '<?xml version="1.0" encoding="utf-8"?>'
@@ -48,6 +51,252 @@ CLI_CONFIG = 'cli-config-data'
 
 LOG = logging.getLogger(__name__)
 
+_PARSER = etree.XMLParser(remove_blank_text=True, huge_tree=True)
+
+
+def element_children(element):
+    return [child for child in element if isinstance(child.tag, str)]
+
+
+def find_native(xml):
+    """The <native> element of a config, filter or rpc-reply, None if there is none"""
+    root = etree.fromstring(xml.encode() if isinstance(xml, str) else xml, _PARSER)
+    if etree.QName(root).localname == IOS_NATIVE:
+        return root
+    return next(root.iter('{*}' + IOS_NATIVE), None)
+
+
+def config_paths(element, path=()):
+    """Container paths of a config or filter down to its list entries, e.g. ('interface', 'BDI')"""
+    children = element_children(element)
+    if not children or any(not element_children(child) for child in children):
+        return {path}
+
+    paths = set()
+    for child in children:
+        paths |= config_paths(child, path + (etree.QName(child).localname,))
+    return paths
+
+
+def paths_overlap(path, other):
+    length = min(len(path), len(other))
+    return path[:length] == other[:length]
+
+
+def _dict_key(name, namespaces):
+    if name[0] != '{':
+        return name
+    namespace, name = name[1:].split('}', 1)
+    namespace = namespaces.get(namespace, namespace)
+    return name if not namespace else "{} {}".format(namespace, name)
+
+
+def _push(item, key, value):
+    if key not in item:
+        item[key] = value
+    elif isinstance(item[key], list):
+        item[key].append(value)
+    else:
+        item[key] = [item[key], value]
+
+
+def element_to_dict(xml, namespaces):
+    """Plain dicts of an XML document or element, as xmltodict.parse() with process_namespaces gives them"""
+    if isinstance(xml, (str, bytes)):
+        xml = etree.fromstring(xml.encode() if isinstance(xml, str) else xml, _PARSER)
+
+    keys = {}
+    result = {}
+    stack = [(result, [])]
+    declarations = {}
+    for event, value in etree.iterwalk(xml, events=('start-ns', 'start', 'end')):
+        if event == 'start-ns':
+            prefix, uri = value
+            declarations[prefix or ''] = uri
+            continue
+
+        if not isinstance(value.tag, str):
+            # comments and processing instructions only contribute their tail
+            if event == 'end' and value.tail and len(stack) > 1:
+                stack[-1][1].append(value.tail)
+            continue
+
+        if event == 'start':
+            item = {'@' + _dict_key(name, namespaces): attribute for name, attribute in value.attrib.items()} \
+                if value.attrib else {}
+            if declarations:
+                item[NS] = declarations
+                declarations = {}
+            stack.append((item, [value.text] if value.text else []))
+        else:
+            item, text = stack.pop()
+            text = "".join(text).strip() or None
+            if not item:
+                item = text
+            elif text:
+                item['#text'] = text
+            key = keys.get(value.tag)
+            if key is None:
+                key = keys[value.tag] = _dict_key(value.tag, namespaces)
+            _push(stack[-1][0], key, item)
+            if value.tail and len(stack) > 1:
+                stack[-1][1].append(value.tail)
+
+    return result
+
+
+def _localname(tag):
+    return tag[tag.index('}') + 1:] if tag[0] == '{' else tag
+
+
+def _item_wrapper(element, depth, namespaces):
+    # the item with its ancestors up to <data>, keeping the leaves of the ancestors like
+    # the name of the Port-channel of a service instance
+    result = element_to_dict(element, namespaces)
+    child = element
+    for _ in range(depth):
+        ancestor = child.getparent()
+        wrapper = {}
+        for leaf in ancestor:
+            if isinstance(leaf.tag, str) and len(leaf) == 0 and leaf.tag != child.tag:
+                for key, value in element_to_dict(leaf, namespaces).items():
+                    _push(wrapper, key, value)
+        wrapper.update(result)
+        result = {_dict_key(ancestor.tag, namespaces): wrapper}
+        child = ancestor
+    return result
+
+
+def iter_items(xml, path, namespaces):
+    """Plain dicts of the elements at path below <data>, one element at a time
+
+    Each dict has the ancestors of its element as wrappers, the same structure a reply with
+    only this element would give. Elements are released once their dict was built, so a
+    large reply never exists as a whole dict tree. xml is an rpc-reply, a <data> element or
+    the content of <data>, strings are parsed incrementally.
+    """
+    path = tuple(path)
+    events = ('start', 'end')
+    if isinstance(xml, (str, bytes)):
+        source = etree.iterparse(io.BytesIO(xml.encode() if isinstance(xml, str) else xml), events=events,
+                                 remove_blank_text=True, huge_tree=True)
+    else:
+        source = etree.iterwalk(xml, events=events)
+
+    names = []
+    offset = None
+    for event, element in source:
+        if not isinstance(element.tag, str):
+            continue
+        if event == 'start':
+            names.append(_localname(element.tag))
+            if offset is None:
+                offset = {RPC_REPLY: 2, DATA: 1}.get(names[0], 0)
+            continue
+
+        relative = tuple(names[offset:])
+        names.pop()
+        if relative != path:
+            continue
+
+        yield _item_wrapper(element, len(path) - 1, namespaces)
+
+        element.clear()
+        parent = element.getparent()
+        previous = element.getprevious()
+        while previous is not None and previous.tag == element.tag:
+            parent.remove(previous)
+            previous = element.getprevious()
+
+
+# clark names and namespace maps of the serialised elements, built once per tag
+_TAGS = {}
+_NSMAPS = {}
+
+# entity -> {host: (content, xml)}, the last serialisation per entity and device, see XMLUtils.to_xml()
+_SERIALISATIONS = weakref.WeakKeyDictionary()
+
+
+def _tag(namespace, key):
+    tag = _TAGS.get((namespace, key))
+    if tag is None:
+        tag = _TAGS[(namespace, key)] = '{{{}}}{}'.format(namespace, key) if namespace else key
+    return tag
+
+
+def _nsmap(namespace):
+    nsmap = _NSMAPS.get(namespace)
+    if nsmap is None:
+        nsmap = _NSMAPS[namespace] = {None: namespace}
+    return nsmap
+
+
+def _string(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _fill_element(element, content, namespace):
+    text = None
+    for key, value in content.items():
+        if key == '#text':
+            text = None if value is None else _string(value)
+        elif key == NS:
+            continue
+        elif key[0] == '@':
+            element.set(key[1:], '' if value is None else _string(value))
+        else:
+            append_elements(element, key, value, namespace)
+
+    # like xmltodict, text goes after the children
+    if text is not None:
+        if len(element):
+            element[-1].tail = text
+        else:
+            element.text = text
+
+
+def append_elements(parent, key, value, namespace):
+    """Append the elements xmltodict.unparse() would write for key and value to parent
+
+    namespace is the default namespace at parent, an @xmlns in value changes it.
+    """
+    for item in value if isinstance(value, (list, tuple)) else (value,):
+        if item is None:
+            item = {}
+        elif not isinstance(item, dict):
+            item = {'#text': _string(item)}
+
+        item_namespace = item.get(NS, namespace)
+        if item_namespace == namespace:
+            element = etree.SubElement(parent, _tag(namespace, key))
+        else:
+            element = etree.SubElement(parent, _tag(item_namespace, key), nsmap=_nsmap(item_namespace))
+        _fill_element(element, item, item_namespace)
+
+
+def config_element(native_content):
+    """<config><native> with the given content of <native>, as lxml element"""
+    config = etree.Element(_tag(NS_NETCONF_BASE, CONFIG), nsmap=_nsmap(NS_NETCONF_BASE))
+    native = etree.SubElement(config, _tag(NS_CISCO_NATIVE, IOS_NATIVE), nsmap=_nsmap(NS_CISCO_NATIVE))
+    _fill_element(native, native_content, NS_CISCO_NATIVE)
+    return config
+
+
+def reply_xml(reply):
+    """The parsed <data> of a ncclient get reply if there is one, the reply xml otherwise
+
+    ncclient has parsed the reply already to check it for errors, handing the element on saves
+    parsing the xml a second time.
+    """
+    data = getattr(reply, 'data_ele', None)
+    if XMLUtils.lxml_parser and isinstance(data, etree._Element):
+        return data
+    return reply.xml
+
 
 class JsonDict(dict):
     def __str__(self):
@@ -73,14 +322,30 @@ class XMLUtils(object):
         NS_CISCO_ZONE: None,
     }
 
+    # replies are parsed with lxml directly into plain dicts, xmltodict is kept as fallback
+    lxml_parser = True
+
     @classmethod
     def to_raw_json(cls, xml):
+        if cls.lxml_parser:
+            return element_to_dict(xml, cls.namespaces)
+        if isinstance(xml, etree._Element):
+            xml = etree.tostring(xml)
         return xmltodict.parse(xml, process_namespaces=True, namespaces=cls.namespaces, namespace_separator=' ')
 
+    @classmethod
+    def to_plain_raw_json(cls, xml):
+        result = cls.to_raw_json(xml)
+        if cls.lxml_parser:
+            return result
+        return cls._to_plain_json(result)
+
     @classmethod
     def to_json(cls, xml, context):
         result = cls.to_raw_json(xml)
         result = cls.remove_wrapper(result, context)
+        if cls.lxml_parser:
+            return result
 
         return cls._to_plain_json(result)
 
@@ -116,7 +381,7 @@ class XMLUtils(object):
 
         return dict
 
-    def add_wrapper(self, dict, operation, context):
+    def _native_content(self, dict, operation, context):
         if operation and operation != 'override':
             if isinstance(dict, list):
                 for item in dict:
@@ -128,27 +393,37 @@ class XMLUtils(object):
             else:
                 dict[self.get_item_key(context)][OPERATION] = operation
 
-        dict = self._wrapper_preamble(dict, context)
-        dict[NS] = NS_CISCO_NATIVE
-
-        result = OrderedDict()
-        result[IOS_NATIVE] = dict
-        result[NS] = NS_NETCONF_BASE
-
-        dict = {CONFIG: result}
-
-        return dict
+        return self._wrapper_preamble(dict, context)
 
     def to_delete_dict(self, context):
         return self.to_dict(context)
 
     def to_xml(self, context, json=None, operation=None):
+        """The <config> edit of this entity
+
+        The elements are built with lxml directly. The last serialisation of an entity per device
+        is kept and handed out again for equal content, e.g. for a retry or the error report of the
+        edit. Comparing the content costs a few percent of serialising it, and unlike a per-class
+        template it does not depend on the entity producing the same elements for every value. The
+        content is kept as a copy, as to_dict() may hand out structures the entity changes later.
+        """
         if json is None:
             json = self.to_dict(context)
 
-        j = self.add_wrapper(json, operation, context)
+        content = self._native_content(json, operation, context)
+        serialisations = _SERIALISATIONS.setdefault(self, {})
+        host = getattr(context, 'host', None)
+        cached = serialisations.get(host)
+        if cached is not None and cached[0] == content:
+            return cached[1]
 
-        xml = xmltodict.unparse(j)
-        xml = xml.replace(ENCODING, "")
+        xml = etree.tostring(config_element(content), encoding='unicode')
+        serialisations[host] = (copy.deepcopy(content), xml)
 
         return xml
+
+    def last_xml(self, host=None):
+        """The last serialisation of this entity by to_xml() for a device, None if there was none"""
+        cached = _SERIALISATIONS.get(self, {}).get(host)
+        if cached is not None:
+            return cached[1]
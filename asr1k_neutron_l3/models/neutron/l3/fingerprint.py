@@ -0,0 +1,112 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Fingerprints of the desired state of routers, to skip sync updates of unchanged routers
+
+The fingerprint of a router is a hash over the router as received from Neutron and the
+rendered config (to_dict) of its entities per device. It is stored together with the
+generations of each device and of the VRF of the router on it after a successful update.
+These change whenever the agent cannot tell anymore what changed on a device (reconnects,
+deletes, config changes made by others), see DeviceStateCache. As long as both are unchanged
+a sync update of the router has nothing to do and is skipped, for at most
+unchanged_router_skip_time seconds.
+"""
+
+import hashlib
+import json
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common import utils
+from asr1k_neutron_l3.models.netconf_yang.state_cache import DeviceStateCache
+
+LOG = logging.getLogger(__name__)
+
+# attributes that change without a change of the router config
+VOLATILE_KEYS = ['status', 'updated_at', 'revision_number']
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, default=str, separators=(',', ':'))
+
+
+def router_fingerprint(router_info, entities, contexts):
+    """sha256 over router_info and the to_dict() output of the entities on each device, None if not renderable"""
+    digest = hashlib.sha256()
+    digest.update(_canonical({k: v for k, v in router_info.items() if k not in VOLATILE_KEYS}).encode())
+
+    for context in contexts:
+        digest.update(context.host.encode())
+        for entity in entities:
+            try:
+                rendered = entity.to_dict(context=context)
+            except Exception as e:
+                LOG.debug("No fingerprint for %s, rendering %s failed: %s", router_info.get('id'),
+                          entity.__class__.__name__, e)
+                return None
+            digest.update(entity.__class__.__name__.encode())
+            digest.update(_canonical(rendered).encode())
+
+    return digest.hexdigest()
+
+
+class AppliedState(object):
+    __slots__ = ['fingerprint', 'generations', 'applied']
+
+    def __init__(self, fingerprint, generations, applied):
+        self.fingerprint = fingerprint
+        self.generations = generations
+        self.applied = applied
+
+
+class RouterFingerprints(object):
+    __instance = None
+
+    def __new__(cls):
+        if RouterFingerprints.__instance is None:
+            RouterFingerprints.__instance = object.__new__(cls)
+            RouterFingerprints.__instance.applied = {}
+
+        return RouterFingerprints.__instance
+
+    @staticmethod
+    def enabled():
+        return cfg.CONF.asr1k_l3.unchanged_router_skip_time > 0
+
+    @staticmethod
+    def generations(contexts, router_id):
+        vrf = utils.uuid_to_vrf_id(router_id)
+        return {context.host: DeviceStateCache().generation(context.host, vrf) for context in contexts}
+
+    def unchanged(self, router_id, fingerprint, contexts):
+        state = self.applied.get(router_id)
+        if state is None or fingerprint is None:
+            return False
+        if time.time() - state.applied > cfg.CONF.asr1k_l3.unchanged_router_skip_time:
+            return False
+        return state.fingerprint == fingerprint and state.generations == self.generations(contexts, router_id)
+
+    def record(self, router_id, fingerprint, generations):
+        """Remember a successful update, generations as taken before the update started"""
+        if fingerprint is None:
+            self.forget(router_id)
+        else:
+            self.applied[router_id] = AppliedState(fingerprint, generations, time.time())
+
+    def forget(self, router_id):
+        self.applied.pop(router_id, None)
@@ -21,11 +21,16 @@ from collections import defaultdict
 from oslo_log import log as logging
 
 from asr1k_neutron_l3.common import asr1k_constants as constants, utils
+from asr1k_neutron_l3.common import local_context
 from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
 from asr1k_neutron_l3.models import asr1k_pair
+from asr1k_neutron_l3.models.netconf_yang import changeset
+from asr1k_neutron_l3.models.netconf_yang import pipeline
+from asr1k_neutron_l3.models.netconf_yang import prefetch
 from asr1k_neutron_l3.models.neutron.l3 import access_list
 from asr1k_neutron_l3.models.neutron.l3.base import Base
 from asr1k_neutron_l3.models.neutron.l3 import bgp
+from asr1k_neutron_l3.models.neutron.l3 import fingerprint
 from asr1k_neutron_l3.models.neutron.l3 import firewall
 from asr1k_neutron_l3.models.neutron.l3 import interface as l3_interface
 from asr1k_neutron_l3.models.neutron.l3 import nat
@@ -379,21 +384,85 @@ class Router(Base):
         return result
 
     def update(self):
+        fingerprints = fingerprint.RouterFingerprints()
+        digest = None
+        if fingerprints.enabled():
+            digest = fingerprint.router_fingerprint(self.router_info, self._device_entities(), self.contexts)
+            if local_context.get('skip_unchanged') and fingerprints.unchanged(self.router_id, digest, self.contexts):
+                LOG.debug("Skipping update of router %s, unchanged since its last update", self.router_id)
+                PrometheusMonitor().unchanged_router_skips.inc()
+                return []
+            generations = fingerprints.generations(self.contexts, self.router_id)
+
         with PrometheusMonitor().router_update_duration.time():
             result = self._update()
 
+        if fingerprints.enabled():
+            if result is not None and all(r is not None and r.success for r in result):
+                fingerprints.record(self.router_id, digest, generations)
+            else:
+                fingerprints.forget(self.router_id)
+
         return result
 
     def delete(self):
+        fingerprint.RouterFingerprints().forget(self.router_id)
         with PrometheusMonitor().router_delete_duration.time():
             result = self._delete()
 
             return result
 
+    def _in_changeset(self, apply):
+        if not self.config.asr1k_l3.batch_router_edits:
+            return apply()
+
+        with changeset.ChangeSet(self.router_id):
+            results = apply()
+
+        return changeset.ChangeSet.resolve(results)
+
     def _update(self):
         if self.gateway_interface is None and len(self.interfaces.internal_interfaces) == 0:
             return self.delete()
 
+        return self._on_each_device(lambda: self._with_prefetch(lambda: self._in_changeset(self._apply_update)))
+
+    def _on_each_device(self, apply):
+        if not pipeline.DevicePipelines.enabled():
+            return apply()
+
+        return pipeline.DevicePipelines(self.router_id).run(apply)
+
+    def _with_prefetch(self, apply):
+        # reads served from the config snapshot need no prefetching
+        if not prefetch.Prefetch.enabled() or local_context.get('snapshot'):
+            return apply()
+
+        with prefetch.Prefetch(self.router_id) as pending_gets:
+            pending_gets.submit(self._device_entities())
+            return apply()
+
+    def _device_entities(self):
+        objects = list(self.prefix_lists) + [self.route_map, self.vrf, self.bgp_address_family]
+        if self.gateway_interface is not None:
+            objects.append(self.pbr_route_map)
+        objects += [self.nat_acl, self.pbr_acl, self.floating_ips, self.arp_entries, self.routes]
+        objects += list(self.fwaas_conf)
+        objects += [interface for interface in self.interfaces.all_interfaces
+                    if not isinstance(interface, l3_interface.OrphanedInterface)]
+
+        entities = []
+        for obj in objects:
+            if obj is None:
+                continue
+            try:
+                entities.append(obj._rest_definition)
+            except Exception as e:
+                LOG.debug("Skipping entity %s of router %s: %s", obj.__class__.__name__, self.router_id, e)
+
+        return entities
+
+    def _apply_update(self):
         results = []
 
         for prefix_list in self.prefix_lists:
@@ -468,6 +537,9 @@ class Router(Base):
         return os.system("ping -c 1 10.44.30.206")
 
     def _delete(self):
+        return self._on_each_device(lambda: self._in_changeset(self._apply_delete))
+
+    def _apply_delete(self):
         results = []
         # order is important here.
 
@@ -509,6 +581,9 @@ class Router(Base):
         return results
 
     def diff(self):
+        return self._with_prefetch(self._diff)
+
+    def _diff(self):
         diff_results = {}
 
         vrf_diff = self.vrf.diff()
@@ -0,0 +1,135 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from eventlet import semaphore
+from ncclient import manager
+from ncclient.transport import SSHSession
+from ncclient.transport.errors import SSHError
+from oslo_log import log as logging
+import paramiko
+
+LOG = logging.getLogger(__name__)
+
+NETCONF_SUBSYSTEM = 'netconf'
+
+
+class ChannelSSHSession(SSHSession):
+    """NETCONF session on one channel of an SSH transport shared with other sessions
+
+    Closing the session only closes its channel, the transport is closed by its
+    SharedSSHTransport once the last session on it is gone.
+    """
+
+    def __init__(self, device_handler, owner):
+        super(ChannelSSHSession, self).__init__(device_handler)
+        self._owner = owner
+
+    def open_channel(self, host, transport, timeout=None):
+        self._host = host
+        self._transport = transport
+        self._connected = True
+        self._closing.clear()
+        try:
+            self._channel = transport.open_session(timeout=timeout)
+            self._channel_id = self._channel.get_id()
+            self._channel.set_name("{}-subsystem-{}".format(NETCONF_SUBSYSTEM, self._channel_id))
+            self._channel.invoke_subsystem(NETCONF_SUBSYSTEM)
+            self._channel_name = self._channel.get_name()
+            self._post_connect(timeout)
+        except BaseException as e:
+            self._connected = False
+            if self._channel is not None:
+                self._channel.close()
+                self._channel = None
+            if isinstance(e, paramiko.SSHException):
+                raise SSHError("Could not open NETCONF channel to {}: {}".format(host, e))
+            raise
+        self.parser = self._device_handler.get_xml_parser(self)
+
+    def close(self):
+        self._closing.set()
+        if self._channel:
+            self._channel.close()
+
+        # Wait for the session thread to finish, like SSHSession.close()
+        while self.is_alive() and (self is not threading.current_thread()):
+            self.join(10)
+
+        self._channel = None
+        self._connected = False
+        self._owner.release(self)
+
+
+class SharedSSHTransport(object):
+    """One authenticated SSH connection to a device, carrying several NETCONF sessions as channels
+
+    The first session does the full SSH handshake, all further sessions only open a channel and
+    exchange NETCONF hellos. Sessions only count against the SSH session limit of the device once
+    per transport.
+    """
+
+    def __init__(self, context, id=0):
+        self.context = context
+        self.id = "{}-transport-{}".format(context.host, id)
+        self._transport = None
+        self._sessions = set()
+        self._lock = semaphore.Semaphore()
+
+    @property
+    def is_active(self):
+        return self._transport is not None and self._transport.is_active()
+
+    def connect(self):
+        """Open a NETCONF session on this transport, returns a ncclient Manager like manager.connect()"""
+        context = self.context
+        device_handler = manager.make_device_handler({'name': "iosxe"})
+        session = ChannelSSHSession(device_handler, self)
+
+        with self._lock:
+            if self.is_active:
+                session.open_channel(context.host, self._transport, timeout=context.nc_timeout)
+            else:
+                connect_params = dict(host=context.host, port=context.yang_port,
+                                      username=context.username, password=context.password,
+                                      hostkey_verify=False, timeout=context.nc_timeout,
+                                      allow_agent=False, look_for_keys=False)
+                device_handler.add_additional_ssh_connect_params(connect_params)
+                try:
+                    session.connect(**connect_params)
+                except Exception:
+                    if session.transport is not None:
+                        session.transport.close()
+                    raise
+                LOG.debug("Opened SSH transport {} for NETCONF channels".format(self.id))
+                # sessions of a previous, dead transport are not tracked anymore
+                self._transport = session.transport
+                self._sessions = set()
+            self._sessions.add(session)
+
+        return manager.Manager(session, device_handler)
+
+    def release(self, session):
+        self._sessions.discard(session)
+        if session.transport is not self._transport:
+            return
+        if not self._sessions and self._transport is not None:
+            LOG.debug("Closing SSH transport {}, no NETCONF channels left".format(self.id))
+            try:
+                self._transport.close()
+            finally:
+                self._transport = None
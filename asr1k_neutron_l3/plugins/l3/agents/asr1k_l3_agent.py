@@ -57,15 +57,19 @@ from oslo_service import service
 from oslo_utils import timeutils
 
 from asr1k_neutron_l3.plugins.l3.agents import router_processing_queue as asr1k_queue
+from asr1k_neutron_l3.plugins.l3.agents.router_workers import RouterWorkers
 from asr1k_neutron_l3.common import asr1k_constants as constants, utils
 from asr1k_neutron_l3.common.exc_helper import exc_info_full
 from asr1k_neutron_l3.common import prometheus_monitor
 from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
 from asr1k_neutron_l3.common import asr1k_exceptions as exc
 from asr1k_neutron_l3.common.instrument import instrument
+from asr1k_neutron_l3.common import local_context
 from asr1k_neutron_l3.common import config as asr1k_config
 from asr1k_neutron_l3.models.netconf_yang.arp_cache import ArpCache
 from asr1k_neutron_l3.models.netconf_yang.copy_config import CopyConfig
+from asr1k_neutron_l3.models.netconf_yang.notifications import ConfigChangeListener
+from asr1k_neutron_l3.models.netconf_yang.snapshot import ConfigSnapshots
 from asr1k_neutron_l3.models.neutron.l3 import router as l3_router
 from asr1k_neutron_l3.models import asr1k_pair
 from asr1k_neutron_l3.models import connection
@@ -299,6 +303,10 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
                                                    max_age=cfg.CONF.asr1k.connection_max_age)
             LOG.debug("Connection pool initialized")
 
+            if cfg.CONF.asr1k.config_change_notifications:
+                for context in asr1k_pair.ASR1KPair().contexts:
+                    ConfigChangeListener(context).start()
+
         self.router_info = {}
         self.host = host
         self.process_monitor = external_process.ProcessMonitor(
@@ -314,7 +322,9 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
 
         self.asr1k_pair = asr1k_pair.ASR1KPair()
 
-        self._queue = asr1k_queue.RouterProcessingQueue()
+        self._queue = asr1k_queue.RouterProcessingQueue(lane_weights=cfg.CONF.asr1k_l3.queue_lane_weights,
+                                                        max_wait=cfg.CONF.asr1k_l3.queue_lane_max_wait)
+        self._workers = None
         self._requeue = {}
         self._last_full_sync = timeutils.now()
         self._router_sync_marker = None
@@ -402,7 +412,7 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
                 self._clean_deleted_routers_dict)
             self.clean_deleted_routers_dict_loop.start(interval=3600, stop_on_exception=False)
 
-            eventlet.spawn_n(self._process_routers_loop)
+            self._start_router_workers()
 
             LOG.info("L3 agent started")
 
@@ -546,6 +556,8 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
             self._save_config()
 
         LOG.debug("Starting partial router sync loop at sync marker %s", self._router_sync_marker)
+        if ConfigSnapshots.enabled():
+            ConfigSnapshots().new_cycle()
         try:
             # fetch router ids, start with the router after the last one we already synced
             router_ids = sorted(self.plugin_rpc.get_router_ids(context))
@@ -625,7 +637,7 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
     def periodic_requeue_routers_task(self, context):
         for update in self._requeue.values():
             LOG.debug("Adding requeued router {} to processing queue".format(update.id))
-            self._queue.add(update)
+            self._queue.add(update, lane=asr1k_queue.LANE_REQUEUE)
 
         self._requeue = {}
 
@@ -656,7 +668,8 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
                             router = routers[0]
 
                     if not router:
-                        self._safe_router_deleted(update.id)
+                        with local_context.bind(priority=update.priority):
+                            self._safe_router_deleted(update.id)
                         # need to update timestamp of removed router in case
                         # there are older events for the same router in the
                         # processing queue (like events from fullsync) in order to
@@ -668,7 +681,14 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
                         try:
                             router[constants.ADDRESS_SCOPE_CONFIG] = self.address_scopes
                             r = l3_router.Router(router)
-                            result = r.update()
+                            # RPC triggered updates overtake the sync task when waiting for a connection,
+                            # they also always read from the device instead of the config snapshot and
+                            # are never skipped as unchanged
+                            sync = update.priority == l3_agent.PRIORITY_SYNC_ROUTERS_TASK
+                            with local_context.bind(priority=update.priority,
+                                                    snapshot=sync and ConfigSnapshots.enabled(),
+                                                    skip_unchanged=sync):
+                                result = r.update()
                             self.process_update_result(r, result)
 
                             # set L3 deleted for all ports on the router that have disappeared
@@ -739,16 +759,23 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
 
         return complete
 
-    def _process_routers_loop(self):
-        poolsize = min(self.conf.asr1k_l3.threadpool_maxsize, self.yang_connection_pool_size, constants.MAX_CONNECTIONS)
+    def _start_router_workers(self):
+        poolsize = min(self.conf.asr1k_l3.threadpool_maxsize, self.yang_connection_pool_size,
+                       constants.MAX_CONNECTIONS * max(cfg.CONF.asr1k.channels_per_transport, 1))
 
         if poolsize < self.conf.asr1k_l3.threadpool_maxsize:
             LOG.warning("The processing thread pool size has been reduced to match 'yang_connection_pool_size' "
                         "its now {}".format(poolsize))
 
-        pool = eventlet.GreenPool(size=poolsize)
-        while True:
-            pool.spawn_n(self._process_router_update)
+        self._workers = RouterWorkers(self._queue, self._process_router_update, poolsize,
+                                      saturated=connection.ConnectionPool().saturated,
+                                      paused=lambda: self.pause_process)
+        self._workers.start()
+
+    def stop(self):
+        if self._workers is not None:
+            self._workers.stop(timeout=self.conf.asr1k_l3.worker_drain_timeout)
+        super(L3ASRAgent, self).stop()
 
     def _requeue_router(self, router_update,
                         priority=l3_agent.PRIORITY_SYNC_ROUTERS_TASK):
@@ -765,7 +792,7 @@ class L3ASRAgent(manager.Manager, operations.OperationsMixin, DeviceCleanerMixin
         router_update.timestamp = timeutils.utcnow()
         router_update.priority = priority
         router_update.resource = None  # Force the agent to resync the router
-        self._queue.add(router_update)
+        self._queue.add(router_update, lane=asr1k_queue.LANE_REQUEUE)
 
     def _safe_router_deleted(self, router_id):
         """Try to delete a router and return True if successful."""
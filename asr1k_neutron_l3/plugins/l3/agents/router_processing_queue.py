@@ -1,17 +1,233 @@
+import collections
+import heapq
+import itertools
+import time
+
+from eventlet import semaphore
 from neutron.agent.common.resource_processing_queue import ExclusiveResourceProcessor
-from six.moves import queue as Queue
+from neutron.agent.l3 import agent as l3_agent
+
+from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
+
+PRIORITY_CLASSES = {
+    l3_agent.PRIORITY_RELATED_ROUTER: 'related',
+    l3_agent.PRIORITY_RPC: 'rpc',
+    l3_agent.PRIORITY_SYNC_ROUTERS_TASK: 'sync',
+}
+
+LANE_RPC = 'rpc'
+LANE_REQUEUE = 'requeue'
+LANE_SYNC = 'sync'
+LANE_CLEANUP = 'cleanup'
+
+# share of the workers' turns each lane gets while others have routers waiting as well
+DEFAULT_LANE_WEIGHTS = collections.OrderedDict([(LANE_RPC, 8), (LANE_REQUEUE, 4), (LANE_SYNC, 2), (LANE_CLEANUP, 1)])
+# seconds after which the oldest update of a lane is taken before anything else
+DEFAULT_MAX_WAIT = 300
+
+
+def priority_class(priority):
+    return PRIORITY_CLASSES.get(priority, str(priority))
+
+
+class _Entry(object):
+    __slots__ = ['priority', 'queued_at', 'counter', 'enqueued', 'update', 'lane', 'project']
+
+    def __init__(self, priority, queued_at, counter, enqueued, update, lane, project):
+        self.priority = priority
+        self.queued_at = queued_at
+        self.counter = counter
+        self.enqueued = enqueued
+        self.update = update
+        self.lane = lane
+        self.project = project
+
+    def __lt__(self, other):
+        return (self.priority, self.queued_at, self.counter) < (other.priority, other.queued_at, other.counter)
+
+
+def _pop_taken(heap, entry=lambda item: item):
+    # entries taken or moved to another lane stay in the heaps until they come up
+    while heap and entry(heap[0]).update is None:
+        heapq.heappop(heap)
+
+
+class Lane(object):
+    """Updates of one kind, handed out in turns by project"""
+
+    def __init__(self, name, weight):
+        self.name = name
+        self.weight = weight
+        self.credit = 0
+        self.size = 0
+        # project id -> heap of its entries, a project is in rotation as long as it is in here
+        self.projects = {}
+        self.rotation = collections.deque()
+        self.by_age = []
+
+    def push(self, entry):
+        heap = self.projects.get(entry.project)
+        if heap is None:
+            heap = self.projects[entry.project] = []
+            self.rotation.append(entry.project)
+        heapq.heappush(heap, entry)
+        heapq.heappush(self.by_age, (entry.enqueued, entry.counter, entry))
+        self.size += 1
+
+    def oldest(self):
+        _pop_taken(self.by_age, lambda item: item[2])
+        return self.by_age[0][2] if self.by_age else None
+
+    def next(self):
+        """Next entry of the project whose turn it is"""
+        while self.rotation:
+            project = self.rotation.popleft()
+            heap = self.projects[project]
+            _pop_taken(heap)
+            entry = heapq.heappop(heap) if heap else None
+            _pop_taken(heap)
+            if heap:
+                self.rotation.append(project)
+            else:
+                del self.projects[project]
+            if entry is not None:
+                return entry
 
 
 class RouterProcessingQueue(object):
-    """Manager of the queue of routers to process."""
-    def __init__(self):
-        self._queue = Queue.PriorityQueue()
+    """Manager of the queue of routers to process.
+
+    The queue holds at most one pending update per router. An update for a router that is
+    already queued is merged into the pending one: the newer update wins, with the higher
+    priority of both, and keeps the place in line of the first one. Updates older than the
+    pending one are dropped, unless they raise its priority. The merged update waits in the lane
+    of the update that won or raised the priority.
+
+    Updates wait in lanes, for rpc notifications, requeued routers, the periodic sync and router
+    deletions found by the sync. Lanes take turns by weight, so a full sync does not hold up the
+    routers users just changed, and within a lane the projects take turns, so a project changing
+    hundreds of routers does not hold up the others. A lane whose oldest update waits longer than
+    max_wait seconds is served first, so no lane starves.
+    """
+    def __init__(self, lane_weights=None, max_wait=DEFAULT_MAX_WAIT):
+        weights = collections.OrderedDict(DEFAULT_LANE_WEIGHTS)
+        weights.update(lane_weights or {})
+        self._lanes = collections.OrderedDict((name, Lane(name, int(weight))) for name, weight in weights.items())
+        self.max_wait = max_wait
+        # router id -> entry of its pending update
+        self._pending = {}
+        # router id -> project id, rpc notifications only carry the router id
+        self._projects = {}
+        self._available = semaphore.Semaphore(0)
+        self._counter = itertools.count()
+        self.closed = False
+
+    @staticmethod
+    def default_lane(update):
+        if update.priority >= l3_agent.PRIORITY_SYNC_ROUTERS_TASK:
+            if update.action == l3_agent.DELETE_ROUTER:
+                return LANE_CLEANUP
+            return LANE_SYNC
+        return LANE_RPC
+
+    def _project(self, update):
+        if update.resource:
+            project = update.resource.get('project_id') or update.resource.get('tenant_id')
+            if project:
+                self._projects[update.id] = project
+                return project
+        return self._projects.get(update.id)
+
+    def _push(self, entry):
+        lane = self._lanes[entry.lane]
+        lane.push(entry)
+        self._pending[entry.update.id] = entry
+        PrometheusMonitor().router_lane_depth.labels(lane=lane.name).set(lane.size)
 
-    def add(self, update):
-        self._queue.put(update)
+    def _remove(self, entry):
+        lane = self._lanes[entry.lane]
+        entry.update = None
+        lane.size -= 1
+        if not lane.size:
+            lane.credit = 0
+        PrometheusMonitor().router_lane_depth.labels(lane=lane.name).set(lane.size)
+
+    def add(self, update, lane=None):
+        lane = lane or self.default_lane(update)
+        project = self._project(update)
+        entry = self._pending.get(update.id)
+        if entry is None:
+            self._push(_Entry(update.priority, update.timestamp, next(self._counter), time.time(), update,
+                              lane, project))
+            self._available.release()
+            return
+
+        PrometheusMonitor().coalesced_router_updates.inc()
+        pending = entry.update
+        priority = min(pending.priority, update.priority)
+        if update.timestamp >= pending.timestamp:
+            update.priority = priority
+        else:
+            update = pending
+            if priority == entry.priority:
+                # a stale update neither moves the pending one nor raises its priority
+                lane = entry.lane
+
+        project = project or entry.project
+        if (priority, lane, project) == (entry.priority, entry.lane, entry.project):
+            entry.update = update
+        else:
+            # moved to its new lane or project, with its place in line
+            self._remove(entry)
+            update.priority = priority
+            self._push(_Entry(priority, entry.queued_at, entry.counter, entry.enqueued, update, lane, project))
 
     def get_size(self):
-        return self._queue.qsize()
+        """Number of routers with a pending update"""
+        return len(self._pending)
+
+    def get_lane_sizes(self):
+        """Number of routers with a pending update by lane"""
+        return {name: lane.size for name, lane in self._lanes.items()}
+
+    def close(self):
+        """Wake up all waiting workers, they get no more updates from now on"""
+        self.closed = True
+        self._available.release()
+
+    def _next_entry(self):
+        now = time.time()
+        aged = None
+        for lane in self._lanes.values():
+            oldest = lane.oldest() if lane.size else None
+            if oldest is not None and now - oldest.enqueued > self.max_wait and \
+                    (aged is None or oldest.enqueued < aged.enqueued):
+                aged = oldest
+        if aged is not None:
+            return aged
+
+        # smooth weighted round robin between the lanes with pending updates
+        waiting = [lane for lane in self._lanes.values() if lane.size]
+        for lane in waiting:
+            lane.credit += lane.weight
+        chosen = max(waiting, key=lambda lane: lane.credit)
+        chosen.credit -= sum(lane.weight for lane in waiting)
+        return chosen.next()
+
+    def _get(self):
+        self._available.acquire()
+        if self.closed:
+            # pass the wake up on to the next waiting worker
+            self._available.release()
+            return None
+        entry = self._next_entry()
+        update = entry.update
+        del self._pending[update.id]
+        if update.action == l3_agent.DELETE_ROUTER:
+            self._projects.pop(update.id, None)
+        self._remove(entry)
+        PrometheusMonitor().router_lane_wait_duration.labels(lane=entry.lane).observe(time.time() - entry.enqueued)
+        return update
 
     def each_update_to_next_router(self):
         """Grabs the next router from the queue and processes
@@ -19,7 +235,7 @@ class RouterProcessingQueue(object):
         This method uses a for loop to process the router repeatedly until
         updates stop bubbling to the front of the queue.
         """
-        next_update = self._queue.get()
+        next_update = self._get()
         if next_update is not None:
             with ExclusiveResourceProcessor(next_update.id) as rp:
                 # Queue the update whether this worker is the master or not.
@@ -29,4 +245,14 @@ class RouterProcessingQueue(object):
                 # rp.updates() will not yield and so this will essentially be a
                 # noop.
                 for update in rp.updates():
-                    yield (rp, update)
+                    label = priority_class(update.priority)
+                    PrometheusMonitor().router_queue_wait_duration.labels(priority=label).observe(
+                        update.time_elapsed_since_create)
+                    PrometheusMonitor().busy_router_workers.labels(priority=label).inc()
+                    start = time.time()
+                    try:
+                        yield (rp, update)
+                    finally:
+                        PrometheusMonitor().busy_router_workers.labels(priority=label).dec()
+                        PrometheusMonitor().router_processing_duration.labels(priority=label).observe(
+                            time.time() - start)
@@ -0,0 +1,76 @@
+# Copyright 2024 SAP SE
+#
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+from eventlet import timeout as eventlet_timeout
+from oslo_log import log as logging
+
+from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
+
+LOG = logging.getLogger(__name__)
+
+# seconds a worker sleeps while the connection pool has waiters or processing is paused
+BACKOFF_INTERVAL = 0.5
+
+
+class RouterWorkers(object):
+    """Long-lived greenlets taking the routers of a RouterProcessingQueue one after another
+
+    Each worker blocks on the queue until an update is there and calls process() for it.
+    While saturated() is true, i.e. greenlets already wait for a device connection, workers do
+    not take new routers. stop() closes the queue and lets the workers finish the router they
+    are working on.
+    """
+
+    def __init__(self, queue, process, size, saturated=None, paused=None):
+        self.queue = queue
+        self.process = process
+        self.size = size
+        self.saturated = saturated
+        self.paused = paused
+        self._pool = eventlet.GreenPool(size=size)
+
+    def start(self):
+        PrometheusMonitor().router_workers.set(self.size)
+        for _ in range(self.size):
+            self._pool.spawn_n(self._work)
+
+    def _wait_for_capacity(self):
+        while not self.queue.closed and ((self.paused is not None and self.paused()) or
+                                         (self.saturated is not None and self.saturated())):
+            eventlet.sleep(BACKOFF_INTERVAL)
+
+    def _work(self):
+        while not self.queue.closed:
+            self._wait_for_capacity()
+            if self.queue.closed:
+                break
+            try:
+                self.process()
+            except Exception as e:
+                LOG.exception(e)
+
+    def stop(self, timeout=None):
+        """Close the queue and wait up to timeout seconds for the workers to finish, True if they did"""
+        LOG.info("Stopping router workers, %s routers left in the queue", self.queue.get_size())
+        self.queue.close()
+        with eventlet_timeout.Timeout(timeout or None, False):
+            self._pool.waitall()
+            PrometheusMonitor().router_workers.set(0)
+            return True
+
+        LOG.warning("%s router workers did not finish within %ss", self._pool.running(), timeout)
+        return False
@@ -47,6 +47,7 @@ from oslo_utils import timeutils
 from asr1k_neutron_l3.common import asr1k_constants as constants
 from asr1k_neutron_l3.common import config as asr1k_config
 from asr1k_neutron_l3.common.instrument import instrument
+from asr1k_neutron_l3.common import local_context
 from asr1k_neutron_l3.common import prometheus_monitor, asr1k_constants
 from asr1k_neutron_l3.common.prometheus_monitor import PrometheusMonitor
 from asr1k_neutron_l3.models import asr1k_pair
@@ -257,7 +258,9 @@ class ASR1KNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                 router_ports = self.agent_rpc.get_ports_with_extra_atts(self.context, ports_to_bind, self.agent_id,
                                                                         self.conf.host)
 
-                bridgedomain.update_ports(router_ports, callback=self._bound_ports)
+                # port updates come in by RPC, they go ahead of the network sync on the devices
+                with local_context.bind(priority=connection.PRIORITY_RPC):
+                    bridgedomain.update_ports(router_ports, callback=self._bound_ports)
                 self.updated_ports = {}
             except BaseException as err:
                 LOG.exception(err)
@@ -269,7 +272,8 @@ class ASR1KNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
             try:
                 extra_atts = self.agent_rpc.get_extra_atts(self.context, ports_to_delete, agent_id=self.agent_id,
                                                            host=self.conf.host)
-                bridgedomain.delete_ports(extra_atts, callback=self._deleted_ports)
+                with local_context.bind(priority=connection.PRIORITY_RPC):
+                    bridgedomain.delete_ports(extra_atts, callback=self._deleted_ports)
                 self.deleted_ports = {}
             except BaseException as err:
                 LOG.exception(err)
@@ -0,0 +1,178 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import eventlet
+from lxml import etree
+import mock
+
+from neutron.tests import base
+from oslo_config import cfg
+
+from asr1k_neutron_l3.common import asr1k_exceptions as exc
+from asr1k_neutron_l3.common import config
+from asr1k_neutron_l3.models.connection import CandidateEditFailed
+from asr1k_neutron_l3.models.netconf_yang import changeset
+from asr1k_neutron_l3.models.netconf_yang.changeset import merge_configs
+from asr1k_neutron_l3.models.netconf_yang import ny_base
+
+NS = "http://cisco.com/ns/yang/Cisco-IOS-XE-native"
+
+
+def _config(native):
+    return ('<config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+            '<native xmlns="{}">{}</native></config>'.format(NS, native))
+
+
+def _native_children(xml):
+    root = etree.fromstring(xml.encode())
+    native = root.find('{%s}native' % NS)
+    return [etree.QName(child).localname for child in native]
+
+
+class ChangeSetMergeTest(base.BaseTestCase):
+    def test_consecutive_containers_are_merged(self):
+        xml = merge_configs([
+            _config('<ip><prefix-lists><prefixes><name>ext-a</name><no>10</no></prefixes></prefix-lists></ip>'),
+            _config('<ip><prefix-lists><prefixes><name>snat-a</name><no>10</no></prefixes></prefix-lists></ip>'),
+        ])
+
+        self.assertEqual(['ip'], _native_children(xml))
+        root = etree.fromstring(xml.encode())
+        prefixes = root.findall('.//{%s}prefixes' % NS)
+        self.assertEqual(['ext-a', 'snat-a'], [p.find('{%s}name' % NS).text for p in prefixes])
+        self.assertEqual(1, len(root.findall('.//{%s}prefix-lists' % NS)))
+
+    def test_order_is_kept(self):
+        xml = merge_configs([
+            _config('<ip><access-list><extended><name>NAT-1</name></extended></access-list></ip>'),
+            _config('<vrf><definition><name>1</name></definition></vrf>'),
+            _config('<ip><nat><pool><id>POOL-1</id></pool></nat></ip>'),
+        ])
+
+        self.assertEqual(['ip', 'vrf', 'ip'], _native_children(xml))
+
+    def test_list_entries_and_operations_stay_separate(self):
+        xml = merge_configs([
+            _config('<vrf><definition><name>1</name><rd>65000:1</rd>'
+                    '<address-family><ipv4/></address-family></definition></vrf>'),
+            _config('<vrf><definition><name>2</name><rd>65000:2</rd>'
+                    '<address-family><ipv4/></address-family></definition></vrf>'),
+            _config('<vrf><definition operation="delete"><name>3</name></definition></vrf>'),
+        ])
+
+        root = etree.fromstring(xml.encode())
+        self.assertEqual(['vrf'], _native_children(xml))
+        definitions = root.findall('.//{%s}definition' % NS)
+        self.assertEqual(['1', '2', '3'], [d.find('{%s}name' % NS).text for d in definitions])
+        self.assertEqual('delete', definitions[2].get('operation'))
+
+
+class DeviceWriteSchedulerTest(base.BaseTestCase):
+    def setUp(self):
+        super(DeviceWriteSchedulerTest, self).setUp()
+        config.register_l3_opts()
+        cfg.CONF.set_override('write_coalesce_window', 0.05, 'asr1k_l3')
+        self.context = mock.Mock(host='scheduler-test', use_candidate=False)
+
+    def _submit_all(self, scheduler, configs):
+        pool = eventlet.GreenPool()
+        threads = [pool.spawn(scheduler.submit, [(c, 'Entity', 'update')]) for c in configs]
+        return [thread.wait() for thread in threads]
+
+    @mock.patch.object(changeset, 'send_merged', return_value='reply')
+    def test_submissions_in_window_are_written_once(self, send_merged):
+        scheduler = changeset.DeviceWriteScheduler(self.context)
+
+        self.assertEqual(['reply', 'reply'], self._submit_all(scheduler, ['<a/>', '<b/>']))
+        send_merged.assert_called_once_with(self.context, ['<a/>', '<b/>'])
+
+    def test_failed_write_is_split_per_submission(self):
+        def send_merged(context, configs):
+            if '<bad/>' in configs:
+                raise ValueError('rejected')
+            return 'reply'
+
+        scheduler = changeset.DeviceWriteScheduler(self.context)
+        with mock.patch.object(changeset, 'send_merged', side_effect=send_merged):
+            pool = eventlet.GreenPool()
+            good = pool.spawn(scheduler.submit, [('<good/>', 'Entity', 'update')])
+            bad = pool.spawn(scheduler.submit, [('<bad/>', 'Entity', 'update')])
+
+            self.assertEqual('reply', good.wait())
+            self.assertRaises(ValueError, bad.wait)
+
+
+class Entity(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class ChangeSetCandidateTest(base.BaseTestCase):
+    def setUp(self):
+        super(ChangeSetCandidateTest, self).setUp()
+        config.register_l3_opts()
+        self.context = mock.Mock(host='candidate-test', use_candidate=True)
+
+    def test_rejected_edit_rolls_back_the_others(self):
+        error = ValueError('rejected')
+        with mock.patch.object(changeset, 'send_candidate', side_effect=CandidateEditFailed(1, error)) as send:
+            with changeset.ChangeSet('router-1') as changes:
+                edits = [changes.add(Entity(id), self.context, '<{}/>'.format(id), 'update') for id in 'abc']
+
+        send.assert_called_once_with(self.context, [('<a/>', 'Entity', 'update'), ('<b/>', 'Entity', 'update'),
+                                                    ('<c/>', 'Entity', 'update')])
+        self.assertIs(error, edits[1].error)
+        for edit in (edits[0], edits[2]):
+            self.assertIsInstance(edit.error, exc.ChangeSetRolledBackException)
+            self.assertIn('rejected', str(edit.error))
+
+    def _send_single_edit(self, capabilities):
+        connection = mock.Mock()
+        connection.commit_candidate.return_value = ['reply']
+        connection.has_capability.side_effect = lambda capability: capability in capabilities
+        manager = mock.MagicMock()
+        manager.return_value.__enter__.return_value = connection
+        with mock.patch.object(ny_base, 'ConnectionManager', manager):
+            ny_base.NyBase._send_edit_config(Entity('a'), self.context, '<a/>', 'update')
+        return connection
+
+    def test_single_edit_goes_to_running(self):
+        connection = self._send_single_edit({ny_base.CAPABILITY_WRITABLE_RUNNING})
+
+        connection.edit_config.assert_called_once_with(config='<a/>', entity='Entity', action='update')
+        connection.commit_candidate.assert_not_called()
+
+    def test_single_edit_uses_candidate_without_writable_running(self):
+        connection = self._send_single_edit(set())
+
+        connection.edit_config.assert_not_called()
+        connection.commit_candidate.assert_called_once_with([('<a/>', 'Entity', 'update')])
+
+
+class FlightOutsideChangeSetTest(base.BaseTestCase):
+    def setUp(self):
+        super(FlightOutsideChangeSetTest, self).setUp()
+        config.register_l3_opts()
+        self.context = mock.Mock(host='preflight-test', use_candidate=False)
+
+    @mock.patch.object(changeset, 'send_merged', return_value='reply')
+    def test_cleanup_is_sent_after_collected_edits_and_outside_the_changeset(self, send_merged):
+        with changeset.ChangeSet('router-1') as changes:
+            edits = [changes.add(Entity(id), self.context, '<{}/>'.format(id), 'update') for id in 'ab']
+            with ny_base.NyBase._outside_changeset(Entity('c'), self.context):
+                # the edits of the preflight are sent right away, after what was collected so far
+                self.assertIsNone(changeset.ChangeSet.current())
+                send_merged.assert_called_once_with(self.context, ['<a/>', '<b/>'])
+                self.assertEqual(['reply', 'reply'], [edit.reply for edit in edits])
+            self.assertIs(changes, changeset.ChangeSet.current())
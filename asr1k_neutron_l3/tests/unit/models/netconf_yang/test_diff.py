@@ -0,0 +1,56 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.models.asr1k_pair import FakeASR1KContext
+from asr1k_neutron_l3.models.netconf_yang.nat import StaticNat, StaticNatList
+from asr1k_neutron_l3.models.netconf_yang.vrf import VrfDefinition
+
+VRF = '1ccc4863d8bc4c82affa0cb198e8d5d1'
+
+
+def static_nat_list(hosts):
+    return StaticNatList(vrf=VRF, static_nats=[StaticNat(vrf=VRF, local_ip='10.0.{}.{}'.format(*divmod(host, 250)),
+                                                         global_ip='192.168.{}.{}'.format(*divmod(host, 250)))
+                                               for host in hosts])
+
+
+class KeyedDiffTest(base.BaseTestCase):
+    def setUp(self):
+        super(KeyedDiffTest, self).setUp()
+        self.context = FakeASR1KContext()
+
+    def test_list_entries_are_matched_by_key(self):
+        device = static_nat_list(range(2, 2000))
+        neutron = static_nat_list(range(1, 2000))
+        neutron.static_nats[500].garp_bdvif_iface = 1234
+        device.static_nats[499].garp_bdvif_iface = 4321
+
+        diff = neutron._diff(self.context, device)
+        self.assertEqual(['change', 'remove'], sorted(d['type'] for d in diff))
+        change = [d for d in diff if d['type'] == 'change'][0]
+        self.assertEqual(('1234', '4321'), (change['neutron'], change['device']))
+        self.assertEqual(VRF, change['entity'])
+
+        self.assertEqual([], static_nat_list([3, 1, 2])._diff(self.context, static_nat_list([2, 3, 1])))
+
+    def test_changes_and_ignored_keys(self):
+        neutron = VrfDefinition(name=VRF, rd='65000:1', enable_bgp=True)
+        device = VrfDefinition(name=VRF, rd='65000:2', enable_bgp=True)
+
+        self.assertEqual([], neutron._diff(self.context, VrfDefinition(name=VRF, rd='65000:1', enable_bgp=True)))
+        self.assertEqual([{'entity': VRF, 'type': 'change', 'item': 'definition.rd',
+                           'neutron': '65000:1', 'device': '65000:2'}], neutron._diff(self.context, device))
+        self.assertEqual(1, len(neutron._diff(self.context, None)))
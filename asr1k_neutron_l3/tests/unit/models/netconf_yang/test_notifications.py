@@ -0,0 +1,132 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+
+from neutron.tests import base
+from oslo_config import cfg
+
+from asr1k_neutron_l3.common import config
+from asr1k_neutron_l3.models.netconf_yang import notifications
+from asr1k_neutron_l3.models.netconf_yang.state_cache import DeviceStateCache
+
+NOTIFICATION = """
+<notification xmlns="urn:ietf:params:xml:ns:netconf:notification:1.0">
+  <eventTime>2024-05-02T10:00:00Z</eventTime>
+  <netconf-config-change xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-notifications">
+    <changed-by><username>admin</username><session-id>{session}</session-id></changed-by>
+    <datastore>running</datastore>
+    <edit>
+      <target xmlns:ios="http://cisco.com/ns/yang/Cisco-IOS-XE-native">{target}</target>
+      <operation>merge</operation>
+    </edit>
+  </netconf-config-change>
+</notification>
+"""
+
+VRF_TARGET = "/ios:native/ios:vrf/ios:definition[ios:name='0123456789abcdef0123456789abcdef']/ios:rd"
+
+
+class ConfigChangeListenerTest(base.BaseTestCase):
+    def setUp(self):
+        super(ConfigChangeListenerTest, self).setUp()
+        self.listener = notifications.ConfigChangeListener(mock.Mock(host='notification-test'))
+        self.addCleanup(mock.patch.stopall)
+        pool = mock.patch.object(notifications, 'ConnectionPool').start()
+        pool.return_value.session_ids.return_value = {'17'}
+        self.invalidate_patch = mock.patch.object(self.listener, 'invalidate')
+        self.invalidate = self.invalidate_patch.start()
+
+    def test_target_is_mapped_to_path_and_keys(self):
+        self.assertEqual((('vrf', 'definition', 'rd'), ['0123456789abcdef0123456789abcdef']),
+                         notifications.parse_target(VRF_TARGET))
+        self.assertIsNone(notifications.parse_target("/ietf-interfaces:interfaces/interface[name='x']"))
+
+    def test_own_changes_are_ignored(self):
+        self.listener.handle(NOTIFICATION.format(session=17, target=VRF_TARGET))
+        self.invalidate.assert_not_called()
+
+        self.listener.handle(NOTIFICATION.format(session=42, target=VRF_TARGET))
+        self.invalidate.assert_called_once_with(('vrf', 'definition', 'rd'), ['0123456789abcdef0123456789abcdef'])
+
+    def test_unattributed_change_bumps_generation(self):
+        self.invalidate_patch.stop()
+        generation = DeviceStateCache().generation('notification-test')
+
+        self.listener.invalidate(('interface', 'BDI'), ['5'])
+        self.assertEqual(generation + 1, DeviceStateCache().generation('notification-test'))
+
+
+class ConfigChangeListenerLoopTest(base.BaseTestCase):
+    def setUp(self):
+        super(ConfigChangeListenerLoopTest, self).setUp()
+        config.register_common_opts()
+        self.host = 'listener-loop-test'
+        self.listener = notifications.ConfigChangeListener(mock.Mock(host=self.host))
+        self.listener._running = True
+        self.handle = mock.patch.object(self.listener, 'handle').start()
+        self.sleep = mock.patch.object(notifications.eventlet, 'sleep').start()
+        self.connect = mock.patch.object(notifications.manager, 'connect').start()
+        self.addCleanup(mock.patch.stopall)
+        DeviceStateCache().unwatch(self.host)
+        self.addCleanup(DeviceStateCache().watch, self.host)
+
+    def _session(self, notifications_xml, stop=False):
+        session = mock.Mock(connected=True)
+
+        def take_notification(block, timeout):
+            self.assertNotIn(self.host, DeviceStateCache().unwatched)
+            if not notifications_xml:
+                # the device closed the session, or the listener is stopped
+                session.connected = False
+                self.listener._running = not stop
+                return None
+            return mock.Mock(notification_xml=notifications_xml.pop(0))
+
+        session.take_notification.side_effect = take_notification
+        return session
+
+    def test_subscribes_and_hands_notifications_over(self):
+        session = self.connect.return_value = self._session(['<first/>', '<second/>'], stop=True)
+
+        self.listener._listen()
+
+        self.assertEqual(1, self.connect.call_count)
+        session.create_subscription.assert_called_once_with(filter=('subtree', notifications.CONFIG_CHANGE_FILTER),
+                                                            stream_name=notifications.NOTIFICATION_STREAM)
+        self.assertEqual([mock.call('<first/>'), mock.call('<second/>')], self.handle.call_args_list)
+        session.close_session.assert_called_once_with()
+
+    def test_reconnects_after_the_session_dropped(self):
+        self.connect.side_effect = [self._session(['<first/>']), self._session(['<second/>'], stop=True)]
+
+        self.listener._listen()
+
+        self.assertEqual(2, self.connect.call_count)
+        self.assertEqual([mock.call('<first/>'), mock.call('<second/>')], self.handle.call_args_list)
+        self.sleep.assert_called_once_with(cfg.CONF.asr1k.connection_check_interval)
+
+    def test_device_is_unwatched_while_not_subscribed(self):
+        # every read of an unwatched device gives a new generation, so no router update is skipped
+        generation = DeviceStateCache().generation(self.host)
+        self.assertNotEqual(generation, DeviceStateCache().generation(self.host))
+
+        self.connect.side_effect = [IOError('connection refused'), self._session([], stop=True)]
+        self.sleep.side_effect = lambda interval: self.assertIn(self.host, DeviceStateCache().unwatched)
+
+        self.listener._listen()
+
+        self.assertEqual(2, self.connect.call_count)
+        self.assertEqual(1, self.sleep.call_count)
+        self.assertIn(self.host, DeviceStateCache().unwatched)
@@ -0,0 +1,99 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import eventlet
+import mock
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.common import asr1k_exceptions as exc
+from asr1k_neutron_l3.models import asr1k_pair
+from asr1k_neutron_l3.models.netconf_yang import ny_base
+from asr1k_neutron_l3.models.netconf_yang import pipeline
+
+
+class Step(object):
+    def __init__(self, name, log, delays):
+        self.name = name
+        self.log = log
+        self.delays = delays
+
+    @ny_base.execute_on_pair()
+    def update(self, context=None):
+        eventlet.sleep(self.delays.get(context.host, 0))
+        self.log.append((context.host, self.name))
+        return context.host
+
+
+class DevicePipelinesTest(base.BaseTestCase):
+    def setUp(self):
+        super(DevicePipelinesTest, self).setUp()
+        contexts = [mock.Mock(host='a', alive=True), mock.Mock(host='b', alive=True)]
+        pair = mock.patch.object(asr1k_pair, 'ASR1KPair', return_value=mock.Mock(contexts=contexts))
+        pair.start()
+        self.addCleanup(pair.stop)
+        self.log = []
+
+    def _apply(self, delays):
+        steps = [Step(name, self.log, delays) for name in ('vrf', 'nat', 'routes')]
+        return lambda: [step.update() for step in steps]
+
+    def test_devices_apply_at_their_own_pace_and_results_are_merged(self):
+        results = pipeline.DevicePipelines('router-1', timeout=5).run(self._apply({'b': 0.01}))
+
+        self.assertEqual([('a', 'vrf'), ('a', 'nat'), ('a', 'routes')], self.log[:3])
+        self.assertEqual(3, len(results))
+        for result in results:
+            self.assertTrue(result.success)
+            self.assertEqual({'a': 'a', 'b': 'b'}, result.results)
+
+    def test_lagging_device_requeues_and_delays_only_itself(self):
+        pipelines = pipeline.DevicePipelines('router-2', timeout=0.05)
+        self.assertRaises(exc.DevicePipelineTimeout, pipelines.run, self._apply({'b': 0.1}))
+        self.assertEqual([('a', 'vrf'), ('a', 'nat'), ('a', 'routes')], self.log)
+
+        # the next update waits on b for the one still running there, a goes ahead
+        del self.log[:]
+        self.assertRaises(exc.DevicePipelineTimeout, pipelines.run, self._apply({}))
+        self.assertEqual(['vrf', 'nat', 'routes'], [name for host, name in self.log if host == 'a'])
+        self.assertNotIn(('b', 'routes'), self.log)
+
+        eventlet.sleep(0.5)
+        self.assertEqual(['vrf', 'nat', 'routes'] * 2, [name for host, name in self.log if host == 'b'])
+        self.assertEqual({}, pipeline.DevicePipelines._running)
+
+    def test_updates_behind_a_lagging_device_are_coalesced(self):
+        pipelines = pipeline.DevicePipelines('router-3', timeout=0.05)
+        self.assertRaises(exc.DevicePipelineTimeout, pipelines.run, self._apply({'b': 0.1}))
+        for delays in ({'b': 0.1}, {}, {}):
+            self.assertRaises(exc.DevicePipelineTimeout, pipelines.run, self._apply(delays))
+
+        eventlet.sleep(0.5)
+        # the run in flight and the latest update, the two in between are dropped
+        self.assertEqual(['vrf', 'nat', 'routes'] * 2, [name for host, name in self.log if host == 'b'])
+        self.assertEqual(['vrf', 'nat', 'routes'] * 4, [name for host, name in self.log if host == 'a'])
+        self.assertEqual({}, pipeline.DevicePipelines._running)
+
+    def test_failure_on_one_device_logs_results_of_the_other(self):
+        def apply():
+            if ny_base.pair_contexts()[0].host == 'b':
+                raise exc.InconsistentModelException(host='b', entity=None, operation='update', info='test')
+            return Step('vrf', self.log, {}).update()
+
+        with mock.patch.object(pipeline.LOG, 'warning') as warning:
+            pipelines = pipeline.DevicePipelines('router-4', timeout=5)
+            self.assertRaises(exc.InconsistentModelException, pipelines.run, apply)
+
+        result = warning.call_args[0][-1]
+        self.assertEqual({'a': 'a'}, result.results)
@@ -0,0 +1,119 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from lxml import etree
+import mock
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.models.netconf_yang import prefetch
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.netconf_yang.l3_interface import VBInterface
+from asr1k_neutron_l3.models.netconf_yang.vrf import VrfDefinition
+
+NATIVE = """
+<native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+  <vrf>
+    <definition><name>1</name><rd>65000:1</rd></definition>
+    <definition><name>2</name><rd>65000:2</rd></definition>
+    <definition><name>3</name><rd>65000:3</rd></definition>
+  </vrf>
+  <interface>
+    <BDI><name>5</name><vrf><forwarding>1</forwarding></vrf></BDI>
+  </interface>
+</native>
+"""
+
+
+class CombinedGetTest(base.BaseTestCase):
+    def test_filters_are_merged_below_one_native(self):
+        filters = [VrfDefinition.ID_FILTER.format(id=1), VrfDefinition.ID_FILTER.format(id=2),
+                   VrfDefinition.ID_FILTER.format(id=1), VBInterface.ID_FILTER.format(iftype='BDI', id=5),
+                   '<native><vrf><definition><name>1</name><rd/></definition></vrf></native>']
+        native = etree.fromstring(prefetch.merge_filters(filters))
+
+        self.assertEqual(xml_utils.NS_CISCO_NATIVE, etree.QName(native).namespace)
+        self.assertEqual(1, len(native.findall('{*}vrf')))
+        definitions = native.findall('{*}vrf/{*}definition')
+        self.assertEqual(['1', '2'], [definition.findtext('{*}name') for definition in definitions])
+        # the full entry selected by the first filter covers the selection of <rd> only
+        self.assertEqual(1, len(definitions[0]))
+        self.assertEqual(['5'], [bdi.findtext('{*}name') for bdi in native.findall('{*}interface/{*}BDI')])
+
+    def test_reply_is_split_per_filter(self):
+        filters = [VrfDefinition.ID_FILTER.format(id=2), VrfDefinition.ID_FILTER.format(id=4)]
+        combined = prefetch.CombinedGet(None, filters)
+        combined.native = lambda: xml_utils.find_native(NATIVE)
+
+        vrf = VrfDefinition.from_xml(prefetch.FilteredReply(combined, filters[0]).result().xml, None)
+        self.assertEqual('2', vrf.name)
+        self.assertEqual('65000:2', vrf.rd)
+        self.assertIsNone(VrfDefinition.from_xml(prefetch.FilteredReply(combined, filters[1]).result().xml, None))
+
+    def test_edit_drops_the_filtered_replies_it_touches(self):
+        context = mock.Mock(host='combined-test')
+        filters = {VrfDefinition: VrfDefinition.ID_FILTER.format(id=1),
+                   VBInterface: VBInterface.ID_FILTER.format(iftype='BDI', id=5)}
+        combined = prefetch.CombinedGet(context, filters.values())
+        combined.native = lambda: xml_utils.find_native(NATIVE)
+        reads = prefetch.Prefetch('router-1')
+        for cls, nc_filter in filters.items():
+            key = reads._key(context, cls, nc_filter)
+            reads._paths[key] = prefetch._edited_paths(nc_filter)
+            reads._futures[key] = prefetch.FilteredReply(combined, nc_filter)
+
+        reads.invalidate(context, '<config><native><vrf><definition><name>1</name><rd>65000:9</rd></definition>'
+                                  '</vrf></native></config>')
+
+        self.assertIsNone(reads.combined_reply(context, VrfDefinition, filters[VrfDefinition]))
+        reply = reads.combined_reply(context, VBInterface, filters[VBInterface])
+        self.assertIn('<name>5</name>', reply.xml)
+
+
+class PrefetchInvalidationTest(base.BaseTestCase):
+    def setUp(self):
+        super(PrefetchInvalidationTest, self).setUp()
+        self.context = mock.Mock(host='prefetch-test')
+        self.prefetch = prefetch.Prefetch('router-1')
+        self.filters = {VrfDefinition: VrfDefinition.ID_FILTER.format(id=1),
+                        VBInterface: VBInterface.ID_FILTER.format(iftype='BDI', id=5)}
+        for cls, nc_filter in self.filters.items():
+            key = self.prefetch._key(self.context, cls, nc_filter)
+            self.prefetch._paths[key] = prefetch._edited_paths(nc_filter)
+            self.prefetch._futures[key] = mock.Mock()
+
+    def _prefetched(self):
+        return sorted(key[1] for key in self.prefetch._futures)
+
+    def test_edit_drops_prefetches_below_its_config_whatever_their_type(self):
+        # VBInterface.postflight deleting the dynamic NAT of an interface does not touch it
+        self.prefetch.invalidate(self.context, '<config><native><ip><nat><inside><source><interface>'
+                                               '<id>NAT-1</id></interface></source></inside></nat></ip>'
+                                               '</native></config>')
+        self.assertEqual(['VBInterface', 'VrfDefinition'], self._prefetched())
+
+        # an edit of the BDI does
+        self.prefetch.invalidate(self.context, '<config><native><interface><BDI><name>5</name>'
+                                               '<description>x</description></BDI></interface></native></config>')
+        self.assertEqual(['VrfDefinition'], self._prefetched())
+        self.assertIsNone(self.prefetch.take(self.context, VBInterface, self.filters[VBInterface]))
+
+    def test_edit_without_native_drops_all_prefetches_of_the_device(self):
+        other = mock.Mock(host='other')
+        key = self.prefetch._key(other, VrfDefinition, self.filters[VrfDefinition])
+        self.prefetch._paths[key] = prefetch._edited_paths(self.filters[VrfDefinition])
+        self.prefetch._futures[key] = mock.Mock()
+
+        self.prefetch.invalidate(self.context, '<config/>')
+        self.assertEqual([('other', 'VrfDefinition')], [key[:2] for key in self.prefetch._futures])
@@ -0,0 +1,61 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.models.netconf_yang.access_list import AccessList
+from asr1k_neutron_l3.models.netconf_yang.l2_interface import BridgeDomain
+from asr1k_neutron_l3.models.netconf_yang.ny_base import NyBase
+from asr1k_neutron_l3.models.netconf_yang.schema import Schema
+from asr1k_neutron_l3.models.netconf_yang.vrf import VrfDefinition
+
+
+class SchemaTest(base.BaseTestCase):
+    def test_schema_is_compiled_once_per_class(self):
+        schema = Schema.of(VrfDefinition)
+
+        self.assertIs(schema, Schema.of(VrfDefinition))
+        self.assertIsNot(schema, Schema.of(BridgeDomain))
+        self.assertEqual('name', schema.id_field)
+        self.assertEqual(('address-family',), schema.by_key['address_family_ipv4'].yang_path)
+        self.assertEqual('ipv4', schema.by_key['address_family_ipv4'].json_key)
+
+    def test_schema_is_compiled_with_the_class(self):
+        self.assertIsNotNone(VrfDefinition.__dict__['_schema'])
+        # refers to classes defined further down its module
+        self.assertIsNotNone(AccessList.__dict__['_schema'])
+
+        class Outer(NyBase):
+            @classmethod
+            def __parameters__(cls):
+                return [{'key': 'name', 'id': True}, {'key': 'inner', 'type': [Inner]}]
+
+        self.assertIsNone(Outer.__dict__['_schema'])
+
+        class Inner(NyBase):
+            @classmethod
+            def __parameters__(cls):
+                return [{'key': 'name', 'id': True}]
+
+        self.assertIsNotNone(Inner.__dict__['_schema'])
+        self.assertIs(Inner, Schema.of(Outer).by_key['inner'].item_type)
+        self.assertIs(Schema.of(Outer), Outer.__dict__['_schema'])
+
+    def test_objects_do_not_share_defaults(self):
+        first = BridgeDomain(id=1)
+        second = BridgeDomain(id=2)
+
+        first.if_members.append('member')
+        self.assertEqual([], second.if_members)
+        self.assertEqual('2', second.id)
@@ -12,13 +12,18 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from collections import OrderedDict
 from copy import deepcopy
+from lxml import etree
 import xmltodict
 
 from neutron.tests import base
 
 from asr1k_neutron_l3.models.asr1k_pair import FakeASR1KContext
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.netconf_yang.access_list import AccessList, ACERule, ACLRule
 from asr1k_neutron_l3.models.netconf_yang.nat import NATConstants, StaticNat
+from asr1k_neutron_l3.models.netconf_yang.vrf import VrfDefinition
 
 
 class SerializationTest(base.BaseTestCase):
@@ -85,3 +90,60 @@ class SerializationTest(base.BaseTestCase):
 
         context_17_13 = FakeASR1KContext()
         self.assertEqual({'@operation': 'remove'}, sn.to_single_dict(context_17_13).get('garp-interface'))
+
+    def test_to_xml_writes_what_xmltodict_would(self):
+        context = FakeASR1KContext()
+        sn = StaticNat(vrf='the-seagull-is-a-majestic-bird', local_ip='10.10.23.12', global_ip='192.168.23.12',
+                       match_in_vrf=True, garp_bdvif_iface=1234)
+
+        native = sn._native_content(sn.to_dict(context), 'merge', context)
+        native[xml_utils.NS] = xml_utils.NS_CISCO_NATIVE
+        config = OrderedDict([(xml_utils.IOS_NATIVE, native), (xml_utils.NS, xml_utils.NS_NETCONF_BASE)])
+        expected = xmltodict.unparse({xml_utils.CONFIG: config}, full_document=False)
+
+        def c14n(xml):
+            return etree.tostring(etree.fromstring(xml), method='c14n')
+
+        self.assertEqual(c14n(expected), c14n(sn.to_xml(context, operation='merge')))
+
+    def test_to_xml_reuses_serialisation_of_equal_content(self):
+        context = FakeASR1KContext()
+        vrf = VrfDefinition(name='1ccc4863d8bc4c82affa0cb198e8d5d1', rd='65000:1')
+        self.assertIsNone(vrf.last_xml())
+
+        xml = vrf.to_xml(context, operation='merge')
+        self.assertIs(xml, vrf.to_xml(context, operation='merge'))
+        self.assertIs(xml, vrf.last_xml())
+        self.assertIsNot(xml, vrf.to_xml(context, operation='replace'))
+
+        vrf.rd = '65000:2'
+        self.assertIn('65000:2', vrf.to_xml(context, operation='merge'))
+
+    def test_to_xml_keeps_serialisation_per_device(self):
+        vrf = VrfDefinition(name='1ccc4863d8bc4c82affa0cb198e8d5d1', rd='65000:1')
+        first, second = FakeASR1KContext(), FakeASR1KContext()
+        first.host, second.host = 'first', 'second'
+
+        xml = vrf.to_xml(first, operation='merge')
+        vrf.rd = '65000:2'
+        vrf.to_xml(second, operation='merge')
+
+        self.assertIs(xml, vrf.last_xml('first'))
+        self.assertIn('65000:2', vrf.last_xml('second'))
+
+    def test_to_xml_serialises_nested_changes_again(self):
+        context = FakeASR1KContext()
+        rules = [ACLRule(access_list='NAT-1', sequence=str(10 * i),
+                         ace_rule=[ACERule(access_list='NAT-1', action='permit', protocol='ip',
+                                           ipv4_address='10.0.{}.0'.format(i), mask='0.0.0.255')])
+                 for i in range(1, 4)]
+        acl = AccessList(name='NAT-1', rules=rules)
+
+        xml = acl.to_xml(context, operation='replace')
+        self.assertIs(xml, acl.to_xml(context, operation='replace'))
+
+        rules[2].ace_rule[0].ipv4_address = '10.9.3.0'
+        changed = acl.to_xml(context, operation='replace')
+        self.assertNotIn('10.0.3.0', changed)
+        self.assertIn('10.9.3.0', changed)
+        self.assertIs(changed, acl.last_xml())
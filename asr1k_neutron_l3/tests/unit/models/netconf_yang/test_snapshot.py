@@ -0,0 +1,69 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from lxml import etree
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.models.netconf_yang import snapshot
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.netconf_yang.vrf import VrfDefinition
+
+NATIVE = """
+<native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+  <vrf>
+    <definition><name>1</name><rd>65000:1</rd><description>one</description></definition>
+    <definition><name>2</name><rd>65000:2</rd><description>two</description></definition>
+  </vrf>
+  <interface>
+    <BDI><name>5</name><vrf><forwarding>1</forwarding></vrf></BDI>
+  </interface>
+</native>
+"""
+
+
+class ConfigSnapshotTest(base.BaseTestCase):
+    def setUp(self):
+        super(ConfigSnapshotTest, self).setUp()
+        self.snapshot = snapshot.DeviceSnapshot('snapshot-test')
+        self.snapshot.native = xml_utils.find_native(NATIVE)
+        self.snapshot.fetch = lambda context: self.snapshot.native
+
+    def test_list_entry_is_selected_by_key(self):
+        xml = self.snapshot.get(None, VrfDefinition.ID_FILTER.format(id=2))
+
+        vrf = VrfDefinition.from_xml(xml, None)
+        self.assertEqual('2', vrf.name)
+        self.assertEqual('65000:2', vrf.rd)
+
+    def test_missing_entry_gives_empty_reply(self):
+        xml = self.snapshot.get(None, VrfDefinition.ID_FILTER.format(id=3))
+
+        self.assertIsNone(VrfDefinition.from_xml(xml, None))
+
+    def test_selection_node_limits_reply(self):
+        nc_filter = etree.fromstring('<native><vrf><definition><name>1</name><rd/></definition></vrf></native>')
+        result = snapshot.apply_filter(self.snapshot.native, nc_filter)
+
+        definition = result.find('{*}vrf/{*}definition')
+        self.assertEqual(['name', 'rd'], [etree.QName(child).localname for child in definition])
+
+    def test_edit_bypasses_snapshot_below_touched_container(self):
+        self.snapshot.invalidate('<config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+                                 '<native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native"><vrf><definition>'
+                                 '<name>7</name></definition></vrf></native></config>')
+
+        self.assertIsNone(self.snapshot.get(None, VrfDefinition.ID_FILTER.format(id=1)))
+        self.assertIsNotNone(self.snapshot.get(None, '<native><interface><BDI><name>5</name></BDI></interface>'
+                                                     '</native>'))
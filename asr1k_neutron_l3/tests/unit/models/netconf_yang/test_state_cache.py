@@ -0,0 +1,79 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+
+from neutron.tests import base
+from oslo_config import cfg
+
+from asr1k_neutron_l3.common import config
+from asr1k_neutron_l3.models.netconf_yang.state_cache import DeviceStateCache
+from asr1k_neutron_l3.models.netconf_yang.vrf import VrfDefinition
+
+
+def _config(native):
+    return ('<config xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+            '<native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">{}</native></config>'.format(native))
+
+
+class DeviceStateCacheTest(base.BaseTestCase):
+    def setUp(self):
+        super(DeviceStateCacheTest, self).setUp()
+        config.register_common_opts()
+        cfg.CONF.set_override('device_state_cache_ttl', 60, 'asr1k')
+        self.cache = DeviceStateCache()
+        self.cache.entries.clear()
+        self.context = mock.Mock(host='state-cache-test')
+        self.vrf = VrfDefinition(name='1', rd='65000:1')
+        self.cache.store(self.context, self.vrf, self.vrf)
+
+    def test_written_entity_is_returned_until_expired(self):
+        self.assertIs(self.vrf, self.cache.get(self.context, VrfDefinition(name='1', rd='65000:1')))
+        self.assertIsNone(self.cache.get(self.context, VrfDefinition(name='2', rd='65000:2')))
+
+        for entry in self.cache.entries.values():
+            entry.expires = 0
+        self.assertIsNone(self.cache.get(self.context, self.vrf))
+
+    def test_edits_drop_overlapping_entries(self):
+        self.cache.invalidate(self.context, _config('<interface><BDI><name>5</name></BDI></interface>'))
+        self.assertIsNotNone(self.cache.get(self.context, self.vrf))
+
+        self.cache.invalidate(self.context, _config('<vrf><definition><name>2</name></definition></vrf>'))
+        self.assertIsNone(self.cache.get(self.context, self.vrf))
+
+    def test_delete_flushes_device(self):
+        self.cache.invalidate(self.context, _config('<ip><route operation="delete"><vrf><name>1</name></vrf>'
+                                                    '</route></ip>'))
+
+        self.assertIsNone(self.cache.get(self.context, self.vrf))
+
+    def test_delete_moves_on_generations_of_its_vrfs_only(self):
+        host = self.context.host
+        vrf = '0123456789abcdef0123456789abcdef'
+        router_id = '11111111-2222-3333-4444-555555555555'
+        before = {name: self.cache.generation(host, name) for name in (vrf, router_id.replace('-', ''), 'other')}
+
+        self.cache.invalidate(self.context, _config('<ip><route operation="delete"><vrf><name>{}</name></vrf>'
+                                                    '</route></ip>'.format(vrf)), router_id=router_id)
+
+        self.assertIsNone(self.cache.get(self.context, self.vrf))
+        self.assertEqual(before['other'], self.cache.generation(host, 'other'))
+        for name in (vrf, router_id.replace('-', '')):
+            self.assertEqual(before[name][1] + 1, self.cache.generation(host, name)[1])
+
+        # a delete nobody can attribute concerns every router on the device
+        self.cache.invalidate(self.context, _config('<interface><BDI operation="delete"><name>5</name></BDI>'
+                                                    '</interface>'))
+        self.assertEqual(before['other'][0] + 1, self.cache.generation(host, 'other')[0])
@@ -0,0 +1,90 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from lxml import etree
+import mock
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.models.asr1k_pair import FakeASR1KContext
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.models.netconf_yang.arp_cache import ArpCache
+from asr1k_neutron_l3.models.netconf_yang.l2_interface import ExternalInterface
+
+SERVICE_INSTANCES = """
+<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+  <data>
+    <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+      <interface>
+        <Port-channel>
+          <name>1</name>
+          <service>
+            <instance xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-ethernet"><id>4097</id></instance>
+            <instance xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-ethernet"><id>4098</id></instance>
+          </service>
+        </Port-channel>
+      </interface>
+    </native>
+  </data>
+</rpc-reply>
+"""
+
+ARP_DATA = """
+<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+  <data>
+    <arp-data xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-arp-oper">
+      <arp-vrf>
+        <vrf>1ccc4863d8bc4c82affa0cb198e8d5d1</vrf>
+        <arp-entry><address>10.0.0.1</address><hardware>fa:16:3e:00:00:01</hardware></arp-entry>
+        <arp-entry><address>10.0.0.2</address><hardware>fa:16:3e:00:00:02</hardware></arp-entry>
+      </arp-vrf>
+      <arp-vrf>
+        <vrf>Mgmt-intf</vrf>
+        <arp-entry><address>10.0.0.2</address><hardware>fa:16:3e:00:00:03</hardware></arp-entry>
+      </arp-vrf>
+    </arp-data>
+  </data>
+</rpc-reply>
+"""
+
+
+class StreamTest(base.BaseTestCase):
+    def test_items_keep_their_ancestors(self):
+        context = FakeASR1KContext()
+        path = ExternalInterface.get_stub_item_path(context)
+        self.assertEqual(('native', 'interface', 'Port-channel', 'service', 'instance'), path)
+
+        for xml in (SERVICE_INSTANCES, etree.fromstring(SERVICE_INSTANCES)):
+            items = list(xml_utils.iter_items(xml, path, ExternalInterface.namespaces))
+            self.assertEqual(2, len(items))
+            port_channel = items[1]['native']['interface']['Port-channel']
+            self.assertEqual('1', port_channel['name'])
+            self.assertEqual('4098', port_channel['service']['instance']['id'])
+
+        streamed = []
+        for item in xml_utils.iter_items(SERVICE_INSTANCES, path, ExternalInterface.namespaces):
+            streamed += ExternalInterface.get_all_from_device_config(item, context, stubs=True)
+        full = ExternalInterface.get_all_from_device_config(ExternalInterface.to_plain_raw_json(SERVICE_INSTANCES),
+                                                            context, stubs=True)
+        self.assertEqual([stub.id for stub in full], [stub.id for stub in streamed])
+
+    @mock.patch('asr1k_neutron_l3.models.netconf_yang.arp_cache.ConnectionManager')
+    def test_arp_cache_is_read_per_vrf(self, connection_manager):
+        connection = connection_manager.return_value.__enter__.return_value
+        connection.get.return_value = mock.Mock(xml=ARP_DATA, data_ele=None)
+
+        vrfs = list(ArpCache._iter_vrfs(FakeASR1KContext()))
+        self.assertEqual(['1ccc4863d8bc4c82affa0cb198e8d5d1', 'Mgmt-intf'], [vrf.vrf for vrf in vrfs])
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], [entry.address for entry in vrfs[0].entries])
+        self.assertEqual(['fa:16:3e:00:00:03'], [entry.mac for entry in vrfs[1].entries])
@@ -0,0 +1,89 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.models.asr1k_pair import FakeASR1KContext
+from asr1k_neutron_l3.models.netconf_yang.access_list import AccessList
+from asr1k_neutron_l3.models.netconf_yang.stub import EntityStub
+from asr1k_neutron_l3.models.netconf_yang.l3_interface import VBInterface
+from asr1k_neutron_l3.models.netconf_yang.vrf import VrfDefinition
+
+VRF_STUBS = """
+<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+  <data>
+    <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+      <vrf>
+        <definition><name>1ccc4863d8bc4c82affa0cb198e8d5d1</name></definition>
+        <definition><name>2ccc4863d8bc4c82affa0cb198e8d5d1</name></definition>
+      </vrf>
+    </native>
+  </data>
+</rpc-reply>
+"""
+
+
+class EntityStubTest(base.BaseTestCase):
+    def setUp(self):
+        super(EntityStubTest, self).setUp()
+        context = FakeASR1KContext()
+        json = VrfDefinition.to_plain_raw_json(VRF_STUBS)
+        self.stubs = VrfDefinition.get_all_from_device_config(json, context, stubs=True)
+
+    def test_stub_behaves_like_its_entity(self):
+        stub = self.stubs[0]
+
+        self.assertIsInstance(stub, EntityStub)
+        self.assertIs(VrfDefinition, stub.entity_class)
+        self.assertEqual('1ccc4863d8bc4c82affa0cb198e8d5d1', stub.id)
+        self.assertEqual('1ccc4863-d8bc-4c82-affa-0cb198e8d5d1', stub.neutron_router_id)
+        self.assertTrue(stub.is_orphan(all_router_ids=[], all_segmentation_ids=[], all_bd_ids=[],
+                                       all_routers_with_external_policies=[], context=None))
+        self.assertRaises(AttributeError, setattr, stub, 'name', 'other')
+
+    def test_stub_holds_only_its_keys_and_upgrades_to_entity(self):
+        stub = self.stubs[1]
+        self.assertIs(type(self.stubs[0]), type(stub))
+        self.assertFalse(hasattr(stub, '__dict__'))
+        self.assertRaises(AttributeError, getattr, stub, 'address_family_ipv4')
+        self.assertRaises(AttributeError, getattr, stub, 'force_delete')
+
+        entity = stub.entity()
+        self.assertIs(VrfDefinition, type(entity))
+        self.assertEqual('2ccc4863d8bc4c82affa0cb198e8d5d1', entity.name)
+        self.assertEqual(stub.id, entity.id)
+        self.assertFalse(entity.force_delete)
+
+    def test_stub_keeps_what_the_orphan_checks_need(self):
+        json = {'name': '4097', 'description': 'long description', 'mtu': '1500',
+                'vrf': {'forwarding': '1ccc4863d8bc4c82affa0cb198e8d5d1'}}
+        stub = EntityStub.of(VBInterface, json, FakeASR1KContext())
+
+        self.assertEqual('4097', stub.id)
+        self.assertEqual('1ccc4863-d8bc-4c82-affa-0cb198e8d5d1', stub.neutron_router_id)
+        self.assertRaises(AttributeError, getattr, stub, 'description')
+        self.assertFalse(stub.is_reassigned(stub.entity()))
+
+    def test_access_list_stub_runs_the_inherited_orphan_check(self):
+        stub = EntityStub.of(AccessList, {'name': 'NAT-1ccc4863d8bc4c82affa0cb198e8d5d1'}, FakeASR1KContext())
+
+        self.assertFalse(hasattr(stub, '__dict__'))
+        context = mock.Mock(version_min_17_3=False)
+        self.assertFalse(stub.is_orphan(all_router_ids=['1ccc4863-d8bc-4c82-affa-0cb198e8d5d1'],
+                                        all_segmentation_ids=[], all_bd_ids=[],
+                                        all_routers_with_external_policies=[], context=context))
+        self.assertTrue(stub.is_orphan(all_router_ids=[], all_segmentation_ids=[], all_bd_ids=[],
+                                       all_routers_with_external_policies=[], context=context))
@@ -0,0 +1,60 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+
+import mock
+import xmltodict
+from lxml import etree
+
+from asr1k_neutron_l3.models.netconf_yang import xml_utils
+from asr1k_neutron_l3.tests.unit.models.netconf_yang import test_parsing
+
+
+class XmltodictParsingTest(test_parsing.ParsingTest):
+    """The parsing tests with the xmltodict fallback parser"""
+
+    def setUp(self):
+        super(XmltodictParsingTest, self).setUp()
+        self.patch = mock.patch.object(xml_utils.XMLUtils, 'lxml_parser', False)
+        self.patch.start()
+        self.addCleanup(self.patch.stop)
+
+
+class ParserParityTest(test_parsing.ParsingTest):
+    """The parsing tests, checking every reply parsed by lxml against xmltodict"""
+
+    def setUp(self):
+        super(ParserParityTest, self).setUp()
+        test = self
+
+        def to_raw_json(cls, xml):
+            result = xml_utils.element_to_dict(xml, cls.namespaces)
+            expected = xmltodict.parse(xml, process_namespaces=True, namespaces=cls.namespaces,
+                                       namespace_separator=' ')
+            test.assertEqual(json.loads(json.dumps(expected)), result)
+            return result
+
+        self.patch = mock.patch.object(xml_utils.XMLUtils, 'to_raw_json', classmethod(to_raw_json))
+        self.patch.start()
+        self.addCleanup(self.patch.stop)
+
+    def test_mixed_content_and_attributes(self):
+        xml = """<a xmlns="urn:a" xmlns:b="urn:b" b:x="1"><c>text</c><c/> tail <b:d y="2">d</b:d>
+                 <e xmlns="urn:e">e</e></a>"""
+
+        expected = json.loads(json.dumps(xmltodict.parse(xml, process_namespaces=True,
+                                                         namespaces={'urn:a': None}, namespace_separator=' ')))
+        self.assertEqual(expected, xml_utils.element_to_dict(xml, {'urn:a': None}))
+        self.assertEqual(expected, xml_utils.element_to_dict(etree.fromstring(xml), {'urn:a': None}))
@@ -0,0 +1,61 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+
+from neutron.tests import base
+from oslo_config import cfg
+
+from asr1k_neutron_l3.common import config
+from asr1k_neutron_l3.models.netconf_yang.state_cache import DeviceStateCache
+from asr1k_neutron_l3.models.netconf_yang.vrf import VrfDefinition
+from asr1k_neutron_l3.models.neutron.l3 import fingerprint
+
+
+class RouterFingerprintTest(base.BaseTestCase):
+    def setUp(self):
+        super(RouterFingerprintTest, self).setUp()
+        config.register_l3_opts()
+        cfg.CONF.set_override('unchanged_router_skip_time', 3600, 'asr1k_l3')
+        self.contexts = [mock.Mock(host='fingerprint-test')]
+        self.router = {'id': 'r1', 'status': 'ACTIVE', 'routes': []}
+
+    def _fingerprint(self, router, rd='65000:1'):
+        return fingerprint.router_fingerprint(router, [VrfDefinition(name='r1', rd=rd)], self.contexts)
+
+    def test_fingerprint_ignores_volatile_keys_only(self):
+        digest = self._fingerprint(self.router)
+
+        self.assertEqual(digest, self._fingerprint(dict(self.router, status='ERROR')))
+        self.assertNotEqual(digest, self._fingerprint(dict(self.router, routes=[{'nexthop': '10.0.0.1'}])))
+        self.assertNotEqual(digest, self._fingerprint(self.router, rd='65000:2'))
+
+    def test_device_generation_change_forces_update(self):
+        fingerprints = fingerprint.RouterFingerprints()
+        digest = self._fingerprint(self.router)
+        fingerprints.record('r1', digest, fingerprints.generations(self.contexts, 'r1'))
+
+        self.assertTrue(fingerprints.unchanged('r1', digest, self.contexts))
+        DeviceStateCache().flush('fingerprint-test')
+        self.assertFalse(fingerprints.unchanged('r1', digest, self.contexts))
+
+    def test_delete_of_another_router_keeps_fingerprint(self):
+        fingerprints = fingerprint.RouterFingerprints()
+        digest = self._fingerprint(self.router)
+        fingerprints.record('r1', digest, fingerprints.generations(self.contexts, 'r1'))
+
+        DeviceStateCache().flush('fingerprint-test', vrfs={'r2'})
+        self.assertTrue(fingerprints.unchanged('r1', digest, self.contexts))
+        DeviceStateCache().flush('fingerprint-test', vrfs={'r1'})
+        self.assertFalse(fingerprints.unchanged('r1', digest, self.contexts))
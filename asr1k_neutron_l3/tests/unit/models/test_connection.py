@@ -0,0 +1,372 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import socket
+
+import eventlet
+from eventlet import event
+import mock
+from ncclient.operations.rpc import RPCError
+from ncclient.xml_ import to_ele
+
+from neutron.tests import base
+from oslo_config import cfg
+
+from asr1k_neutron_l3.common import config
+from asr1k_neutron_l3.common.asr1k_exceptions import DeviceUnreachable
+from asr1k_neutron_l3.models import connection as pool_connection
+from asr1k_neutron_l3.models.connection import CandidateEditFailed
+from asr1k_neutron_l3.models.connection import ConnectionPool
+from asr1k_neutron_l3.models.connection import ConnectionPoolExhausted
+from asr1k_neutron_l3.models.connection import DeviceConnectionQueue
+from asr1k_neutron_l3.models.connection import DeviceLiveness
+from asr1k_neutron_l3.models.connection import SharedConnection
+from asr1k_neutron_l3.models.connection import YangConnection
+
+
+class FakeEvent(object):
+    # the parts of threading.Event RpcFuture uses, on top of an eventlet event
+    def __init__(self):
+        self._event = event.Event()
+
+    def wait(self, timeout=None):
+        with eventlet.Timeout(timeout, False):
+            self._event.wait()
+
+    def is_set(self):
+        return self._event.ready()
+
+    def send(self):
+        self._event.send()
+
+
+class FakeRPC(object):
+    def __init__(self, args, kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.event = FakeEvent()
+        self.error = None
+        self.reply = mock.Mock(error=None)
+
+    def answer(self):
+        self.event.send()
+
+
+class FakeOperation(object):
+    sent = []
+
+    def __init__(self, session, device_handler=None, async_mode=False, timeout=None, raise_mode=None):
+        self.async_mode = async_mode
+
+    def request(self, *args, **kwargs):
+        rpc = FakeRPC(args, kwargs)
+        self.sent.append(rpc)
+        return rpc
+
+
+def rpc_error(message='rejected'):
+    return RPCError(to_ele('<rpc-error xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+                           '<error-type>application</error-type><error-tag>operation-failed</error-tag>'
+                           '<error-severity>error</error-severity><error-message>{}</error-message>'
+                           '</rpc-error>'.format(message)))
+
+
+class DeviceConnectionQueueTest(base.BaseTestCase):
+    def test_idle_connection_is_returned_immediately(self):
+        queue = DeviceConnectionQueue('host', ['a', 'b'])
+
+        self.assertEqual('a', queue.acquire(1, timeout=0.1))
+        self.assertEqual('b', queue.acquire(1, timeout=0.1))
+        self.assertRaises(ConnectionPoolExhausted, queue.acquire, 1, timeout=0.01)
+
+    def test_waiters_are_served_by_priority_then_arrival(self):
+        queue = DeviceConnectionQueue('host', ['a'])
+        connection = queue.acquire(1)
+        served = []
+
+        def wait(name, priority):
+            served.append((name, queue.acquire(priority, timeout=5)))
+            queue.release(served[-1][1])
+
+        pool = eventlet.GreenPool()
+        pool.spawn(wait, 'sync-1', 2)
+        pool.spawn(wait, 'rpc-1', 1)
+        pool.spawn(wait, 'sync-2', 2)
+        pool.spawn(wait, 'rpc-2', 1)
+        eventlet.sleep(0)
+
+        queue.release(connection)
+        pool.waitall()
+
+        self.assertEqual(['rpc-1', 'rpc-2', 'sync-1', 'sync-2'], [name for name, _ in served])
+
+    def test_timed_out_waiter_is_skipped(self):
+        queue = DeviceConnectionQueue('host', ['a'])
+        connection = queue.acquire(1)
+
+        self.assertRaises(ConnectionPoolExhausted, queue.acquire, 1, timeout=0.01)
+        queue.release(connection)
+
+        self.assertEqual(0, queue.waiting)
+        self.assertEqual('a', queue.acquire(1, timeout=0.1))
+
+
+class DeviceLivenessTest(base.BaseTestCase):
+    def test_unreachable_after_consecutive_failures(self):
+        liveness = DeviceLiveness()
+        self.assertIsNone(liveness.is_reachable('liveness-test-1'))
+
+        liveness.record_success('liveness-test-1')
+        for _ in range(DeviceLiveness.FAILURE_THRESHOLD - 1):
+            liveness.record_failure('liveness-test-1')
+        self.assertTrue(liveness.is_reachable('liveness-test-1'))
+
+        liveness.record_failure('liveness-test-1')
+        self.assertFalse(liveness.is_reachable('liveness-test-1'))
+
+        liveness.record_success('liveness-test-1')
+        self.assertTrue(liveness.is_reachable('liveness-test-1'))
+
+    def test_failed_connect_is_fatal(self):
+        liveness = DeviceLiveness()
+        liveness.record_success('liveness-test-2')
+        liveness.record_failure('liveness-test-2', fatal=True)
+
+        self.assertFalse(liveness.is_reachable('liveness-test-2'))
+
+
+class ConnectionPoolMaintenanceTest(base.BaseTestCase):
+    def setUp(self):
+        super(ConnectionPoolMaintenanceTest, self).setUp()
+        config.register_common_opts()
+        self.context = mock.Mock(host='maintenance-test', alive=True, nc_timeout=30)
+        self.connections = [self._connection(i) for i in range(3)]
+
+        self.pool = object.__new__(ConnectionPool)
+        self.pool.pair_config = mock.Mock(contexts=[self.context])
+        self.pool.devices = {self.context.host: DeviceConnectionQueue(self.context.host, self.connections)}
+        self.pool.connections = {self.context.host: list(self.connections)}
+        self.pool._rotating = set()
+        self.pool._probing = set()
+        self.pool.keepalive_interval = 60
+
+        idle_time = mock.patch.object(DeviceLiveness, 'idle_time', return_value=0)
+        idle_time.start()
+        self.addCleanup(idle_time.stop)
+
+    def _connection(self, id):
+        connection = YangConnection(self.context, id=id, max_age=60)
+        connection._ncc_connection = mock.Mock(name='session-{}'.format(id))
+        connection._connect = mock.Mock(return_value=mock.Mock(name='new-session-{}'.format(id)))
+        return connection
+
+    def _age(self, *connections):
+        for connection in connections:
+            connection.start -= 3600
+
+    def test_aged_connections_are_rotated_one_at_a_time(self):
+        self._age(*self.connections)
+
+        with mock.patch.object(pool_connection.eventlet, 'spawn_n') as spawn_n:
+            self.pool._maintain_connections()
+            self.pool._maintain_connections()
+
+        spawn_n.assert_called_once_with(self.pool._replace_connection, self.context, self.connections[0], True)
+        self.assertEqual(2, len(self.pool.devices[self.context.host]))
+
+        # once the rotation is done the next aged one follows
+        self.pool._replace_connection(self.context, self.connections[0], True)
+        self.assertFalse(self.connections[0].expired)
+        with mock.patch.object(pool_connection.eventlet, 'spawn_n') as spawn_n:
+            self.pool._maintain_connections()
+        spawn_n.assert_called_once_with(self.pool._replace_connection, self.context, self.connections[1], True)
+
+    def test_busy_shared_session_is_not_rotated(self):
+        self._age(self.connections[0])
+        self.connections[0].inflight = 1
+
+        with mock.patch.object(pool_connection.eventlet, 'spawn_n') as spawn_n:
+            self.pool._maintain_connections()
+        spawn_n.assert_not_called()
+
+    def test_session_with_rpcs_in_flight_is_closed_after_nc_timeout(self):
+        connection = self.connections[0]
+        old, new = connection._ncc_connection, connection._connect.return_value
+        connection.inflight = 1
+
+        with mock.patch.object(pool_connection.eventlet, 'spawn_after') as spawn_after:
+            connection.reconnect()
+
+        self.assertIs(new, connection._ncc_connection)
+        old.close_session.assert_not_called()
+        spawn_after.assert_called_once_with(30, connection._close_session, old)
+
+        connection.inflight = 0
+        connection.reconnect()
+        new.close_session.assert_called_once_with()
+
+    def test_failed_connect_keeps_old_session(self):
+        self._age(*self.connections)
+        connection = self.connections[0]
+        old = connection._ncc_connection
+        connection._connect.side_effect = socket.error('connection refused')
+        self.pool.devices[self.context.host].take(connection)
+        self.pool._rotating.add(self.context.host)
+
+        self.pool._replace_connection(self.context, connection, True)
+
+        self.assertIs(old, connection._ncc_connection)
+        old.close_session.assert_not_called()
+        self.assertIn(connection, self.pool.devices[self.context.host].idle)
+        self.assertEqual(set(), self.pool._rotating)
+
+    def test_only_idle_connected_unlocked_sessions_are_shared(self):
+        queue = self.pool.devices[self.context.host]
+        self.connections[0].inflight = 0
+        self.connections[1].inflight = 1
+        self.connections[2].inflight = 2
+
+        # checked out, holding the lock of a candidate transaction, not connected
+        checked_out = queue.acquire(priority=1)
+        self.assertIs(self.connections[0], checked_out)
+        self.assertIs(self.connections[1], self.pool.shared_connection(self.context))
+
+        self.connections[1].lock.acquire()
+        self.assertIs(self.connections[2], self.pool.shared_connection(self.context))
+
+        self.connections[2]._ncc_connection = None
+        self.assertIsNone(self.pool.shared_connection(self.context))
+
+    def test_prewarm_connects_all_slots(self):
+        for connection in self.connections:
+            connection._ncc_connection = None
+
+        self.pool._prewarm()
+
+        for connection in self.connections:
+            self.assertIs(connection._connect.return_value, connection._ncc_connection)
+
+
+class PipelinedRpcTest(base.BaseTestCase):
+    def setUp(self):
+        super(PipelinedRpcTest, self).setUp()
+        config.register_common_opts()
+        self.context = mock.Mock(host='pipelining-test', alive=True)
+        self.yang = YangConnection(self.context, max_inflight_rpcs=2)
+        self.yang._ncc_connection = mock.Mock(timeout=1)
+        FakeOperation.sent = []
+        operations = mock.patch.dict('ncclient.manager.OPERATIONS', {'get': FakeOperation})
+        operations.start()
+        self.addCleanup(operations.stop)
+
+    def test_submit_returns_future_of_the_reply(self):
+        future = self.yang.submit('get', filter=('subtree', '<native/>'), entity='VrfDefinition', action='get')
+
+        self.assertEqual(1, self.yang.inflight)
+        self.assertFalse(future.done())
+        self.assertEqual({'filter': ('subtree', '<native/>')}, FakeOperation.sent[0].kwargs)
+
+        FakeOperation.sent[0].answer()
+        self.assertIs(FakeOperation.sent[0].reply, future.result())
+        self.assertEqual(0, self.yang.inflight)
+
+    def test_failed_reply_releases_its_slot(self):
+        future = self.yang.submit('get', filter=('subtree', '<native/>'))
+        FakeOperation.sent[0].error = rpc_error()
+        FakeOperation.sent[0].answer()
+
+        self.assertRaises(RPCError, future.result)
+        self.assertEqual(0, self.yang.inflight)
+
+    def test_inflight_rpcs_are_limited_per_session(self):
+        futures = [self.yang.submit('get', filter=('subtree', '<native/>')) for _ in range(2)]
+        third = eventlet.spawn(self.yang.submit, 'get', filter=('subtree', '<native/>'))
+        eventlet.sleep(0.01)
+        self.assertEqual(2, len(FakeOperation.sent))
+
+        FakeOperation.sent[0].answer()
+        futures[0].result()
+        third.wait()
+        self.assertEqual(3, len(FakeOperation.sent))
+        self.assertEqual(2, self.yang.inflight)
+
+    def test_unreachable_device_does_not_take_a_slot(self):
+        self.context.alive = False
+
+        self.assertRaises(DeviceUnreachable, self.yang.submit, 'get', filter=('subtree', '<native/>'))
+        self.assertEqual(0, self.yang.inflight)
+
+    def test_shared_connection_waits_for_pipelined_reply(self):
+        shared = SharedConnection(self.yang)
+        reply = eventlet.spawn(shared.get, filter='<native/>', entity='VrfDefinition', action='get')
+        eventlet.sleep(0)
+        self.assertEqual({'filter': ('subtree', '<native/>')}, FakeOperation.sent[0].kwargs)
+        self.assertFalse(reply.dead)
+
+        FakeOperation.sent[0].answer()
+        self.assertIs(FakeOperation.sent[0].reply, reply.wait())
+        self.assertEqual(self.context, shared.context)
+
+
+class CandidateTransactionTest(base.BaseTestCase):
+    def setUp(self):
+        super(CandidateTransactionTest, self).setUp()
+        config.register_common_opts()
+        cfg.CONF.set_override('confirmed_commit_timeout', 30, 'asr1k')
+        self.context = mock.Mock(host='candidate-test', alive=True, has_confirmed_commit=False)
+        self.yang = YangConnection(self.context)
+        self.manager = mock.Mock()
+        self.yang._ncc_connection = self.manager
+        self.edits = [('<a/>', 'VrfDefinition', 'update'), ('<b/>', 'StaticNat', 'create')]
+
+    def _calls(self):
+        return [name for name, args, kwargs in self.manager.mock_calls
+                if name in ('lock', 'edit_config', 'validate', 'commit', 'cancel_commit', 'discard_changes',
+                            'unlock')]
+
+    def test_edits_are_validated_and_committed_under_lock(self):
+        self.manager.edit_config.side_effect = ['reply-a', 'reply-b']
+
+        self.assertEqual(['reply-a', 'reply-b'], self.yang.commit_candidate(self.edits))
+        self.assertEqual(['lock', 'edit_config', 'edit_config', 'validate', 'commit', 'unlock'], self._calls())
+        self.manager.validate.assert_called_once_with(source='candidate')
+        self.manager.commit.assert_called_once_with()
+
+    def test_rejected_edit_discards_candidate_and_unlocks(self):
+        error = rpc_error()
+        self.manager.edit_config.side_effect = ['reply-a', error]
+
+        e = self.assertRaises(CandidateEditFailed, self.yang.commit_candidate, self.edits)
+        self.assertEqual(1, e.index)
+        self.assertIs(error, e.error)
+        self.assertEqual(['lock', 'edit_config', 'edit_config', 'discard_changes', 'unlock'], self._calls())
+
+    def test_confirmed_commit_is_confirmed_after_checking_running(self):
+        self.context.has_confirmed_commit = True
+
+        self.yang.commit_candidate(self.edits)
+        self.assertEqual(['lock', 'edit_config', 'edit_config', 'validate', 'commit', 'validate', 'commit',
+                          'unlock'], self._calls())
+        self.assertEqual([mock.call(source='candidate'), mock.call(source='running')],
+                         self.manager.validate.call_args_list)
+        self.assertEqual([mock.call(confirmed=True, timeout='30'), mock.call()], self.manager.commit.call_args_list)
+
+    def test_failed_check_cancels_confirmed_commit(self):
+        self.context.has_confirmed_commit = True
+        self.manager.validate.side_effect = [None, rpc_error()]
+
+        self.assertRaises(RPCError, self.yang.commit_candidate, self.edits)
+        self.assertEqual(['lock', 'edit_config', 'edit_config', 'validate', 'commit', 'validate', 'cancel_commit',
+                          'discard_changes', 'unlock'], self._calls())
+        self.manager.commit.assert_called_once_with(confirmed=True, timeout='30')
@@ -0,0 +1,105 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.common import config
+from asr1k_neutron_l3.models import device_guard
+
+
+class CircuitBreakerTest(base.BaseTestCase):
+    def test_opens_after_threshold_and_closes_after_trial(self):
+        breaker = device_guard.CircuitBreaker('host', failure_threshold=2, open_time=0)
+
+        breaker.record_failure()
+        self.assertEqual(device_guard.CLOSED, breaker.state)
+        breaker.record_failure()
+        self.assertEqual(device_guard.OPEN, breaker.state)
+
+        # open time is over, exactly one trial request passes
+        self.assertTrue(breaker.allow())
+        self.assertEqual(device_guard.HALF_OPEN, breaker.state)
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success(trial=True)
+        self.assertEqual(device_guard.CLOSED, breaker.state)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = device_guard.CircuitBreaker('host', failure_threshold=1, open_time=30)
+        breaker.record_failure()
+
+        self.assertFalse(breaker.wait(0.01))
+        breaker.opened -= 30
+        self.assertTrue(breaker.wait(0.01))
+
+        breaker.record_failure(trial=True)
+        self.assertEqual(device_guard.OPEN, breaker.state)
+
+    def test_only_the_trial_outcome_closes_the_breaker(self):
+        breaker = device_guard.CircuitBreaker('host', failure_threshold=1, open_time=30)
+        breaker.record_failure()
+
+        # replies of requests sent before the breaker opened
+        breaker.record_success()
+        self.assertEqual(device_guard.OPEN, breaker.state)
+
+        breaker.opened -= 30
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(device_guard.HALF_OPEN, breaker.state)
+
+        breaker.record_success(trial=True)
+        self.assertEqual(device_guard.CLOSED, breaker.state)
+
+
+class DeviceGuardTest(base.BaseTestCase):
+    def test_trial_flag_of_enter_reaches_observe(self):
+        config.register_common_opts()
+        guard = object.__new__(device_guard.DeviceGuard)
+        guard.breakers = {'host': device_guard.CircuitBreaker('host', failure_threshold=1, open_time=0)}
+        guard.limiters = {'host': device_guard.ConcurrencyLimiter('host', max_limit=0, target_latency=1.0)}
+        guard.breakers['host'].record_failure()
+
+        trial = guard.enter(mock.Mock(host='host'))
+        self.assertTrue(trial)
+
+        guard.observe('host', trial=False)
+        self.assertEqual(device_guard.HALF_OPEN, guard.breakers['host'].state)
+        guard.observe('host', trial=trial)
+        self.assertEqual(device_guard.CLOSED, guard.breakers['host'].state)
+
+
+class ConcurrencyLimiterTest(base.BaseTestCase):
+    def test_limit_is_halved_on_overload_and_grows_back(self):
+        limiter = device_guard.ConcurrencyLimiter('host', max_limit=8, target_latency=1.0)
+
+        limiter.record(overload=True)
+        self.assertEqual(4, int(limiter.limit))
+
+        # additive increase, about one per limit worth of fast replies
+        for _ in range(5):
+            limiter.record(latency=0.1)
+        self.assertEqual(5, int(limiter.limit))
+
+    def test_acquire_respects_limit(self):
+        limiter = device_guard.ConcurrencyLimiter('host', max_limit=1, target_latency=1.0)
+
+        self.assertTrue(limiter.acquire(0.01))
+        self.assertFalse(limiter.acquire(0.01))
+        limiter.release()
+        self.assertTrue(limiter.acquire(0.01))
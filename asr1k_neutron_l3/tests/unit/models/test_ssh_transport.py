@@ -0,0 +1,99 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+from ncclient.transport.errors import SSHError
+import paramiko
+
+from neutron.tests import base
+
+from asr1k_neutron_l3.models import ssh_transport
+from asr1k_neutron_l3.models.ssh_transport import ChannelSSHSession
+from asr1k_neutron_l3.models.ssh_transport import SharedSSHTransport
+
+
+def fake_transport():
+    transport = mock.Mock(spec=paramiko.Transport)
+    transport.is_active.return_value = True
+    return transport
+
+
+class SharedSSHTransportTest(base.BaseTestCase):
+    def setUp(self):
+        super(SharedSSHTransportTest, self).setUp()
+        self.transports = []
+
+        def connect(session, **kwargs):
+            # the full SSH handshake of SSHSession.connect, on a mocked paramiko transport
+            session._transport = fake_transport()
+            session._connected = True
+            self.transports.append(session._transport)
+
+        for patch in (mock.patch.object(ChannelSSHSession, 'connect', autospec=True, side_effect=connect),
+                      mock.patch.object(ChannelSSHSession, '_post_connect'),
+                      mock.patch.object(ssh_transport.manager, 'Manager', side_effect=lambda session, _: session)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        context = mock.Mock(host='transport-test', yang_port=830, username='user', password='secret',
+                            nc_timeout=5)
+        self.shared = SharedSSHTransport(context)
+
+    def test_second_session_only_opens_a_channel(self):
+        first = self.shared.connect()
+        second = self.shared.connect()
+
+        self.assertEqual(1, len(self.transports))
+        self.assertIs(self.transports[0], first.transport)
+        self.assertIs(self.transports[0], second.transport)
+        self.transports[0].open_session.assert_called_once_with(timeout=5)
+        second._channel.invoke_subsystem.assert_called_once_with(ssh_transport.NETCONF_SUBSYSTEM)
+
+    def test_transport_is_closed_with_its_last_session(self):
+        first = self.shared.connect()
+        second = self.shared.connect()
+        transport = self.transports[0]
+
+        first.close()
+        transport.close.assert_not_called()
+        self.assertTrue(self.shared.is_active)
+
+        second.close()
+        transport.close.assert_called_once_with()
+        self.assertFalse(self.shared.is_active)
+
+    def test_failed_channel_is_not_tracked(self):
+        first = self.shared.connect()
+        transport = self.transports[0]
+        transport.open_session.side_effect = paramiko.SSHException('administratively prohibited')
+
+        self.assertRaises(SSHError, self.shared.connect)
+        self.assertEqual({first}, self.shared._sessions)
+
+        # the failed session is gone, closing the last tracked one closes the transport
+        first.close()
+        transport.close.assert_called_once_with()
+
+    def test_session_of_dead_transport_leaves_current_transport_open(self):
+        old = self.shared.connect()
+        self.transports[0].is_active.return_value = False
+
+        new = self.shared.connect()
+        self.assertEqual(2, len(self.transports))
+        self.assertIs(self.transports[1], new.transport)
+
+        old.close()
+        self.transports[1].close.assert_not_called()
+        self.assertEqual({new}, self.shared._sessions)
+        self.assertTrue(self.shared.is_active)
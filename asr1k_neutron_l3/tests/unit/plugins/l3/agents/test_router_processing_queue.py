@@ -0,0 +1,128 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+
+import mock
+
+from neutron.agent.common.resource_processing_queue import ResourceUpdate
+from neutron.agent.l3 import agent as l3_agent
+from neutron.tests import base
+
+from asr1k_neutron_l3.plugins.l3.agents import router_processing_queue
+from asr1k_neutron_l3.plugins.l3.agents.router_processing_queue import RouterProcessingQueue
+
+T0 = datetime.datetime(2024, 1, 1)
+
+
+def update(router_id, priority, seconds, **kwargs):
+    return ResourceUpdate(router_id, priority, timestamp=T0 + datetime.timedelta(seconds=seconds), **kwargs)
+
+
+class RouterProcessingQueueTest(base.BaseTestCase):
+    def setUp(self):
+        super(RouterProcessingQueueTest, self).setUp()
+        self.queue = RouterProcessingQueue()
+
+    def _drain(self):
+        updates = []
+        while self.queue.get_size():
+            updates.append(self.queue._get())
+        return updates
+
+    def test_updates_of_a_router_are_coalesced(self):
+        sync = update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 1, resource={'id': 'r1'})
+        self.queue.add(sync)
+        self.queue.add(update('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 2))
+        for seconds in range(3, 10):
+            self.queue.add(update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, seconds))
+        self.assertEqual(2, self.queue.get_size())
+
+        # a stale sync entry is dropped, the newer pending update stays
+        self.queue.add(update('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 0, resource={'id': 'r2'}))
+
+        updates = self._drain()
+        self.assertEqual(['r1', 'r2'], [u.id for u in updates])
+        self.assertEqual(T0 + datetime.timedelta(seconds=9), updates[0].timestamp)
+        self.assertIsNone(updates[0].resource)
+        self.assertIsNone(updates[1].resource)
+
+    def test_rpc_update_raises_priority_of_pending_sync(self):
+        self.queue.add(update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 1))
+        self.queue.add(update('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 2))
+        self.queue.add(update('r2', l3_agent.PRIORITY_RPC, 3, action=l3_agent.DELETE_ROUTER))
+        self.queue.add(update('r1', l3_agent.PRIORITY_RPC, 0))
+
+        updates = self._drain()
+        self.assertEqual(['r1', 'r2'], [u.id for u in updates])
+        self.assertEqual([l3_agent.PRIORITY_RPC] * 2, [u.priority for u in updates])
+        # r1 keeps its newer sync update with the priority of the older rpc one
+        self.assertEqual(T0 + datetime.timedelta(seconds=1), updates[0].timestamp)
+        self.assertEqual(l3_agent.DELETE_ROUTER, updates[1].action)
+        self.assertEqual(0, self.queue.get_size())
+
+    def test_merged_update_moves_to_the_lane_of_the_newer_one(self):
+        self.queue.add(update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 1))
+        self.queue.add(update('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 2))
+        self.queue.add(update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 3, resource={'id': 'r1', 'project_id': 'p1'}),
+                       lane=router_processing_queue.LANE_REQUEUE)
+        self.queue.add(update('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 4, action=l3_agent.DELETE_ROUTER))
+        # a stale update does not move the pending one back
+        self.queue.add(update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 0))
+
+        self.assertEqual({'rpc': 0, 'requeue': 1, 'sync': 0, 'cleanup': 1}, self.queue.get_lane_sizes())
+        entry = self.queue._pending['r1']
+        self.assertEqual((T0 + datetime.timedelta(seconds=1), 'p1'), (entry.queued_at, entry.project))
+
+        updates = self._drain()
+        self.assertEqual(['r1', 'r2'], [u.id for u in updates])
+        self.assertEqual(l3_agent.DELETE_ROUTER, updates[1].action)
+        self.assertEqual({'rpc': 0, 'requeue': 0, 'sync': 0, 'cleanup': 0}, self.queue.get_lane_sizes())
+
+    def test_lanes_take_turns_by_weight_and_projects_within_a_lane(self):
+        self.queue = RouterProcessingQueue(lane_weights={'rpc': 2, 'sync': 1})
+        for i in range(4):
+            self.queue.add(update('sync-{}'.format(i), l3_agent.PRIORITY_SYNC_ROUTERS_TASK, i,
+                                  resource={'id': 'sync-{}'.format(i), 'project_id': 'p1'}))
+        for i in range(4):
+            self.queue.add(update('big-{}'.format(i), l3_agent.PRIORITY_RPC, i,
+                                  resource={'id': 'big-{}'.format(i), 'project_id': 'big'}))
+        self.queue.add(update('small', l3_agent.PRIORITY_RPC, 9, resource={'id': 'small', 'project_id': 'small'}))
+        self.assertEqual({'rpc': 5, 'requeue': 0, 'sync': 4, 'cleanup': 0}, self.queue.get_lane_sizes())
+
+        updates = self._drain()
+        # rpc gets two turns for each one of sync, the small project does not wait behind the big one
+        self.assertEqual(['big-0', 'sync-0', 'small', 'big-1', 'sync-1', 'big-2', 'big-3', 'sync-2', 'sync-3'],
+                         [u.id for u in updates])
+
+    def test_requeued_router_keeps_its_project_and_aged_lane_goes_first(self):
+        self.queue.add(update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 0,
+                              resource={'id': 'r1', 'tenant_id': 'p1'}))
+        self.assertEqual([('r1', 'p1')], [(u.id, u.resource['tenant_id']) for u in self._drain()])
+
+        with mock.patch.object(router_processing_queue.time, 'time', return_value=1000):
+            self.queue.add(update('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 1),
+                           lane=router_processing_queue.LANE_REQUEUE)
+        with mock.patch.object(router_processing_queue.time, 'time', return_value=1200):
+            self.queue.add(update('r2', l3_agent.PRIORITY_RPC, 2))
+            self.queue.add(update('r3', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 3, action=l3_agent.DELETE_ROUTER))
+        self.assertEqual('p1', self.queue._pending['r1'].project)
+        self.assertEqual({'rpc': 1, 'requeue': 1, 'sync': 0, 'cleanup': 1}, self.queue.get_lane_sizes())
+
+        with mock.patch.object(router_processing_queue.time, 'time', return_value=1400):
+            self.assertEqual(['r1', 'r2', 'r3'], [u.id for u in self._drain()])
+        self.queue.add(update('r4', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 4, action=l3_agent.DELETE_ROUTER))
+        with mock.patch.object(router_processing_queue.time, 'time', return_value=1400):
+            self.queue.add(update('r5', l3_agent.PRIORITY_RPC, 5))
+        self.assertEqual(['r5', 'r4'], [u.id for u in self._drain()])
@@ -0,0 +1,68 @@
+# Copyright 2024 SAP SE
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import eventlet
+from eventlet import event
+import mock
+from neutron.agent.common.resource_processing_queue import ResourceUpdate
+from neutron.agent.l3 import agent as l3_agent
+from neutron.tests import base
+
+from asr1k_neutron_l3.plugins.l3.agents import router_workers
+from asr1k_neutron_l3.plugins.l3.agents.router_processing_queue import RouterProcessingQueue
+
+
+class RouterWorkersTest(base.BaseTestCase):
+    def setUp(self):
+        super(RouterWorkersTest, self).setUp()
+        self.queue = RouterProcessingQueue()
+        self.processed = []
+        self.slow = event.Event()
+        self.saturated = False
+        mock.patch.object(router_workers, 'BACKOFF_INTERVAL', 0.01).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _process(self):
+        for rp, update in self.queue.each_update_to_next_router():
+            if update.id == 'slow':
+                self.slow.wait()
+            self.processed.append(update.id)
+
+    def test_workers_drain_on_stop(self):
+        workers = router_workers.RouterWorkers(self.queue, self._process, 2)
+        workers.start()
+        for router_id in ['a', 'slow', 'b']:
+            self.queue.add(ResourceUpdate(router_id, l3_agent.PRIORITY_RPC))
+
+        eventlet.sleep(0.05)
+        self.assertEqual(['a', 'b'], self.processed)
+
+        eventlet.spawn_after(0.05, self.slow.send)
+        self.assertTrue(workers.stop(timeout=5))
+        self.assertEqual(['a', 'b', 'slow'], self.processed)
+        self.assertEqual(0, workers._pool.running())
+
+    def test_workers_wait_while_connection_pool_is_saturated(self):
+        self.saturated = True
+        workers = router_workers.RouterWorkers(self.queue, self._process, 1, saturated=lambda: self.saturated)
+        workers.start()
+        self.queue.add(ResourceUpdate('a', l3_agent.PRIORITY_RPC))
+
+        eventlet.sleep(0.05)
+        self.assertEqual([], self.processed)
+
+        self.saturated = False
+        eventlet.sleep(0.05)
+        self.assertEqual(['a'], self.processed)
+        self.assertTrue(workers.stop(timeout=5))